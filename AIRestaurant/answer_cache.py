@@ -0,0 +1,157 @@
+"""
+Persistent cache for AI chat answers, keyed on normalized questions.
+
+Questions are normalized with the same tokenizer as the FAQ search, so
+"How do I order?" and "how do i ORDER" share one cached answer. Entries
+expire after a TTL and the least recently used ones are evicted once
+the cache grows past its size limit.
+
+Hit, miss and eviction counts are gathered in memory and written to the
+stats row in batches, so lookups do not write to it.
+"""
+import hashlib
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .faq import tokenize
+from .models import CachedAnswer, AnswerCacheStats
+
+
+def cache_settings():
+    conf = {'ENABLED': True, 'TTL': 7 * 24 * 3600, 'MAX_ENTRIES': 5000}
+    conf.update(getattr(settings, 'AI_ANSWER_CACHE', {}) or {})
+    return conf
+
+
+def cache_key(question):
+    """Hash of the question's sorted, de-duplicated words (None if empty)."""
+    words = sorted(tokenize(question or ''))
+    if not words:
+        return None
+    return hashlib.sha1(' '.join(words).encode('utf-8')).hexdigest()
+
+
+# Counted events between writes to the stats row
+FLUSH_EVERY = 100
+# Stores between sweeps for expired entries
+EVICT_EVERY = 100
+
+_lock = threading.Lock()
+_pending = Counter()
+_stores = 0
+
+
+def _count(**deltas):
+    with _lock:
+        _pending.update(deltas)
+        due = sum(_pending.values()) >= FLUSH_EVERY
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Add the counts gathered by this process to the stats row."""
+    with _lock:
+        deltas = {name: delta for name, delta in _pending.items() if delta}
+        _pending.clear()
+    if not deltas:
+        return
+    AnswerCacheStats.objects.get_or_create(pk=1)
+    AnswerCacheStats.objects.filter(pk=1).update(
+        **{name: F(name) + delta for name, delta in deltas.items()}
+    )
+
+
+def lookup(question):
+    """Return the cached answer for `question`, or None on a miss."""
+    conf = cache_settings()
+    key = cache_key(question)
+    if not conf['ENABLED'] or key is None:
+        return None
+
+    now = timezone.now()
+    entry = (
+        CachedAnswer.objects
+        .filter(key=key, created_at__gte=now - timedelta(seconds=conf['TTL']))
+        .only('id', 'answer')
+        .first()
+    )
+    if entry is None:
+        _count(misses=1)
+        return None
+
+    CachedAnswer.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=now)
+    _count(hits=1)
+    return entry.answer
+
+
+def store(question, answer):
+    """Cache a freshly generated answer.
+
+    Evicts once the cache is over its size limit, and sweeps expired
+    entries every EVICT_EVERY stores.
+    """
+    global _stores
+    conf = cache_settings()
+    key = cache_key(question)
+    if not conf['ENABLED'] or key is None or not answer:
+        return
+
+    now = timezone.now()
+    CachedAnswer.objects.update_or_create(
+        key=key,
+        defaults={
+            'question': question,
+            'answer': answer,
+            'created_at': now,
+            'last_used_at': now,
+            'hits': 0,
+        },
+    )
+    with _lock:
+        _stores += 1
+        sweep = _stores % EVICT_EVERY == 0
+    if sweep or CachedAnswer.objects.count() > conf['MAX_ENTRIES']:
+        evict()
+
+
+def evict():
+    """Drop expired entries, then the least recently used overflow."""
+    conf = cache_settings()
+    cutoff = timezone.now() - timedelta(seconds=conf['TTL'])
+    removed, _ = CachedAnswer.objects.filter(created_at__lt=cutoff).delete()
+
+    overflow = list(
+        CachedAnswer.objects
+        .order_by('-last_used_at')
+        .values_list('id', flat=True)[conf['MAX_ENTRIES']:]
+    )
+    if overflow:
+        more, _ = CachedAnswer.objects.filter(id__in=overflow).delete()
+        removed += more
+    if removed:
+        _count(evictions=removed)
+
+
+def stats():
+    """Counters shown on the manager dashboard.
+
+    Counts from other processes show up once they have been flushed.
+    """
+    flush_stats()
+    row = AnswerCacheStats.objects.filter(pk=1).first()
+    hits = row.hits if row else 0
+    misses = row.misses if row else 0
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'evictions': row.evictions if row else 0,
+        'entries': CachedAnswer.objects.count(),
+        'hit_rate': round(100.0 * hits / lookups, 1) if lookups else None,
+    }
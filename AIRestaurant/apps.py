@@ -7,4 +7,6 @@ class AIRestaurantConfig(AppConfig):
     label = 'air'
 
     def ready(self):
-        pass
\ No newline at end of file
+        # The AI chat model is preloaded by the server entrypoints
+        # (asgi.py/wsgi.py), not here: every management command runs ready()
+        from . import signals  # noqa: F401  (connects the receivers)
@@ -2,6 +2,8 @@
 ASGI config for AIRestaurant project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections for live thread updates
+go to ``AIRestaurant.realtime``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "AIRestaurant.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up since it touches the models
+from AIRestaurant import llm  # noqa: E402
+from AIRestaurant.realtime import websocket_application  # noqa: E402
+
+llm.preload()
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,137 @@
+"""
+Storage for the customer's shopping cart (dish id -> quantity).
+
+CartMiddleware attaches `request.cart`, built from the backend named by
+the CART_BACKEND setting:
+
+- SessionCart keeps the cart in the session, as before. A write only
+  happens when the contents actually change.
+- SignedCookieCart keeps it in a signed cookie, so browsing the menu and
+  editing the cart never touch the session store. The cookie names the
+  user it belongs to and is ignored for anyone else.
+
+Views use `get()`, `set()` and `clear()`; the middleware writes pending
+changes to the response.
+"""
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'AIRestaurant.cart.SessionCart'
+
+
+def normalize(cart):
+    """Keep positive integer quantities, keyed by dish id as a string.
+
+    Entries whose key is not a positive integer (a tampered or stale
+    cart) are dropped, so views can turn every key into a dish id.
+    """
+    normalized = {}
+    for dish_id, qty in (cart or {}).items():
+        try:
+            dish_id, qty = int(dish_id), int(qty)
+        except (TypeError, ValueError):
+            continue
+        if dish_id > 0 and qty > 0:
+            normalized[str(dish_id)] = qty
+    return normalized
+
+
+class SessionCart:
+    """Cart stored under the session's "cart" key."""
+
+    key = 'cart'
+
+    def __init__(self, request):
+        self.request = request
+
+    def get(self):
+        return normalize(self.request.session.get(self.key))
+
+    def set(self, cart):
+        cart = normalize(cart)
+        if cart != self.get():
+            self.request.session[self.key] = cart
+
+    def clear(self):
+        self.set({})
+
+    def apply(self, response):
+        pass
+
+
+class SignedCookieCart:
+    """Cart stored client-side in a signed cookie; no server-side writes."""
+
+    cookie_name = 'cart'
+    salt = 'AIRestaurant.cart'
+    max_age = 60 * 60 * 24 * 14
+
+    def __init__(self, request):
+        self.request = request
+        self._cart = None
+        self._dirty = False
+
+    def _owner(self):
+        user = getattr(self.request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def get(self):
+        if self._cart is None:
+            self._cart = {}
+            value = self.request.get_signed_cookie(
+                self.cookie_name, default=None, salt=self.salt, max_age=self.max_age,
+            )
+            if value:
+                try:
+                    data = json.loads(value)
+                except ValueError:
+                    data = None
+                if isinstance(data, dict) and data.get('user') == self._owner():
+                    self._cart = normalize(data.get('items'))
+        return dict(self._cart)
+
+    def set(self, cart):
+        cart = normalize(cart)
+        if cart != self.get():
+            self._cart = cart
+            self._dirty = True
+
+    def clear(self):
+        self.set({})
+
+    def apply(self, response):
+        if not self._dirty:
+            return
+        if self._cart:
+            value = json.dumps({'user': self._owner(), 'items': self._cart}, separators=(',', ':'))
+            response.set_signed_cookie(
+                self.cookie_name, value, salt=self.salt, max_age=self.max_age,
+                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+            )
+        else:
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+        self._dirty = False
+
+
+def get_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', None) or DEFAULT_BACKEND)
+
+
+class CartMiddleware:
+    """Attach `request.cart` and save its changes on the way out.
+
+    Must come after AuthenticationMiddleware (carts belong to a user).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.backend = get_backend()
+
+    def __call__(self, request):
+        request.cart = self.backend(request)
+        response = self.get_response(request)
+        request.cart.apply(response)
+        return response
@@ -0,0 +1,79 @@
+"""
+Cached product catalog for the menu and merch pages.
+
+Each (product type, VIP visibility) combination is built once with its
+creator, then served from the Django cache until a product or rating
+changes (see signals.py). Rating stats come from the products' running
+totals, so a menu render runs no aggregate queries.
+
+Invalidation has to reach every process, so MENU_CATALOG["CACHE"] must
+be a shared cache (database, Redis, Memcached). A process-local LocMem
+cache is skipped, building the catalog per request, unless
+MENU_CATALOG["LOCAL"] says there is only one process.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .data.chef import Product
+
+PRODUCT_TYPES = ('food', 'merch')
+# What the product list shows; anything else (the creator's password
+# hash, email, balance...) must stay out of the shared cache
+CATALOG_FIELDS = (
+    'name', 'img', 'price', 'type', 'vip_exclusive', 'rating_sum', 'rating_count',
+    'creator__login__username',
+)
+
+
+def catalog_settings():
+    conf = {'CACHE': 'default', 'TIMEOUT': 300, 'LOCAL': False}
+    conf.update(getattr(settings, 'MENU_CATALOG', {}) or {})
+    return conf
+
+
+def _cache():
+    """The catalog cache, or None if it would only reach this process."""
+    conf = catalog_settings()
+    cache = caches[conf['CACHE']]
+    if isinstance(cache, LocMemCache) and not conf['LOCAL']:
+        return None
+    return cache
+
+
+def _key(product_type, vip):
+    return f'menu-catalog:{product_type}:{"vip" if vip else "public"}'
+
+
+def build_products(product_type, vip):
+    """Query the products of `product_type` visible to VIPs or everyone."""
+    qs = Product.objects.filter(type=product_type)
+    if not vip:
+        qs = qs.filter(vip_exclusive=False)
+    return list(qs.select_related('creator__login').only(*CATALOG_FIELDS).order_by('id'))
+
+
+def get_products(product_type, vip=False):
+    """Catalog rows for `product_type`, each with `avg_rating` and `rating_count`.
+
+    Returned instances are fresh copies from the cache, so callers may
+    attach per-request attributes to them.
+    """
+    cache = _cache()
+    if cache is None:
+        return build_products(product_type, vip)
+    key = _key(product_type, vip)
+    products = cache.get(key)
+    if products is None:
+        products = build_products(product_type, vip)
+        cache.set(key, products, catalog_settings()['TIMEOUT'])
+    return products
+
+
+def invalidate(product_type=None):
+    """Drop cached catalogs for `product_type` (all types if None)."""
+    cache = _cache()
+    if cache is None:
+        return
+    types = PRODUCT_TYPES if product_type is None else (product_type,)
+    cache.delete_many([_key(t, vip) for t in types for vip in (False, True)])
@@ -20,6 +20,32 @@ class Product(Model):
     )
     # Creator is typically a Chef for food items; merch can be anonymous
     creator = ForeignKey(Chef, CASCADE, null=True, blank=True)
+    # Only shown to (and orderable by) VIP customers
+    vip_exclusive = BooleanField(default=False)
+    # Running totals of ProductRating rows, kept current by signals
+    rating_sum = IntegerField(default=0)
+    rating_count = IntegerField(default=0)
+
+    class Meta:
+        # Menu and merch catalogs (catalog.build_products)
+        indexes = [Index(fields=['type', 'vip_exclusive'], name='product_type_vip_idx')]
+
+    def save(self, *args, **kwargs):
+        # Rating totals change through F() updates; never write back a
+        # possibly stale in-memory copy when saving other edits.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('rating_sum', 'rating_count')
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def avg_rating(self):
+        """Average rating from the running totals, or None if unrated."""
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
 
 
 class ProductRating(Model):
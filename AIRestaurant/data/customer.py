@@ -10,6 +10,21 @@ class Customer(Model):
     warnings    = PositiveIntegerField(default=0)
     balance     = PositiveIntegerField(default=0)  # in cents
     vip         = BooleanField(default=False)
+    # Lifetime purchase counters, updated with each order (see `order`)
+    order_count          = PositiveIntegerField(default=0)
+    lifetime_spend_cents = PositiveIntegerField(default=0)  # line-item totals
+
+    # Maintained with F() updates in `order` and `deposit`; a save must
+    # not write back a possibly stale in-memory copy
+    F_FIELDS = ('balance', 'order_count', 'lifetime_spend_cents')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.F_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def complain_about(self, person: Union['Customer', Employee], message: str):
         # TODO: create a Complaint object and save it
@@ -28,7 +43,14 @@ class Customer(Model):
             self.warnings = 0
             self.vip = False
 
-        self.save()
+        self.save(update_fields=['warnings', 'vip'])
+
+    def deposit(self, amount_cents: int):
+        """Add `amount_cents` to the balance, safe against concurrent orders."""
+        if amount_cents <= 0:
+            raise ValueError("Amount must be positive.")
+        Customer.objects.filter(pk=self.pk).update(balance=F('balance') + amount_cents)
+        self.refresh_from_db(fields=['balance'])
 
     
     def order(self, dishes, order_type: str = "food"):
@@ -39,16 +61,21 @@ class Customer(Model):
 
         Expects a list of *unsaved* `OrderedDish` instances with `product`
         and `quantity` set. This method will:
-          - compute the total cost in cents,
-          - ensure the customer has sufficient balance,
-          - create an `Order` row with the appropriate type,
-          - attach and save each `OrderedDish` to that order,
-          - deduct the total from this customer's balance.
+          - snapshot each line's unit price and compute the totals in cents,
+          - in one transaction, deduct the total from this customer's
+            balance with a conditional UPDATE (balance >= total) that also
+            bumps the lifetime order counters, then create the `Order` and
+            bulk-insert its `OrderedDish` lines.
+
+        The conditional UPDATE makes concurrent checkouts safe: only as
+        many orders as the balance covers can succeed, the rest raise
+        ValueError and leave nothing behind.
 
         Returns the created `Order` instance.
         Raises ValueError if balance is insufficient or the order is invalid.
         """
-        from .deliverer import Order  # local import to avoid cycles
+        from django.db import transaction
+        from .deliverer import Order, OrderedDish  # local import to avoid cycles
         from .message import Complaint
 
         if order_type not in ("food", "merch"):
@@ -57,20 +84,21 @@ class Customer(Model):
         if not dishes:
             raise ValueError("No items provided for order.")
 
-        total_cost = 0
-        for od in dishes:
-            if getattr(od, "product", None) is None or od.quantity is None:
-                continue
-            if od.quantity <= 0:
-                continue
-            total_cost += od.total_cost()
+        lines = [
+            od for od in dishes
+            if getattr(od, "product", None) is not None and od.quantity is not None and od.quantity > 0
+        ]
+        for od in lines:
+            od.unit_price_cents = od.product.price
+        subtotal = sum(od.total_cost() for od in lines)
 
         # Apply VIP discount: 5% off the order total for VIP customers.
         # This affects how much is charged, but not the underlying
         # line-item prices stored on the order.
-        if self.vip and total_cost > 0:
-            discount = (total_cost * 5) // 100
-            total_cost -= discount
+        discount = 0
+        if self.vip and subtotal > 0:
+            discount = (subtotal * 5) // 100
+        total_cost = subtotal - discount
 
         if total_cost <= 0:
             raise ValueError("Order total must be positive.")
@@ -78,17 +106,29 @@ class Customer(Model):
         if self.balance < total_cost:
             raise ValueError("Insufficient balance for this order.")
 
-        # Create the order and attach line items
-        order = Order.objects.create(customer=self, order_type=order_type)
-        for od in dishes:
-            if getattr(od, "product", None) is None or od.quantity is None or od.quantity <= 0:
-                continue
-            od.from_order_num = order
-            od.save()
-
-        # Charge the customer
-        self.balance -= total_cost
-        self.save()
+        with transaction.atomic():
+            # Charge the customer and count the purchase, unless a
+            # concurrent checkout already spent the balance
+            charged = Customer.objects.filter(pk=self.pk, balance__gte=total_cost).update(
+                balance=F('balance') - total_cost,
+                order_count=F('order_count') + 1,
+                lifetime_spend_cents=F('lifetime_spend_cents') + subtotal,
+            )
+            if not charged:
+                raise ValueError("Insufficient balance for this order.")
+
+            # Create the order and attach line items
+            order = Order.objects.create(
+                customer=self,
+                order_type=order_type,
+                subtotal_cents=subtotal,
+                discount_cents=discount,
+                total_cents=total_cost,
+            )
+            for od in lines:
+                od.from_order_num = order
+            OrderedDish.objects.bulk_create(lines)
+        self.refresh_from_db(fields=['balance', 'order_count', 'lifetime_spend_cents'])
 
         # VIP upgrade logic:
         # After each successful order, if this customer either
@@ -96,25 +136,15 @@ class Customer(Model):
         #   - has spent at least $100 (10_000 cents) in total,
         # and there are no valid complaints about them, they
         # become VIP.
-        if not self.vip:
+        if not self.vip and (self.order_count >= 3 or self.lifetime_spend_cents >= 10000):
             has_valid_complaints = Complaint.objects.filter(
                 to=self.login,
                 status='v',
             ).exists()
 
             if not has_valid_complaints:
-                # Consider all orders for this customer.
-                orders_qs = Order.objects.filter(customer=self)
-                order_count = orders_qs.count()
-
-                total_spent_cents = 0
-                for o in orders_qs.prefetch_related('items__product'):
-                    for item in o.items.all():
-                        total_spent_cents += item.total_cost()
-
-                if order_count >= 3 or total_spent_cents >= 10000:
-                    self.vip = True
-                    self.save(update_fields=['vip'])
+                self.vip = True
+                self.save(update_fields=['vip'])
 
         return order
 
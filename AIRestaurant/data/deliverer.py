@@ -28,19 +28,68 @@ class Order(Model):
     )
     # Optional 1-5 rating left by the customer for this order
     rating = PositiveSmallIntegerField(null=True, blank=True)
+    # Amounts fixed at checkout, in cents: line items, VIP discount and
+    # the charged total (subtotal - discount)
+    subtotal_cents = PositiveIntegerField(default=0)
+    discount_cents = PositiveIntegerField(default=0)
+    total_cents = PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Pending orders, newest first (manager queue)
+            Index(fields=['-date', '-id'], condition=Q(status='pending'), name='order_pending_idx'),
+            # A customer's order history and a deliverer's deliveries;
+            # unassigned orders (available orders) sit under NULL
+            Index(fields=['customer', '-date'], name='order_customer_date_idx'),
+            Index(fields=['assigned_deliverer', '-date'], name='order_deliverer_date_idx'),
+            # A deliverer's most recent rated orders (Deliverer.recent_average)
+            Index(
+                fields=['assigned_deliverer', '-date', '-id'],
+                condition=Q(rating__isnull=False),
+                name='order_rated_by_deliverer_idx',
+            ),
+        ]
+
+    @property
+    def total_amount(self):
+        """Line-item total in dollars, as shown on order listings."""
+        return self.subtotal_cents / 100.0
 
 
 class OrderedDish(Model):
     from_order_num = ForeignKey(Order, CASCADE, related_name="items")
     product = ForeignKey(Product, CASCADE)
     quantity = IntegerField()
+    # Product price when the order was placed; None for unsaved rows
+    unit_price_cents = PositiveIntegerField(null=True, blank=True)
 
     def total_cost(self) -> int:
-        return self.product.price * self.quantity
+        price = self.unit_price_cents if self.unit_price_cents is not None else self.product.price
+        return price * self.quantity
 
 
 class Deliverer(Employee):
-    pass
+
+    def recent_average(self, window=None):
+        """Average rating of the last `window` rated deliveries, or None.
+
+        `window` defaults to the DELIVERER_RATING_WINDOW setting. Reads at
+        most `window` rows through a partial index, however long the
+        delivery history is.
+        """
+        from django.conf import settings
+
+        if window is None:
+            window = getattr(settings, 'DELIVERER_RATING_WINDOW', 10)
+        ratings = list(
+            Order.objects
+            .filter(assigned_deliverer_id=self.login_id, rating__isnull=False)
+            .order_by('-date', '-id')
+            .values_list('rating', flat=True)[:window]
+        )
+        if not ratings:
+            return None
+        return sum(ratings) / len(ratings)
 
 
 class Bid(Model):
@@ -7,13 +7,29 @@ class FAQEntry(Model):
     answer = TextField()
     created_at = DateTimeField(auto_now_add=True)
     author = ForeignKey(User, CASCADE, null=True, blank=True, related_name='faq_entries')
+    # Number of words in question + answer, used for BM25 length normalization
+    length = PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [Index(fields=['-created_at', '-id'], name='faq_newest_idx')]
 
     def __str__(self):
         return f"Q: {self.question[:50]}"
 
+class FAQTerm(Model):
+    """Inverted index row: one distinct word of an FAQ question or answer."""
+    entry = ForeignKey(FAQEntry, CASCADE, related_name='terms')
+    token = CharField(max_length=300)
+    # Whether the word appears in the question (used for overlap matching)
+    in_question = BooleanField(default=True)
+    # Occurrences across question + answer (BM25 term frequency)
+    frequency = PositiveIntegerField(default=1)
+
+    class Meta:
+        # (token, entry) doubles as the lookup index for searches
+        unique_together = ('token', 'entry')
+
 class ReportedFAQ(Model):
     faq_entry = ForeignKey(FAQEntry, CASCADE)
     reported_by = ForeignKey(User, CASCADE)
@@ -26,6 +42,26 @@ class ReportedFAQ(Model):
 
     class Meta:
         ordering = ['-reported_at']
+        # Manager queue of pending reports, newest first
+        indexes = [Index(fields=['status', '-reported_at'], name='reportedfaq_status_time_idx')]
 
     def __str__(self):
         return f"Report on: {self.faq_entry.question[:50]}"
+
+class CachedAnswer(Model):
+    """An AI chat answer stored under its normalized question."""
+    key = CharField(max_length=40, unique=True)
+    question = TextField()
+    answer = TextField()
+    created_at = DateTimeField()
+    last_used_at = DateTimeField(db_index=True)
+    hits = PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Cached: {self.question[:50]}"
+
+class AnswerCacheStats(Model):
+    """Single-row hit/miss counters for the AI answer cache."""
+    hits = PositiveIntegerField(default=0)
+    misses = PositiveIntegerField(default=0)
+    evictions = PositiveIntegerField(default=0)
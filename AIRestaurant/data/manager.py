@@ -30,4 +30,8 @@ class Manager(Model):
 class Plea(Model):
     sender = ForeignKey(User, CASCADE)
     text = CharField(max_length=500)
-    created_at = DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Manager queue of pleas, newest first
+        indexes = [Index(fields=['-created_at', '-id'], name='plea_newest_idx')]
@@ -15,11 +15,19 @@ class Message(Model):
     who     = ForeignKey(User, SET_NULL, null=True)
     when    = DateTimeField(null=False)
 
+    class Meta:
+        # Covers keyset pagination of a thread on (when, id)
+        indexes = [Index(fields=['thread', 'when', 'id'], name='message_thread_when_idx')]
+
 class Compliment(Model):
     sender  = ForeignKey(User, SET_NULL, related_name="ComplimentSender", null=True)
     to      = ForeignKey(User, CASCADE, related_name="ComplimentTo", null=True)
     message = ForeignKey(Message, CASCADE)
 
+    class Meta:
+        # Feedback received by a user, and a sender's feedback per recipient
+        indexes = [Index(fields=['to', 'sender'], name='compliment_to_sender_idx')]
+
 class Complaint(Model):
     STATUS = [
         ('v', 'valid'),
@@ -31,3 +39,11 @@ class Complaint(Model):
     message = ForeignKey(Message, CASCADE)
     # use short code 'p' to match STATUS choices
     status  = CharField(max_length=1, choices=STATUS, default='p')
+
+    class Meta:
+        indexes = [
+            # Valid complaints per employee (reputation counters)
+            Index(fields=['to', 'status'], name='complaint_to_status_idx'),
+            # Manager queue of complaints awaiting review, newest first
+            Index(fields=['status', '-id'], name='complaint_status_idx'),
+        ]
@@ -20,17 +20,27 @@ class User(AbstractUser):
         ('CH', 'Chef'),
         ('MN', 'Manager')], default="CU")
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # manage_users filters by status and/or role, in id order
+            Index(fields=['status', 'type'], name='user_status_type_idx'),
+            Index(fields=['type'], name='user_type_idx'),
+            # Manager queue of registration requests, oldest first
+            Index(fields=['status', 'date_joined'], name='user_status_joined_idx'),
+        ]
+
     @property
     def is_vip(self):
-        """Return True if this user is a VIP customer."""
+        """Return True if this user is a VIP customer.
+
+        The customer row is looked up once per user object (see
+        AIRestaurant/profiles.py), so repeated checks cost no queries.
+        """
         if self.type != 'CU':
             return False
-        try:
-            from .customer import Customer
-            customer = Customer.objects.get(login=self)
-            return customer.vip
-        except Customer.DoesNotExist:
-            return False
+        from AIRestaurant.profiles import get_profile  # local import to avoid cycles
+        customer = get_profile(self)
+        return bool(customer and customer.vip)
 
 class Employee(Model):
     login       = OneToOneField(User, CASCADE)
@@ -45,6 +55,15 @@ class Employee(Model):
         ('PR', 'Promoted'),
         ('DM', 'Demoted'),
     ], default="OK")
+    # Reputation counters kept current by signals (see AIRestaurant/signals.py)
+    compliments          = IntegerField(default=0)
+    compliments_vip      = IntegerField(default=0)  # from VIP customers
+    valid_complaints     = IntegerField(default=0)
+    valid_complaints_vip = IntegerField(default=0)  # from VIP customers
+    # Running rating totals: ratings of a chef's food products, or of
+    # the orders assigned to a deliverer
+    rating_sum           = IntegerField(default=0)
+    rating_count         = IntegerField(default=0)
 
     def average_rating(self):
         """Return this employee's average rating.
@@ -54,30 +73,13 @@ class Employee(Model):
         - For deliverers (user type 'DL'): average rating of all orders
           assigned to them (using `Order.rating`).
 
+        Both come from the running totals on this row (see signals.py).
         Returns a float or None if no ratings exist.
         """
-        from django.db.models import Avg
-        from .chef import Product, ProductRating
-        from .deliverer import Order
-
-        user_type = self.login.type
-
-        # Chef: average rating over FOOD products they created.
-        if user_type == 'CH':
-            return ProductRating.objects.filter(
-                product__type="food",
-                product__creator__login=self.login,
-            ).aggregate(avg=Avg("rating"))["avg"]
-
-        # Deliverer: average rating over orders assigned to them.
-        if user_type == 'DL':
-            return Order.objects.filter(
-                assigned_deliverer=self.login,
-                rating__isnull=False,
-            ).aggregate(avg=Avg("rating"))["avg"]
-
-        # Other employee types currently do not have a rating definition.
-        return None
+        if self.login.type not in ('CH', 'DL') or not self.rating_count:
+            # Other employee types currently do not have a rating definition.
+            return None
+        return self.rating_sum / self.rating_count
 
 
     def score(self):
@@ -88,35 +90,16 @@ class Employee(Model):
           good_vip = count of compliments from VIP customers
           bad = count of valid complaints from any user
           bad_vip = count of valid complaints from VIP customers
-        """
-        from .message import Complaint, Compliment
-        from .customer import Customer
-
-        # All compliments (good)
-        good = Compliment.objects.filter(to=self.login).count()
-
-        # Valid complaints (bad)
-        bad = Complaint.objects.filter(to=self.login, status='v').count()
 
-        # Determine VIP customer user ids
-        vip_user_ids = list(
-            Customer.objects.filter(vip=True).values_list('login_id', flat=True)
+        The counts are stored on the employee and maintained as
+        compliments, complaints and VIP flags change, so this does not
+        query the database; reload the employee to see recent changes.
+        """
+        return (
+            self.compliments + self.compliments_vip
+            - self.valid_complaints - self.valid_complaints_vip
         )
 
-        # Compliments from VIP customers (good_vip)
-        good_vip = Compliment.objects.filter(
-            to=self.login,
-            sender_id__in=vip_user_ids,
-        ).count()
-
-        # Valid complaints from VIP customers (bad_vip)
-        bad_vip = Complaint.objects.filter(
-            to=self.login,
-            status='v',
-            sender_id__in=vip_user_ids,
-        ).count()
-
-        return good + good_vip - bad - bad_vip
     def suspend_for_firing(self):
         """Suspend this employee's account in preparation for firing."""
         self.status = 'FD'
@@ -1,45 +1,204 @@
 """
 FAQ/Knowledge Base helper functions with 90% word overlap search.
+
+Words of every question and answer are kept in an inverted index
+(`FAQTerm`), so a search only looks at entries sharing words with the
+query instead of re-tokenizing every stored question. The same index
+feeds BM25 relevance scores for ranked, keyset-paginated results.
 """
+import math
 import re
-from .models import FAQEntry
+from collections import Counter
+from datetime import datetime
+from django.db.models import Avg, Case, Count, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from .models import FAQEntry, FAQTerm
+
+# Fraction of the query words that must appear in a stored question
+OVERLAP_THRESHOLD = 0.9
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+PAGE_SIZE = 20
+
+# Longer "words" (URLs, pasted blobs) do not fit the index and are skipped
+MAX_TOKEN_LENGTH = FAQTerm._meta.get_field('token').max_length
+
+
+def words(text):
+    """Lowercase words of `text` in order, duplicates kept."""
+    return [w for w in re.findall(r'\b\w+\b', text.lower()) if len(w) <= MAX_TOKEN_LENGTH]
 
 
 def tokenize(text):
     """Split text into lowercase words, removing punctuation."""
-    return set(re.findall(r'\b\w+\b', text.lower()))
+    return set(words(text))
+
+
+def required_matches(word_count, threshold=OVERLAP_THRESHOLD):
+    """Smallest number of shared words giving an overlap >= threshold."""
+    return min(n for n in range(1, word_count + 1) if n / word_count >= threshold)
 
 
 def search_entries(query):
     """
     Search FAQ entries by 90% word overlap.
-    Returns entries where ≥90% of query words appear in the question.
+    Returns a queryset of entries where ≥90% of query words appear in the question.
     """
     if not query or not query.strip():
         return FAQEntry.objects.none()
-    
+
     query_words = tokenize(query)
     if not query_words:
         return FAQEntry.objects.none()
-    
-    threshold = 0.9
-    results = []
-    
-    for entry in FAQEntry.objects.all():
+
+    # Count shared words per candidate entry straight from the index
+    matching = (
+        FAQTerm.objects
+        .filter(token__in=query_words, in_question=True)
+        .values('entry')
+        .annotate(matches=Count('id'))
+        .filter(matches__gte=required_matches(len(query_words)))
+        .values('entry')
+    )
+    return FAQEntry.objects.filter(id__in=matching)
+
+
+def encode_cursor(value, entry_id):
+    """Opaque-ish keyset cursor: "<sort value>_<entry id>"."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = repr(float(value))
+    return f"{value}_{entry_id}"
+
+
+def decode_cursor(cursor, kind=float):
+    """Inverse of `encode_cursor`; returns None for a malformed cursor."""
+    try:
+        value, entry_id = cursor.rsplit('_', 1)
+        value = datetime.fromisoformat(value) if kind is datetime else float(value)
+        return value, int(entry_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def list_entries(after=None, limit=PAGE_SIZE):
+    """Newest-first page of entries using a (created_at, id) keyset.
+
+    Returns (entries, next_cursor); next_cursor is None on the last page.
+    """
+    qs = FAQEntry.objects.select_related('author').order_by('-created_at', '-id')
+    position = decode_cursor(after, datetime) if after else None
+    if position is not None:
+        created_at, entry_id = position
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id))
+
+    entries = list(qs[:limit + 1])
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1].created_at, entries[-1].id)
+    return entries, next_cursor
+
+
+def rank_entries(query, after=None, limit=PAGE_SIZE, min_overlap=0.0):
+    """Rank entries for `query` by BM25 over question + answer.
+
+    Each returned entry carries `score` (BM25) and `overlap` (fraction of
+    the query words found in its question). `min_overlap` drops entries
+    below that overlap, e.g. OVERLAP_THRESHOLD for the classic 90% match.
+    Pages are keyed on (score, id) so deep pages cost the same as the
+    first one. Returns (entries, next_cursor).
+    """
+    query_words = tokenize(query or '')
+    if not query_words:
+        return [], None
+
+    stats = FAQEntry.objects.aggregate(n=Count('id'), avg_length=Avg('length'))
+    total = stats['n'] or 0
+    avg_length = stats['avg_length'] or 1.0
+    doc_freq = dict(
+        FAQTerm.objects
+        .filter(token__in=query_words)
+        .values_list('token')
+        .annotate(df=Count('id'))
+    )
+    if not doc_freq:
+        return [], None
+
+    idf = Case(
+        *[
+            When(token=token, then=Value(math.log(1 + (total - df + 0.5) / (df + 0.5))))
+            for token, df in doc_freq.items()
+        ],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    tf = Cast('frequency', FloatField())
+    length_norm = Value(BM25_K1) * (
+        Value(1 - BM25_B) + Value(BM25_B) * Cast('entry__length', FloatField()) / Value(float(avg_length))
+    )
+    scored = (
+        FAQTerm.objects
+        .filter(token__in=list(doc_freq))
+        .values('entry')
+        .annotate(
+            score=Sum(idf * tf * Value(BM25_K1 + 1) / (tf + length_norm), output_field=FloatField()),
+            question_hits=Count('id', filter=Q(in_question=True)),
+        )
+    )
+    if min_overlap > 0:
+        scored = scored.filter(question_hits__gte=required_matches(len(query_words), min_overlap))
+
+    position = decode_cursor(after) if after else None
+    if position is not None:
+        score, entry_id = position
+        scored = scored.filter(Q(score__lt=score) | Q(score=score, entry__lt=entry_id))
+
+    rows = list(scored.order_by('-score', '-entry')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['score'], rows[-1]['entry'])
+
+    by_id = FAQEntry.objects.select_related('author').in_bulk([r['entry'] for r in rows])
+    entries = []
+    for r in rows:
+        entry = by_id.get(r['entry'])
+        if entry is None:
+            continue
+        entry.score = r['score']
+        entry.overlap = r['question_hits'] / len(query_words)
+        entries.append(entry)
+    return entries, next_cursor
+
+
+def index_entries(entries):
+    """(Re)build the inverted index rows and lengths for the given FAQ entries."""
+    entries = list(entries)
+    terms = []
+    for entry in entries:
         question_words = tokenize(entry.question)
-        matches = query_words & question_words
-        overlap = len(matches) / len(query_words) if query_words else 0
-        
-        if overlap >= threshold:
-            results.append(entry)
-    
-    return results
+        counts = Counter(words(entry.question) + words(entry.answer))
+        entry.length = sum(counts.values())
+        terms.extend(
+            FAQTerm(entry=entry, token=token, in_question=token in question_words, frequency=n)
+            for token, n in counts.items()
+        )
+    FAQTerm.objects.filter(entry__in=entries).delete()
+    FAQTerm.objects.bulk_create(terms, batch_size=5000)
+    FAQEntry.objects.bulk_update(entries, ['length'], batch_size=1000)
 
 
 def create_entry(question, answer, author=None):
     """Create a new FAQ entry."""
-    return FAQEntry.objects.create(
+    entry = FAQEntry.objects.create(
         question=question,
         answer=answer,
         author=author
     )
+    index_entries([entry])
+    return entry
@@ -0,0 +1,237 @@
+"""
+Per-view query count and latency instrumentation.
+
+With REQUEST_METRICS["ENABLED"] on (off by default; settings.py turns
+it on when the REQUEST_METRICS=1 environment variable is set),
+RequestMetricsMiddleware times every request and records, per view:
+the number of SQL queries, the time spent in the database, the time
+spent rendering templates and the wall time. Samples go into a ring
+buffer of the last REQUEST_METRICS["BUFFER_SIZE"] requests, kept per
+process. `report()` aggregates the buffer per view, and `to_json()` /
+`to_prometheus()` export it (see the `view_metrics` command and the
+manager-only `manager/metrics/` page).
+
+Template time is measured by the TimedDjangoTemplates backend; queries
+run lazily while a template renders count towards both DB and template
+time. With "QUERY_COUNT_HEADER" on, responses also carry X-Query-Count
+and X-DB-Time-Ms headers, which is meant for load-test runs.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from .stats import percentile
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_buffer = None
+
+
+def metrics_settings():
+    conf = {'ENABLED': False, 'BUFFER_SIZE': 2000, 'QUERY_COUNT_HEADER': False}
+    conf.update(getattr(settings, 'REQUEST_METRICS', {}) or {})
+    return conf
+
+
+def _samples():
+    global _buffer
+    size = metrics_settings()['BUFFER_SIZE']
+    with _lock:
+        if _buffer is None or _buffer.maxlen != size:
+            _buffer = deque(_buffer or (), maxlen=size)
+        return _buffer
+
+
+def record(sample):
+    buffer = _samples()
+    with _lock:
+        buffer.append(sample)
+
+
+def samples():
+    """A copy of the buffered samples, oldest first."""
+    buffer = _samples()
+    with _lock:
+        return list(buffer)
+
+
+def clear():
+    buffer = _samples()
+    with _lock:
+        buffer.clear()
+
+
+class _Sample:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: count and time every statement
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def view_name(request):
+    """Dotted path of the view that handled `request`."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    func = getattr(match.func, 'view_class', match.func)
+    return f'{func.__module__}.{getattr(func, "__qualname__", type(func).__name__)}'
+
+
+class RequestMetricsMiddleware:
+    """Record query count, DB, template and wall time of every request.
+
+    Put it first in MIDDLEWARE so the wall time covers the whole stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        conf = metrics_settings()
+        if not conf['ENABLED']:
+            return self.get_response(request)
+
+        sample = _Sample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sample))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        wall = time.perf_counter() - started
+
+        record({
+            'view': view_name(request),
+            'method': request.method,
+            'status': response.status_code,
+            'queries': sample.queries,
+            'db_ms': round(sample.db_seconds * 1000, 3),
+            'template_ms': round(sample.template_seconds * 1000, 3),
+            'wall_ms': round(wall * 1000, 3),
+            'at': time.time(),
+        })
+        if conf['QUERY_COUNT_HEADER']:
+            response['X-Query-Count'] = str(sample.queries)
+            response['X-DB-Time-Ms'] = f'{sample.db_seconds * 1000:.1f}'
+        return response
+
+
+class TimedTemplate:
+    """Backend template wrapper adding its render time to the request."""
+
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return self._template.render(context, request)
+        # Templates rendered from inside another one are already timed
+        sample.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            sample.template_depth -= 1
+            if not sample.template_depth:
+                sample.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for the metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def report(sampled=None):
+    """Per-view aggregates of `sampled` (default: the buffer), busiest first."""
+    views = {}
+    for sample in samples() if sampled is None else sampled:
+        views.setdefault(sample['view'], []).append(sample)
+
+    rows = []
+    for view, group in views.items():
+        wall = [s['wall_ms'] for s in group]
+        queries = [s['queries'] for s in group]
+        rows.append({
+            'view': view,
+            'requests': len(group),
+            'errors': sum(1 for s in group if s['status'] >= 500),
+            'queries_mean': round(sum(queries) / len(group), 2),
+            'queries_max': max(queries),
+            'db_ms_total': round(sum(s['db_ms'] for s in group), 3),
+            'template_ms_total': round(sum(s['template_ms'] for s in group), 3),
+            'wall_ms_total': round(sum(wall), 3),
+            'wall_ms_p50': percentile(wall, 50),
+            'wall_ms_p95': percentile(wall, 95),
+            'wall_ms_p99': percentile(wall, 99),
+        })
+    rows.sort(key=lambda row: row['wall_ms_total'], reverse=True)
+    return rows
+
+
+def to_json(rows):
+    return json.dumps({'views': rows}, indent=2)
+
+
+PROMETHEUS_METRICS = (
+    # (name, type, help, row key, scale). Everything describes the ring
+    # buffer, whose sums drop as old samples are evicted, so even the
+    # totals are gauges: exported as counters, each drop would read as a
+    # counter reset and skew rate()
+    ('air_view_buffered_requests', 'gauge', 'Buffered requests per view.', 'requests', 1),
+    ('air_view_buffered_errors', 'gauge', 'Buffered 5xx responses per view.', 'errors', 1),
+    ('air_view_queries_mean', 'gauge', 'Mean SQL queries per request.', 'queries_mean', 1),
+    ('air_view_queries_max', 'gauge', 'Most SQL queries in one request.', 'queries_max', 1),
+    ('air_view_buffered_db_seconds', 'gauge', 'Time the buffered requests spent in SQL queries.', 'db_ms_total', 0.001),
+    ('air_view_buffered_template_seconds', 'gauge', 'Time the buffered requests spent rendering templates.',
+     'template_ms_total', 0.001),
+    ('air_view_buffered_wall_seconds', 'gauge', 'Wall time of the buffered requests.', 'wall_ms_total', 0.001),
+)
+PROMETHEUS_QUANTILES = (('0.5', 'wall_ms_p50'), ('0.95', 'wall_ms_p95'), ('0.99', 'wall_ms_p99'))
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(rows):
+    """The report in the Prometheus text exposition format."""
+    lines = []
+    for name, kind, help_text, key, scale in PROMETHEUS_METRICS:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{{view="{_label(row["view"])}"}} {row[key] * scale:g}' for row in rows]
+    name = 'air_view_wall_seconds'
+    lines += [f'# HELP {name} Wall time percentiles over the buffered requests.', f'# TYPE {name} gauge']
+    for row in rows:
+        for quantile, key in PROMETHEUS_QUANTILES:
+            lines.append(f'{name}{{view="{_label(row["view"])}",quantile="{quantile}"}} {row[key] / 1000:g}')
+    return '\n'.join(lines) + '\n'
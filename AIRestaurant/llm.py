@@ -0,0 +1,449 @@
+"""
+Long-lived LLM worker pool backing the AI chat endpoint.
+
+Each worker thread loads the model once and then serves prompts from a
+shared queue, so a chat request no longer reloads the GGUF file from
+disk and never waits longer than its own timeout. Answers can also be
+streamed token by token as the model produces them.
+"""
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from subprocess import DEVNULL, PIPE, Popen, run as shell
+
+from django.conf import settings
+
+from .stats import percentile
+
+
+MODEL_FILE = 'tinyllama-1.1b-chat-v1.0.Q4_0.gguf'
+
+
+def default_model_path():
+    """Return the model location for this host.
+
+    Preserves the existing locations:
+      - Local dev:       <parent-of-project>/tinyllama-....gguf
+      - PythonAnywhere:  ~/AI/tinyllama-....gguf
+    `AI_MODEL_PATH` (or AI_CHAT['MODEL_PATH']) overrides both.
+    """
+    configured = chat_settings().get('MODEL_PATH') or os.environ.get('AI_MODEL_PATH')
+    if configured:
+        return Path(configured)
+
+    base_dir = Path(__file__).resolve().parent.parent
+    if socket.gethostname().endswith('.local'):
+        # Local machine: model lives one directory above the project root
+        return base_dir.parent / MODEL_FILE
+    # Server (e.g. PythonAnywhere): model lives under ~/AI
+    return Path.home() / 'AI' / MODEL_FILE
+
+
+def chat_settings():
+    return getattr(settings, 'AI_CHAT', {}) or {}
+
+
+class StubBackend:
+    """Canned backend for tests and machines without a model."""
+
+    name = 'stub'
+
+    def __init__(self, model_path=None, answer=None, delay=0.0, **kwargs):
+        self.answer = answer
+        self.delay = delay
+
+    def load(self):
+        pass
+
+    def generate(self, prompt, timeout=None):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._answer(prompt)
+
+    def _answer(self, prompt):
+        return self.answer if self.answer is not None else f"You asked: {prompt}"
+
+    def stream(self, prompt, timeout=None):
+        words = self._answer(prompt).split(' ')
+        for i, word in enumerate(words):
+            if self.delay:
+                time.sleep(self.delay / len(words))
+            yield word if i == 0 else ' ' + word
+
+
+class LlamaCppBackend:
+    """Keeps the model resident in memory (requires llama-cpp-python)."""
+
+    name = 'llama_cpp'
+
+    def __init__(self, model_path, max_tokens=256, **kwargs):
+        self.model_path = Path(model_path)
+        self.max_tokens = max_tokens
+        self.model = None
+
+    def load(self):
+        from llama_cpp import Llama
+        self.model = Llama(model_path=str(self.model_path), verbose=False)
+
+    def generate(self, prompt, timeout=None):
+        out = self.model.create_chat_completion(
+            messages=[{'role': 'user', 'content': prompt}],
+            max_tokens=self.max_tokens,
+        )
+        return out['choices'][0]['message']['content']
+
+    def stream(self, prompt, timeout=None):
+        chunks = self.model.create_chat_completion(
+            messages=[{'role': 'user', 'content': prompt}],
+            max_tokens=self.max_tokens,
+            stream=True,
+        )
+        for chunk in chunks:
+            token = chunk['choices'][0]['delta'].get('content')
+            if token:
+                yield token
+
+
+class LlamaRunBackend:
+    """Fallback that runs the `llama-run` CLI once per prompt.
+
+    This still reloads the model for every request; it only exists so
+    hosts without llama-cpp-python keep working.
+    """
+
+    name = 'llama-run'
+
+    def __init__(self, model_path, **kwargs):
+        self.model_path = Path(model_path)
+
+    def load(self):
+        pass
+
+    def generate(self, prompt, timeout=None):
+        result = shell(
+            ['llama-run', str(self.model_path)],
+            capture_output=True,
+            input=prompt,
+            encoding='utf-8',
+            timeout=timeout,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"llama-run exited with status {result.returncode}")
+        return result.stdout.replace("\x1b[0m", "")
+
+    def stream(self, prompt, timeout=None):
+        # stderr is discarded: nobody reads it, and a full pipe would
+        # block llama-run (and this worker) forever
+        proc = Popen(['llama-run', str(self.model_path)], stdin=PIPE, stdout=PIPE, stderr=DEVNULL)
+        # Reads block until llama-run writes, so kill it at the deadline
+        watchdog = threading.Timer(timeout, proc.kill) if timeout else None
+        if watchdog is not None:
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            proc.stdin.write(prompt.encode('utf-8'))
+            proc.stdin.close()
+            pending = b''
+            while True:
+                chunk = proc.stdout.read1(256)
+                if not chunk:
+                    break
+                # Only emit complete UTF-8 sequences
+                pending += chunk
+                try:
+                    text = pending.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    text = pending[:e.start].decode('utf-8')
+                    pending = pending[e.start:]
+                else:
+                    pending = b''
+                text = text.replace("\x1b[0m", "")
+                if text:
+                    yield text
+            if proc.wait() != 0:
+                if watchdog is not None and watchdog.finished.is_set():
+                    raise TimeoutError("llama-run did not finish in time.")
+                raise RuntimeError(f"llama-run exited with status {proc.returncode}")
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+
+BACKENDS = {
+    StubBackend.name: StubBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+    LlamaRunBackend.name: LlamaRunBackend,
+}
+
+
+def backend_class(name=None):
+    """Resolve a backend name; "auto" prefers an in-memory llama.cpp model."""
+    name = name or chat_settings().get('BACKEND', 'auto')
+    if name == 'auto':
+        try:
+            import llama_cpp  # noqa: F401
+        except ImportError:
+            return LlamaRunBackend
+        return LlamaCppBackend
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown AI chat backend {name!r}.")
+
+
+class _Job:
+    """One queued prompt. Streaming jobs also carry a token queue."""
+
+    def __init__(self, prompt, deadline, stream=False):
+        self.prompt = prompt
+        self.deadline = deadline
+        self.future = Future()
+        self.tokens = queue.Queue() if stream else None
+        self.cancelled = threading.Event()
+
+
+_DONE = object()
+
+
+class ModelPool:
+    """A fixed set of worker threads, each owning one loaded backend.
+
+    Prompts are queued as jobs with a deadline. A job whose deadline
+    passes while it is still queued is dropped without running the
+    model. `stats()` reports the model load time, recent latency and
+    time-to-first-token percentiles so they can be tracked from the
+    dashboard or a benchmark.
+    """
+
+    def __init__(self, backend_factory, workers=1, queue_size=32, timeout=120.0, history=1000):
+        self.backend_factory = backend_factory
+        self.workers = workers
+        self.timeout = timeout
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.latencies = deque(maxlen=history)
+        self.first_token = deque(maxlen=history)
+        self.load_seconds = []
+        self.load_error = None
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.backend_name = getattr(backend_factory, 'name', None)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loaded = 0
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f'ai-chat-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has finished loading its model."""
+        return self._ready.wait(timeout)
+
+    def _work(self):
+        backend = self.backend_factory()
+        started = time.perf_counter()
+        try:
+            backend.load()
+        except Exception as e:
+            with self._lock:
+                self.load_error = e
+        with self._lock:
+            self.load_seconds.append(time.perf_counter() - started)
+            self.backend_name = getattr(backend, 'name', self.backend_name)
+            self._loaded += 1
+            if self._loaded == self.workers:
+                self._ready.set()
+
+        while True:
+            job = self.jobs.get()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            remaining = job.deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError("AI chat request expired in the queue.")
+                if self.load_error is not None:
+                    raise RuntimeError(f"AI model failed to load: {self.load_error}")
+                if job.tokens is None:
+                    job.future.set_result(backend.generate(job.prompt, timeout=remaining))
+                else:
+                    job.future.set_result(self._stream_job(backend, job, remaining))
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                if job.tokens is not None:
+                    job.tokens.put(_DONE)
+
+    def _stream_job(self, backend, job, remaining):
+        parts = []
+        for token in backend.stream(job.prompt, timeout=remaining):
+            # Stop generating once the reader has gone away
+            if job.cancelled.is_set():
+                break
+            # A truncated answer must not look like a finished one
+            if time.monotonic() > job.deadline:
+                raise TimeoutError("AI chat answer did not finish in time.")
+            parts.append(token)
+            job.tokens.put(token)
+        return ''.join(parts)
+
+    def _submit(self, prompt, timeout, stream=False):
+        job = _Job(prompt, time.monotonic() + timeout, stream=stream)
+        self.jobs.put(job, timeout=timeout)
+        return job
+
+    def ask(self, prompt, timeout=None):
+        """Run `prompt` through the model and return its answer.
+
+        Raises TimeoutError if the answer is not ready within `timeout`
+        seconds (queueing included), or the backend's own error.
+        """
+        timeout = timeout or self.timeout
+        started = time.perf_counter()
+        job = None
+        try:
+            job = self._submit(prompt, timeout)
+            answer = job.future.result(timeout=max(0.0, job.deadline - time.monotonic()))
+        except (queue.Full, TimeoutError):
+            if job is not None:
+                job.future.cancel()
+            with self._lock:
+                self.requests += 1
+                self.timeouts += 1
+            raise TimeoutError("AI chat request timed out.")
+        except Exception:
+            with self._lock:
+                self.requests += 1
+                self.failures += 1
+            raise
+
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(time.perf_counter() - started)
+        return answer
+
+    def stream(self, prompt, timeout=None):
+        """Yield the answer to `prompt` token by token.
+
+        Raises TimeoutError if the next token does not arrive before the
+        request deadline. Closing the generator early stops generation.
+        """
+        timeout = timeout or self.timeout
+        started = time.perf_counter()
+        first = True
+        try:
+            job = self._submit(prompt, timeout, stream=True)
+        except queue.Full:
+            with self._lock:
+                self.requests += 1
+                self.timeouts += 1
+            raise TimeoutError("AI chat request timed out.")
+
+        try:
+            while True:
+                try:
+                    token = job.tokens.get(timeout=max(0.0, job.deadline - time.monotonic()))
+                except queue.Empty:
+                    raise TimeoutError("AI chat request timed out.")
+                if token is _DONE:
+                    break
+                if first:
+                    first = False
+                    with self._lock:
+                        self.first_token.append(time.perf_counter() - started)
+                yield token
+            # Surface backend errors raised before or during generation
+            job.future.result(timeout=0)
+        except TimeoutError:
+            with self._lock:
+                self.requests += 1
+                self.timeouts += 1
+            raise
+        except Exception:
+            with self._lock:
+                self.requests += 1
+                self.failures += 1
+            raise
+        else:
+            with self._lock:
+                self.requests += 1
+                self.latencies.append(time.perf_counter() - started)
+        finally:
+            job.cancelled.set()
+            job.future.cancel()
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            first_token = list(self.first_token)
+            return {
+                'backend': self.backend_name,
+                'workers': self.workers,
+                'ready': self._ready.is_set(),
+                'load_seconds': max(self.load_seconds) if self.load_seconds else None,
+                'load_error': str(self.load_error) if self.load_error else None,
+                'queued': self.jobs.qsize(),
+                'requests': self.requests,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'latency_p50': percentile(latencies, 50),
+                'latency_p99': percentile(latencies, 99),
+                'ttft_p50': percentile(first_token, 50),
+                'ttft_p99': percentile(first_token, 99),
+            }
+
+
+def build_pool(backend=None, **backend_kwargs):
+    """Create and start a pool from the AI_CHAT settings."""
+    conf = chat_settings()
+    cls = backend_class(backend)
+    kwargs = {'model_path': default_model_path(), 'max_tokens': conf.get('MAX_TOKENS', 256)}
+    kwargs.update(backend_kwargs)
+
+    def factory():
+        return cls(**kwargs)
+    factory.name = cls.name
+
+    return ModelPool(
+        factory,
+        workers=conf.get('WORKERS', 1),
+        queue_size=conf.get('QUEUE_SIZE', 32),
+        timeout=conf.get('TIMEOUT', 120),
+    ).start()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, starting it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = build_pool()
+    return _pool
+
+
+def preload():
+    """Start the pool now if AI_CHAT["PRELOAD"] asks for it.
+
+    Called from the ASGI/WSGI entrypoints only, so `migrate`, `test` and
+    other management commands never load the model.
+    """
+    if chat_settings().get('PRELOAD'):
+        get_pool()
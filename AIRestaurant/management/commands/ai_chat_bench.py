@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from AIRestaurant import llm
+
+
+class Command(BaseCommand):
+
+    help = 'Measure AI chat model load time, latency and time-to-first-token percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default=None, help='auto, llama_cpp, llama-run or stub (default: AI_CHAT setting)')
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--prompt', default='How do I place an order?')
+        parser.add_argument('--timeout', type=float, default=None)
+        parser.add_argument('--stream', action='store_true', help='Stream answers and report time-to-first-token')
+        parser.add_argument('--stub-delay', type=float, default=0.0, help='Simulated generation time for the stub backend')
+
+    def handle(self, *args, **options):
+        extra = {}
+        if options['backend'] == 'stub':
+            extra['delay'] = options['stub_delay']
+
+        started = time.perf_counter()
+        pool = llm.build_pool(options['backend'], **extra)
+        pool.wait_ready()
+        self.stdout.write(f'Backend: {pool.stats()["backend"]}')
+        self.stdout.write(f'Model ready in {time.perf_counter() - started:.3f}s')
+
+        def one(_):
+            try:
+                if options['stream']:
+                    for _token in pool.stream(options['prompt'], timeout=options['timeout']):
+                        pass
+                else:
+                    pool.ask(options['prompt'], timeout=options['timeout'])
+            except Exception as e:
+                return e
+            return None
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            errors = [e for e in executor.map(one, range(options['requests'])) if e is not None]
+        elapsed = time.perf_counter() - started
+
+        stats = pool.stats()
+        if stats['load_error']:
+            self.stdout.write(self.style.ERROR(f'Model failed to load: {stats["load_error"]}'))
+        self.stdout.write(f'Requests: {stats["requests"]} in {elapsed:.3f}s '
+                          f'({stats["timeouts"]} timed out, {stats["failures"]} failed)')
+        labels = ['latency_p50', 'latency_p99']
+        if options['stream']:
+            labels += ['ttft_p50', 'ttft_p99']
+        for label in labels:
+            value = stats[label]
+            shown = f'{value:.3f}s' if value is not None else 'n/a'
+            self.stdout.write(f'{label}: {shown}')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'First error: {errors[0]!r}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('AI chat benchmark finished.'))
@@ -0,0 +1,137 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from AIRestaurant.data.chef import Product
+from AIRestaurant.data.customer import Customer
+from AIRestaurant.data.users import User
+from AIRestaurant.stats import percentile
+
+PREFIX = 'bench-checkout-'
+
+
+class QueryCounter:
+    """execute_wrapper that counts the statements run on one connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+
+    help = 'Measure checkout throughput, latency percentiles and queries per order through place_order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--items', type=int, default=3, help='Distinct products per cart')
+        parser.add_argument('--seed', type=int, default=322)
+        parser.add_argument('--keep', action='store_true', help='Leave the seeded customers, products and orders behind')
+
+    def handle(self, *args, **options):
+        if min(options['customers'], options['products'], options['orders'], options['concurrency']) < 1:
+            raise CommandError('--customers, --products, --orders and --concurrency must be positive.')
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f'Users named {PREFIX}* already exist (left by an earlier --keep run); delete them first.')
+
+        started = time.perf_counter()
+        users, products = self._seed(options)
+        self.stdout.write(f'Seeded {len(users)} customers and {len(products)} products '
+                          f'in {time.perf_counter() - started:.2f}s ({connection.vendor})')
+        try:
+            # The test client talks to the "testserver" host
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                self._run(options, users, products)
+        finally:
+            if not options['keep']:
+                # Removes the customers, their orders and line items too
+                Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+    def _seed(self, options):
+        # Hashing is deliberately slow; one hash serves every bench user
+        password = make_password(None)
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@example.invalid',
+                 password=password, type='CU', status='AC')
+            for i in range(options['customers'])
+        ])
+        users = list(User.objects.filter(username__startswith=PREFIX).order_by('id'))
+        Customer.objects.bulk_create([Customer(login=user, balance=10 ** 9) for user in users])
+        rng = random.Random(options['seed'])
+        products = [
+            Product.objects.create(name=f'Benchmark dish {i}', price=rng.randint(100, 2000), type='food')
+            for i in range(options['products'])
+        ]
+        return users, products
+
+    def _run(self, options, users, products):
+        rng = random.Random(options['seed'])
+        url = reverse('place_order')
+        items = min(options['items'], len(products))
+        carts = [
+            {str(p.id): rng.randint(1, 3) for p in rng.sample(products, items)}
+            for _ in range(options['orders'])
+        ]
+
+        # Log in and fill every cart up front so only the checkouts are timed
+        clients = []
+        for i, cart in enumerate(carts):
+            client = Client()
+            client.force_login(users[i % len(users)])
+            client.post(reverse('update_cart'), {'cart': json.dumps(cart)})
+            clients.append(client)
+
+        def checkout(i):
+            try:
+                counter = QueryCounter()
+                began = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    response = clients[i].post(url)
+                latency = time.perf_counter() - began
+                if response.status_code != 302 or response.url != reverse('order_history'):
+                    return latency, counter.count, f'unexpected response {response.status_code} -> {response.get("Location")}'
+                return latency, counter.count, None
+            except Exception as e:
+                return None, 0, f'error: {e!r}'
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(checkout, range(options['orders'])))
+        elapsed = time.perf_counter() - started
+
+        ok = [(latency, queries) for latency, queries, error in results if error is None]
+        errors = [error for _latency, _queries, error in results if error is not None]
+        latencies = [latency for latency, _queries in ok]
+        queries = [q for _latency, q in ok]
+
+        self.stdout.write(f'Orders: {len(ok)} placed, {len(errors)} failed in {elapsed:.3f}s '
+                          f'with {options["concurrency"]} workers')
+        self.stdout.write(f'Throughput: {len(ok) / elapsed:.1f} orders/s')
+        for label, pct in (('latency_p50', 50), ('latency_p95', 95), ('latency_p99', 99)):
+            value = percentile(latencies, pct)
+            shown = f'{value * 1000:.1f}ms' if value is not None else 'n/a'
+            self.stdout.write(f'{label}: {shown}')
+        if queries:
+            self.stdout.write(f'Queries per order: {sum(queries) / len(queries):.1f} '
+                              f'(min {min(queries)}, max {max(queries)})')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'First failure: {errors[0]}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Checkout benchmark finished.'))
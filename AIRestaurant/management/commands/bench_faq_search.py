@@ -0,0 +1,99 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from AIRestaurant.data.faq import FAQEntry
+from AIRestaurant.faq import OVERLAP_THRESHOLD, index_entries, rank_entries, search_entries, tokenize
+from AIRestaurant.stats import percentile
+
+
+class Rollback(Exception):
+    pass
+
+
+def full_scan_search(query):
+    """The previous implementation: re-tokenize every stored question."""
+    query_words = tokenize(query)
+    results = []
+    for entry in FAQEntry.objects.all():
+        matches = query_words & tokenize(entry.question)
+        if len(matches) / len(query_words) >= OVERLAP_THRESHOLD:
+            results.append(entry)
+    return results
+
+
+class Command(BaseCommand):
+
+    help = 'Benchmark FAQ search on a synthetic knowledge base (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--full-scan-queries', type=int, default=3,
+                            help='How many queries to also run through the old full-table scan')
+        parser.add_argument('--vocabulary', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=322)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = [f'word{i}' for i in range(options['vocabulary'])]
+
+        def question():
+            return ' '.join(rng.choice(words) for _ in range(rng.randint(5, 12))) + '?'
+
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                entries = FAQEntry.objects.bulk_create(
+                    [FAQEntry(question=question(), answer='Synthetic answer.') for _ in range(options['entries'])],
+                    batch_size=5000,
+                )
+                for i in range(0, len(entries), 5000):
+                    index_entries(entries[i:i + 5000])
+                self.stdout.write(f'Seeded and indexed {len(entries)} entries in {time.perf_counter() - started:.2f}s')
+
+                # Half the queries reuse a stored question, half are random
+                queries = [
+                    rng.choice(entries).question if i % 2 == 0 else question()
+                    for i in range(options['queries'])
+                ]
+
+                self.report('Indexed search', queries, lambda q: len(search_entries(q)))
+                self.report('Ranked search (page 1)', queries, lambda q: len(rank_entries(q)[0]))
+
+                def third_page(q):
+                    _, cursor = rank_entries(q)
+                    _, cursor = rank_entries(q, after=cursor) if cursor else ([], None)
+                    return len(rank_entries(q, after=cursor)[0]) if cursor else 0
+                self.report('Ranked search (3 pages)', queries, third_page)
+
+                scan = queries[:options['full_scan_queries']]
+                if scan:
+                    started = time.perf_counter()
+                    for q in scan:
+                        full_scan_search(q)
+                    per_query = (time.perf_counter() - started) / len(scan)
+                    self.stdout.write(f'Full-table scan: {per_query * 1000:.2f}ms per query ({len(scan)} queries)')
+
+                raise Rollback()
+        except Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('FAQ search benchmark finished (synthetic rows rolled back).'))
+
+    def report(self, label, queries, search):
+        timings = []
+        hits = 0
+        for q in queries:
+            started = time.perf_counter()
+            hits += search(q)
+            timings.append(time.perf_counter() - started)
+        if not timings:
+            return
+        self.stdout.write(
+            f'{label}: {len(queries)} queries, {hits} results, '
+            f'p50 {percentile(timings, 50) * 1000:.2f}ms, '
+            f'p99 {percentile(timings, 99) * 1000:.2f}ms'
+        )
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from AIRestaurant.data.chef import Product
+from AIRestaurant.data.customer import Customer
+from AIRestaurant.data.deliverer import Order
+from AIRestaurant.data.message import Complaint, Compliment, Message, Thread
+from AIRestaurant.data.users import User
+from AIRestaurant.views import MANAGE_USERS_PAGE_SIZE, MANAGER_QUEUE_PAGE_SIZE, _manager_queues
+
+
+def _any_id(model, **filters):
+    return model.objects.filter(**filters).values_list('pk', flat=True).first() or 0
+
+
+# Index each hot query is meant to use; None accepts any index (the
+# planner picks Django's own foreign key index for those)
+MANAGER_QUEUE_INDEXES = {
+    'pending_users': 'user_status_joined_idx',
+    'pending_orders': 'order_pending_idx',
+    'pleas': 'plea_newest_idx',
+    'pending_complaints': 'complaint_status_idx',
+    'reported_faqs': 'reportedfaq_status_time_idx',
+}
+
+
+def hot_queries():
+    """(label, queryset, intended index) for the queries the busiest pages run."""
+    customer = _any_id(Customer)
+    deliverer = _any_id(User, type='DL')
+    employee = _any_id(User, type__in=['CH', 'DL'])
+    thread = _any_id(Thread)
+    window = getattr(settings, 'DELIVERER_RATING_WINDOW', 10)
+
+    queries = []
+    for name, queue in _manager_queues().items():
+        order = [queue.sort, 'id'] if queue.sort else ['id']
+        if queue.newest_first:
+            order = ['-' + field for field in order]
+        queries.append((
+            f'manager queue: {name}',
+            queue.queryset.order_by(*order)[:MANAGER_QUEUE_PAGE_SIZE + 1],
+            MANAGER_QUEUE_INDEXES[name],
+        ))
+    queries += [
+        ('available orders',
+         Order.objects.filter(status='pending', assigned_deliverer__isnull=True).order_by('-date'),
+         'order_deliverer_date_idx'),
+        ('order history', Order.objects.filter(customer=customer).order_by('-date'), 'order_customer_date_idx'),
+        ('my deliveries', Order.objects.filter(assigned_deliverer=deliverer).order_by('-date'), 'order_deliverer_date_idx'),
+        # Deliverer.recent_average
+        ('recent delivery ratings',
+         Order.objects.filter(assigned_deliverer_id=deliverer, rating__isnull=False)
+         .order_by('-date', '-id').values_list('rating', flat=True)[:window],
+         'order_rated_by_deliverer_idx'),
+        ('compliments received', Compliment.objects.filter(to=employee).order_by('-id'), None),
+        ('complaints received', Complaint.objects.filter(to=employee).order_by('-id'), None),
+        ('valid complaints', Complaint.objects.filter(to=employee, status='v'), 'complaint_to_status_idx'),
+        ('thread messages', Message.objects.filter(thread=thread).order_by('when', 'id')[:50], 'message_thread_when_idx'),
+        ('manage users: status',
+         User.objects.filter(status='AC').order_by('id')[:MANAGE_USERS_PAGE_SIZE + 1], None),
+        ('manage users: role',
+         User.objects.filter(type='DL').order_by('id')[:MANAGE_USERS_PAGE_SIZE + 1], 'user_type_idx'),
+        ('manage users: status and role',
+         User.objects.filter(status='AC', type='DL').order_by('id')[:MANAGE_USERS_PAGE_SIZE + 1],
+         'user_status_type_idx'),
+        ('food menu', Product.objects.filter(type='food', vip_exclusive=False).order_by('id'), 'product_type_vip_idx'),
+        ('merch catalog', Product.objects.filter(type='merch').order_by('id'), 'product_type_vip_idx'),
+    ]
+    return queries
+
+
+def explain(qs):
+    """The query plan of `qs`; on PostgreSQL with sequential scans discouraged."""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Small tables make a sequential scan cheaper than any
+            # index; only report scans that have no index to use
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return qs.explain()
+
+
+def full_scans(plan, vendor):
+    """Lines of `plan` that read a whole table."""
+    lines = plan.splitlines()
+    if vendor == 'sqlite':
+        # "SCAN air_order" reads every row; "SCAN ... USING INDEX" walks an index
+        return [line.strip() for line in lines if ' SCAN ' in f' {line} ' and 'USING' not in line]
+    return [line.strip() for line in lines if 'Seq Scan' in line]
+
+
+class Command(BaseCommand):
+
+    help = 'EXPLAIN the hot dashboard/history queries and fail if any of them scans a whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Query plans on {vendor} are not supported; use SQLite or PostgreSQL.')
+
+        failures = []
+        for label, qs, index in hot_queries():
+            plan = explain(qs)
+            scans = full_scans(plan, vendor)
+            if scans:
+                failures.append(label)
+                self.stdout.write(self.style.WARNING(f'{label}: full scan ({"; ".join(scans)})'))
+            elif index and index not in plan:
+                self.stdout.write(self.style.WARNING(f'{label}: ok, but not through {index}'))
+            else:
+                self.stdout.write(f'{label}: ok')
+            if options['verbose']:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries scan a whole table: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Every hot query uses an index.'))
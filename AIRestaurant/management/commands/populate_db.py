@@ -1,19 +1,36 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from AIRestaurant.data.users import User
 from AIRestaurant.data.manager import Manager
 from AIRestaurant.data.chef import Chef, Product
 from AIRestaurant.data.deliverer import Deliverer, OrderedDish
 from AIRestaurant.data.customer import Customer
 from AIRestaurant.data.faq import FAQEntry
-from subprocess import run as shell_run
+from AIRestaurant.faq import create_entry
+from AIRestaurant.synthetic import generate
+
+
 class Command(BaseCommand):
 
     help = 'Populate database with initial data'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=0,
+                            help='Also bulk-generate this many synthetic customers with their orders, '
+                                 'ratings, bids, threads, complaints and FAQs (wipes the database first)')
+        parser.add_argument('--seed', type=int, default=322, help='Random seed for --scale')
 
-        shell_run(['python', 'manage.py', 'migrate'])
-        shell_run(['python', 'manage.py', 'makemigrations', 'air'])
+    def handle(self, *args, **options):
+        if options['scale'] < 0:
+            raise CommandError('--scale must not be negative.')
+
+        call_command('migrate', verbosity=0)
+        if options['scale']:
+            # Truncating is much faster than deleting a large dataset
+            # row by row through the counter signals
+            call_command('flush', interactive=False, verbosity=0)
         CHEFS = [
             ('Mordecai Shafier', 'moko1234'),
             ('Abraham Spoerri', 'raphaelsbrother')
@@ -134,12 +151,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f'✓ Created Merch Product: {merch_name}'))
         for question, answer, asker_username in FAQ:
             asker_user = User.objects.get(username=asker_username)
-            faq_entry = FAQEntry.objects.create(
-                question=question,
-                answer=answer,
-                author=asker_user,
-            )
-            faq_entry.save()
+            create_entry(question, answer, asker_user)
             self.stdout.write(self.style.SUCCESS(f'✓ Created FAQ entry: {question}'))
 
         # Create 3 completed orders for Ploni Almoni to demonstrate VIP path
@@ -162,7 +174,18 @@ class Command(BaseCommand):
         ploni_customer.refresh_from_db()
         vip_status = '(VIP)' if ploni_customer.vip else '(not VIP yet)'
         self.stdout.write(self.style.SUCCESS(f'Ploni Almoni status: {vip_status}'))
-        self.stdout.write(self.style.SUCCESS('Database populated successfully!'))
 
-        shell_run(['python', 'manage.py', 'migrate'])
-        shell_run(['python', 'manage.py', 'makemigrations', 'air'])
\ No newline at end of file
+        if options['scale']:
+            started = time.perf_counter()
+            counts = generate(options['scale'], seed=options['seed'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Generated {", ".join(f"{n} {name}" for name, n in counts.items())} '
+                f'in {time.perf_counter() - started:.1f}s'
+            ))
+            # bulk_create skips the signals that keep the stored counters
+            # and search indexes current, so rebuild them in one pass each
+            for command in ('rebuild_reputation', 'rebuild_rating_totals', 'reconcile_customer_totals',
+                            'rebuild_faq_index', 'rebuild_search_index'):
+                call_command(command, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS('Database populated successfully!'))
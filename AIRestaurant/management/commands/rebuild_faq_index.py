@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from AIRestaurant.data.faq import FAQEntry, FAQTerm
+from AIRestaurant.faq import index_entries
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuild the FAQ inverted search index from the stored entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        with transaction.atomic():
+            FAQTerm.objects.all().delete()
+            batch = []
+            for entry in FAQEntry.objects.only('id', 'question', 'answer').order_by('id').iterator():
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    index_entries(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                index_entries(batch)
+                total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Indexed {total} FAQ entries ({FAQTerm.objects.count()} terms)'
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from AIRestaurant import ratings
+
+
+class Command(BaseCommand):
+
+    help = 'Recompute running rating totals on products, chefs and deliverers from their ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report stale totals; exit non-zero if any')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stale = ratings.product_mismatches()
+            for p in stale:
+                self.stdout.write(f'Product {p.id} ({p.name}): stored {p.rating_sum}/{p.rating_count}, '
+                                  f'expected {p.expected_sum}/{p.expected_count}')
+            stale_chefs = ratings.chef_mismatches()
+            for c in stale_chefs:
+                self.stdout.write(f'Chef {c.login.username}: stored {c.rating_sum}/{c.rating_count}, '
+                                  f'expected {c.expected_sum}/{c.expected_count}')
+            stale_deliverers = ratings.deliverer_mismatches()
+            for d in stale_deliverers:
+                self.stdout.write(f'Deliverer {d.login.username}: stored {d.rating_sum}/{d.rating_count}, '
+                                  f'expected {d.expected_sum}/{d.expected_count}')
+            if stale or stale_chefs or stale_deliverers:
+                raise CommandError(
+                    f'{len(stale)} product(s), {len(stale_chefs)} chef(s) and '
+                    f'{len(stale_deliverers)} deliverer(s) have stale rating totals.'
+                )
+            self.stdout.write(self.style.SUCCESS('✓ Rating totals are consistent'))
+            return
+
+        with transaction.atomic():
+            changed = ratings.rebuild_product_totals()
+            changed_chefs = ratings.rebuild_chef_totals()
+            changed_deliverers = ratings.rebuild_deliverer_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt rating totals ({changed} product(s), {changed_chefs} chef(s), '
+            f'{changed_deliverers} deliverer(s) updated)'
+        ))
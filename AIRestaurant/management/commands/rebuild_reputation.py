@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from AIRestaurant import reputation
+
+
+class Command(BaseCommand):
+
+    help = 'Recompute stored employee reputation counters from compliments and complaints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report employees whose counters are wrong; exit non-zero if any')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = reputation.find_mismatches()
+            for employee, stored, expected in mismatches:
+                self.stdout.write(f'{employee.login.username}: stored {stored}, expected {expected}')
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} employee(s) have stale reputation counters.')
+            self.stdout.write(self.style.SUCCESS('✓ Reputation counters are consistent'))
+            return
+
+        changed = reputation.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt reputation counters ({changed} employee(s) updated)'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from AIRestaurant import search
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuild the discussion full-text search index'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt search index ({type(backend).__name__})'))
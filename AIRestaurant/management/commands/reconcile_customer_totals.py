@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from AIRestaurant.data.customer import Customer
+from AIRestaurant.data.deliverer import Order
+
+
+class Command(BaseCommand):
+
+    help = "Recompute customers' lifetime order counters from their orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report customers with stale counters; exit non-zero if any')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(customer=OuterRef('pk')).values('customer')
+        customers = (
+            Customer.objects
+            .annotate(
+                expected_count=Coalesce(
+                    Subquery(orders.annotate(n=Count('id')).values('n')[:1]),
+                    Value(0), output_field=IntegerField(),
+                ),
+                expected_spend=Coalesce(
+                    Subquery(orders.annotate(n=Sum('subtotal_cents')).values('n')[:1]),
+                    Value(0), output_field=IntegerField(),
+                ),
+            )
+            .select_related('login')
+            .only('id', 'login__username', 'order_count', 'lifetime_spend_cents')
+        )
+        stale = [
+            c for c in customers
+            if (c.order_count, c.lifetime_spend_cents) != (c.expected_count, c.expected_spend)
+        ]
+
+        if options['check']:
+            for c in stale:
+                self.stdout.write(f'{c.login.username}: stored {c.order_count} orders / {c.lifetime_spend_cents}c, '
+                                  f'expected {c.expected_count} / {c.expected_spend}c')
+            if stale:
+                raise CommandError(f'{len(stale)} customer(s) have stale lifetime counters.')
+            self.stdout.write(self.style.SUCCESS('✓ Customer lifetime counters are consistent'))
+            return
+
+        for c in stale:
+            c.order_count, c.lifetime_spend_cents = c.expected_count, c.expected_spend
+        with transaction.atomic():
+            Customer.objects.bulk_update(stale, ['order_count', 'lifetime_spend_cents'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f'✓ Reconciled lifetime counters ({len(stale)} customer(s) updated)'))
@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from AIRestaurant.data.chef import Product
+from AIRestaurant.data.customer import Customer
+from AIRestaurant.data.deliverer import Order, OrderedDish
+from AIRestaurant.data.users import User
+
+
+class Command(BaseCommand):
+
+    help = 'Fire parallel checkouts at one customer and verify the balance is never overdrawn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--price', type=int, default=1000, help='Price of the test product in cents')
+        parser.add_argument('--affordable', type=int, default=7,
+                            help='How many orders the starting balance covers')
+
+    def handle(self, *args, **options):
+        if options['affordable'] >= options['requests']:
+            raise CommandError('--affordable must be lower than --requests to provoke contention.')
+
+        price = options['price']
+        start_balance = price * options['affordable'] + price // 2
+        user = User.objects.create(
+            username='stress-checkout', email='stress-checkout@example.invalid', type='CU', status='AC',
+        )
+        product = Product.objects.create(name='Stress test dish', price=price, type='food')
+        try:
+            customer = Customer.objects.create(login=user, balance=start_balance)
+            self._run(options, customer, product, start_balance)
+        finally:
+            # Removes the test customer, orders and line items too
+            product.delete()
+            user.delete()
+
+    def _run(self, options, customer, product, start_balance):
+        wave = min(options['concurrency'], options['requests'])
+        start = threading.Barrier(wave)
+
+        def checkout(i):
+            if i < wave:
+                start.wait()  # release the first wave together
+            try:
+                # Every worker starts from the same (stale) balance, like
+                # simultaneous requests would.
+                buyer = Customer.objects.get(pk=customer.pk)
+                buyer.balance = start_balance
+                buyer.order([OrderedDish(product=product, quantity=1)])
+                return 'ok'
+            except ValueError:
+                return 'rejected'
+            except Exception as e:
+                return f'error: {e}'
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            outcomes = list(executor.map(checkout, range(options['requests'])))
+
+        customer.refresh_from_db()
+        orders = Order.objects.filter(customer=customer)
+        charged = orders.aggregate(total=Sum('total_cents'))['total'] or 0
+        succeeded = outcomes.count('ok')
+        errors = [o for o in outcomes if o.startswith('error')]
+
+        self.stdout.write(f'Checkouts: {succeeded} succeeded, {outcomes.count("rejected")} rejected, '
+                          f'{len(errors)} errored')
+        self.stdout.write(f'Balance: {start_balance} -> {customer.balance} cents; '
+                          f'{orders.count()} orders totalling {charged} cents')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'First error: {errors[0]}'))
+
+        problems = []
+        if orders.count() != succeeded:
+            problems.append(f'{orders.count()} orders exist for {succeeded} successful checkouts')
+        if start_balance - customer.balance != charged:
+            problems.append('balance change does not match the charged orders')
+        if succeeded > options['affordable']:
+            problems.append(f'{succeeded} orders succeeded but the balance only covered {options["affordable"]}')
+        if OrderedDish.objects.filter(from_order_num__customer=customer).count() != succeeded:
+            problems.append('line items do not match the orders')
+        if problems:
+            raise CommandError('Double spend detected: ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('✓ No double spend under parallel checkout'))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from AIRestaurant import instrumentation
+from AIRestaurant.data.users import User
+
+DEFAULT_PATHS = ['/', '/menu/', '/merch/', '/faq/', '/discussions/']
+
+
+class Command(BaseCommand):
+
+    help = 'Request pages in-process and report per-view query count, DB, template and wall time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help=f'Page to request (repeatable; default {" ".join(DEFAULT_PATHS)})')
+        parser.add_argument('--user', help='Username to log in as')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per page')
+        parser.add_argument('--format', choices=['table', 'json', 'prometheus'], default='table')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive.')
+        client = Client()
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'No user named {options["user"]}.')
+            client.force_login(user)
+
+        conf = dict(instrumentation.metrics_settings(), ENABLED=True)
+        # The test client talks to the "testserver" host
+        with override_settings(ALLOWED_HOSTS=['testserver'], REQUEST_METRICS=conf):
+            instrumentation.clear()
+            for path in options['paths'] or DEFAULT_PATHS:
+                for _ in range(options['requests']):
+                    client.get(path)
+            rows = instrumentation.report()
+
+        if options['format'] == 'json':
+            output = instrumentation.to_json(rows) + '\n'
+        elif options['format'] == 'prometheus':
+            output = instrumentation.to_prometheus(rows)
+        else:
+            output = self._table(rows)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            self.stdout.write(self.style.SUCCESS(f'Wrote the report for {len(rows)} views to {options["output"]}'))
+        else:
+            self.stdout.write(output, ending='')
+
+    def _table(self, rows):
+        header = f'{"view":<48} {"reqs":>5} {"queries":>8} {"max":>5} {"db ms":>9} {"tpl ms":>9} {"p50 ms":>8} {"p95 ms":>8}'
+        lines = [header, '-' * len(header)]
+        for row in rows:
+            n = row['requests']
+            lines.append(
+                f'{row["view"][-48:]:<48} {n:>5} {row["queries_mean"]:>8.1f} {row["queries_max"]:>5} '
+                f'{row["db_ms_total"] / n:>9.2f} {row["template_ms_total"] / n:>9.2f} '
+                f'{row["wall_ms_p50"]:>8.2f} {row["wall_ms_p95"]:>8.2f}'
+            )
+        lines.append('(queries, db ms and tpl ms are per request)')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 14:00
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_existing_entries(apps, schema_editor):
+    FAQEntry = apps.get_model('air', 'FAQEntry')
+    FAQTerm = apps.get_model('air', 'FAQTerm')
+    FAQTerm.objects.bulk_create(
+        [
+            FAQTerm(entry_id=entry_id, token=token)
+            for entry_id, question in FAQEntry.objects.values_list('id', 'question').iterator()
+            for token in set(re.findall(r'\b\w+\b', question.lower()))
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0017_cachedanswer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FAQTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=300)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='air.faqentry')),
+            ],
+            options={
+                'unique_together': {('token', 'entry')},
+            },
+        ),
+        migrations.RunPython(index_existing_entries, migrations.RunPython.noop),
+    ]
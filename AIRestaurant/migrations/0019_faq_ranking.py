@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 14:02
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def reindex_entries(apps, schema_editor):
+    FAQEntry = apps.get_model('air', 'FAQEntry')
+    FAQTerm = apps.get_model('air', 'FAQTerm')
+    FAQTerm.objects.all().delete()
+    terms = []
+    for entry in FAQEntry.objects.only('id', 'question', 'answer').iterator():
+        question_words = set(re.findall(r'\b\w+\b', entry.question.lower()))
+        counts = Counter(re.findall(r'\b\w+\b', f"{entry.question}\n{entry.answer}".lower()))
+        FAQEntry.objects.filter(pk=entry.pk).update(length=sum(counts.values()))
+        terms.extend(
+            FAQTerm(entry_id=entry.pk, token=token, in_question=token in question_words, frequency=n)
+            for token, n in counts.items()
+        )
+    FAQTerm.objects.bulk_create(terms, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0018_faqterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faqentry',
+            name='length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='faqterm',
+            name='frequency',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='faqterm',
+            name='in_question',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='faqentry',
+            index=models.Index(fields=['-created_at', '-id'], name='faq_newest_idx'),
+        ),
+        migrations.RunPython(reindex_entries, migrations.RunPython.noop),
+    ]
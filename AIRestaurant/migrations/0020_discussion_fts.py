@@ -0,0 +1,35 @@
+# Full-text index for discussion search (SQLite only; see search.py)
+
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS air_discussion_fts USING fts5(body, thread_id UNINDEXED)'
+    )
+    schema_editor.execute(
+        'INSERT INTO air_discussion_fts (rowid, body, thread_id) '
+        'SELECT 2 * id + 1, title, id FROM air_thread'
+    )
+    schema_editor.execute(
+        'INSERT INTO air_discussion_fts (rowid, body, thread_id) '
+        'SELECT 2 * id, message, thread_id FROM air_message'
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS air_discussion_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0019_faq_ranking'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-18 14:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    Customer = apps.get_model('air', 'Customer')
+    Employee = apps.get_model('air', 'Employee')
+    Compliment = apps.get_model('air', 'Compliment')
+    Complaint = apps.get_model('air', 'Complaint')
+
+    vip_ids = Customer.objects.filter(vip=True).values('login_id')
+    rows = {}
+    for model, filters, total, vip in (
+        (Compliment, {}, 'compliments', 'compliments_vip'),
+        (Complaint, {'status': 'v'}, 'valid_complaints', 'valid_complaints_vip'),
+    ):
+        grouped = (
+            model.objects.filter(to__isnull=False, **filters)
+            .values('to')
+            .annotate(total=Count('id'), vip=Count('id', filter=Q(sender_id__in=vip_ids)))
+        )
+        for row in grouped:
+            counts = rows.setdefault(row['to'], {})
+            counts[total] = row['total']
+            counts[vip] = row['vip']
+    for login_id, counts in rows.items():
+        Employee.objects.filter(login_id=login_id).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0021_message_thread_when_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='compliments',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='compliments_vip',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='valid_complaints',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='valid_complaints_vip',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
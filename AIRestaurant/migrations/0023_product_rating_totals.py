@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 15:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Product = apps.get_model('air', 'Product')
+    ProductRating = apps.get_model('air', 'ProductRating')
+    totals = ProductRating.objects.values('product').annotate(total=Sum('rating'), count=Count('id'))
+    for row in totals:
+        Product.objects.filter(pk=row['product']).update(rating_sum=row['total'], rating_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0022_employee_reputation_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 15:30
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Employee = apps.get_model('air', 'Employee')
+    Product = apps.get_model('air', 'Product')
+    totals = (
+        Product.objects.filter(type='food', creator__isnull=False)
+        .values('creator')
+        .annotate(total=Sum('rating_sum'), count=Sum('rating_count'))
+    )
+    for row in totals:
+        Employee.objects.filter(pk=row['creator']).update(rating_sum=row['total'], rating_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0023_product_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 16:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Employee = apps.get_model('air', 'Employee')
+    Order = apps.get_model('air', 'Order')
+    totals = (
+        Order.objects.filter(assigned_deliverer__isnull=False, rating__isnull=False)
+        .values('assigned_deliverer')
+        .annotate(total=Sum('rating'), count=Count('id'))
+    )
+    for row in totals:
+        Employee.objects.filter(login_id=row['assigned_deliverer']).update(
+            rating_sum=row['total'], rating_count=row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0024_chef_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('rating__isnull', False)), fields=['assigned_deliverer', '-date', '-id'], name='order_rated_by_deliverer_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 16:30
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Order = apps.get_model('air', 'Order')
+    OrderedDish = apps.get_model('air', 'OrderedDish')
+    Product = apps.get_model('air', 'Product')
+
+    # Historic prices were never recorded; the current price is the best
+    # snapshot available.
+    OrderedDish.objects.filter(unit_price_cents__isnull=True).update(
+        unit_price_cents=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]),
+    )
+    # Nor were VIP discounts, so legacy orders keep total == subtotal.
+    subtotals = (
+        OrderedDish.objects.filter(from_order_num=OuterRef('pk'))
+        .values('from_order_num')
+        .annotate(total=Sum(F('unit_price_cents') * F('quantity')))
+        .values('total')[:1]
+    )
+    Order.objects.update(subtotal_cents=Coalesce(Subquery(subtotals), Value(0)))
+    Order.objects.update(total_cents=F('subtotal_cents'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0025_deliverer_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount_cents',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal_cents',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_cents',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ordereddish',
+            name='unit_price_cents',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
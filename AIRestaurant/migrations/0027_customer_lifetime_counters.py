@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 17:00
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_counters(apps, schema_editor):
+    Customer = apps.get_model('air', 'Customer')
+    Order = apps.get_model('air', 'Order')
+    totals = (
+        Order.objects.filter(customer__isnull=False)
+        .values('customer')
+        .annotate(count=Count('id'), spent=Sum('subtotal_cents'))
+    )
+    for row in totals:
+        Customer.objects.filter(pk=row['customer']).update(
+            order_count=row['count'], lifetime_spend_cents=row['spent'] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0026_order_stored_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_spend_cents',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
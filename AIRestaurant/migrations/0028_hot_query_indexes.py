@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('air', '0027_customer_lifetime_counters'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['to', 'status'], name='complaint_to_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', '-id'], name='complaint_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compliment',
+            index=models.Index(fields=['to', 'sender'], name='compliment_to_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-date', '-id'], name='order_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', '-date'], name='order_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['assigned_deliverer', '-date'], name='order_deliverer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plea',
+            index=models.Index(fields=['-created_at', '-id'], name='plea_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['type', 'vip_exclusive'], name='product_type_vip_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reportedfaq',
+            index=models.Index(fields=['status', '-reported_at'], name='reportedfaq_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['status', 'type'], name='user_status_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['type'], name='user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['status', 'date_joined'], name='user_status_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+"""
+Resolve the Customer/Chef/Deliverer/Manager row behind a user once.
+
+`get_profile(user)` memoizes the profile on the user object, and
+ProfileMiddleware exposes it lazily as `request.profile`. Since
+`request.user` is the same object for the whole request, the view, the
+templates (`user.is_vip`) and any helpers share a single lookup. When
+the user has no profile, `request.profile` wraps None and is falsy.
+
+Setting PROFILE_CACHE_TTL to a number of seconds also keeps profiles in
+the default cache between requests. Cached profiles can be that many
+seconds old, so code that writes to a profile should ask for a
+`fresh=True` copy; saving a profile in this process drops its cache
+entry (see signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .data.chef import Chef
+from .data.customer import Customer
+from .data.deliverer import Deliverer
+from .data.manager import Manager
+
+PROFILE_MODELS = {'CU': Customer, 'CH': Chef, 'DL': Deliverer, 'MN': Manager}
+
+
+def cache_ttl():
+    return getattr(settings, 'PROFILE_CACHE_TTL', 0) or 0
+
+
+def _key(user_id):
+    return f'user-profile:{user_id}'
+
+
+def load_profile(user):
+    """Query the profile row of `user`, or None."""
+    model = PROFILE_MODELS.get(getattr(user, 'type', None))
+    if model is None:
+        return None
+    return model.objects.filter(login_id=user.pk).first()
+
+
+def get_profile(user, fresh=False):
+    """The profile of `user`, looked up at most once per user object.
+
+    `fresh=True` skips the cross-request cache (but not a profile this
+    request already loaded from the database).
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    memo = getattr(user, '_profile_memo', None)
+    if memo is not None and (not fresh or not memo[1]):
+        return memo[0]
+
+    profile, from_cache = None, False
+    ttl = cache_ttl()
+    if ttl and not fresh:
+        hit = cache.get(_key(user.pk))
+        if hit is not None:
+            profile, from_cache = hit[0], True
+    if not from_cache:
+        profile = load_profile(user)
+        if ttl:
+            cache.set(_key(user.pk), (profile,), ttl)
+    if profile is not None:
+        # Reuse the request's user instead of loading `login` again
+        profile.login = user
+    user._profile_memo = (profile, from_cache)
+    return profile
+
+
+def forget(user_id):
+    """Drop the cached profile of `user_id` (no-op without a cache TTL)."""
+    if cache_ttl() and user_id is not None:
+        cache.delete(_key(user_id))
+
+
+class ProfileMiddleware:
+    """Attach the lazily resolved `request.profile`.
+
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request.user))
+        return self.get_response(request)
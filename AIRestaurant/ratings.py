@@ -0,0 +1,128 @@
+"""
+Running rating totals.
+
+Products keep `rating_sum` / `rating_count` columns that the signal
+handlers in signals.py adjust with F() expressions as ratings are saved
+or deleted, so averages never need a scan of ProductRating. Chefs keep
+the same pair of columns on their Employee row, covering every rating of
+the food products they created; deliverers use it for the ratings of
+the orders assigned to them. The functions here recompute the totals
+from scratch for backfills and consistency checks.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .data.chef import Chef, Product, ProductRating
+from .data.deliverer import Deliverer, Order
+
+
+def _product_totals():
+    ratings = ProductRating.objects.filter(product=OuterRef('pk')).values('product')
+    return {
+        'expected_sum': Coalesce(
+            Subquery(ratings.annotate(total=Sum('rating')).values('total')[:1]),
+            Value(0), output_field=IntegerField(),
+        ),
+        'expected_count': Coalesce(
+            Subquery(ratings.annotate(total=Count('id')).values('total')[:1]),
+            Value(0), output_field=IntegerField(),
+        ),
+    }
+
+
+def product_mismatches():
+    """Products whose stored totals differ from their ratings."""
+    products = Product.objects.annotate(**_product_totals()).only('id', 'name', 'rating_sum', 'rating_count')
+    return [
+        p for p in products
+        if (p.rating_sum, p.rating_count) != (p.expected_sum, p.expected_count)
+    ]
+
+
+def rebuild_product_totals():
+    """Rewrite stale product totals; returns how many products changed."""
+    stale = product_mismatches()
+    for p in stale:
+        p.rating_sum, p.rating_count = p.expected_sum, p.expected_count
+    Product.objects.bulk_update(stale, ['rating_sum', 'rating_count'], batch_size=500)
+    return len(stale)
+
+
+def _chef_totals():
+    ratings = (
+        ProductRating.objects
+        .filter(product__type='food', product__creator=OuterRef('pk'))
+        .values('product__creator')
+    )
+    return {
+        'expected_sum': Coalesce(
+            Subquery(ratings.annotate(total=Sum('rating')).values('total')[:1]),
+            Value(0), output_field=IntegerField(),
+        ),
+        'expected_count': Coalesce(
+            Subquery(ratings.annotate(total=Count('id')).values('total')[:1]),
+            Value(0), output_field=IntegerField(),
+        ),
+    }
+
+
+def chef_mismatches():
+    """Chefs whose stored totals differ from their food products' ratings."""
+    chefs = (
+        Chef.objects.annotate(**_chef_totals())
+        .select_related('login')
+        .only('id', 'login__username', 'rating_sum', 'rating_count')
+    )
+    return [
+        c for c in chefs
+        if (c.rating_sum, c.rating_count) != (c.expected_sum, c.expected_count)
+    ]
+
+
+def rebuild_chef_totals():
+    """Rewrite stale chef totals; returns how many chefs changed."""
+    stale = chef_mismatches()
+    for c in stale:
+        c.rating_sum, c.rating_count = c.expected_sum, c.expected_count
+    Chef.objects.bulk_update(stale, ['rating_sum', 'rating_count'], batch_size=500)
+    return len(stale)
+
+
+def _deliverer_totals():
+    orders = (
+        Order.objects
+        .filter(assigned_deliverer=OuterRef('login'), rating__isnull=False)
+        .values('assigned_deliverer')
+    )
+    return {
+        'expected_sum': Coalesce(
+            Subquery(orders.annotate(total=Sum('rating')).values('total')[:1]),
+            Value(0), output_field=IntegerField(),
+        ),
+        'expected_count': Coalesce(
+            Subquery(orders.annotate(total=Count('id')).values('total')[:1]),
+            Value(0), output_field=IntegerField(),
+        ),
+    }
+
+
+def deliverer_mismatches():
+    """Deliverers whose stored totals differ from their orders' ratings."""
+    deliverers = (
+        Deliverer.objects.annotate(**_deliverer_totals())
+        .select_related('login')
+        .only('id', 'login__username', 'rating_sum', 'rating_count')
+    )
+    return [
+        d for d in deliverers
+        if (d.rating_sum, d.rating_count) != (d.expected_sum, d.expected_count)
+    ]
+
+
+def rebuild_deliverer_totals():
+    """Rewrite stale deliverer totals; returns how many deliverers changed."""
+    stale = deliverer_mismatches()
+    for d in stale:
+        d.rating_sum, d.rating_count = d.expected_sum, d.expected_count
+    Deliverer.objects.bulk_update(stale, ['rating_sum', 'rating_count'], batch_size=500)
+    return len(stale)
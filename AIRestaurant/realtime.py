@@ -0,0 +1,259 @@
+"""
+Real-time delivery of new discussion messages over WebSockets.
+
+The ASGI application in asgi.py hands `/ws/thread/<id>/` connections to
+`websocket_application`, which subscribes the socket to that thread on
+the configured broker. Views call `publish_message` after saving a
+message. The default in-memory broker only reaches sockets served by the
+same process; set REALTIME["BROKER"] to the Redis broker when running
+several workers. WebSockets need an ASGI server (uvicorn, daphne, ...);
+under WSGI messages are simply not pushed.
+
+Sockets are authenticated from the session cookie: only logged-in,
+active users are accepted, and only from an allowed Origin.
+"""
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+from contextlib import suppress
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.http import parse_cookie
+from django.http.request import split_domain_port, validate_host
+from django.utils.module_loading import import_string
+
+from .data.message import Message, Thread
+
+_THREAD_PATH = re.compile(r'^/ws/thread/(\d+)/?$')
+
+# First item of every subscription: the broker is now delivering messages
+SUBSCRIBED = object()
+
+
+def realtime_settings():
+    conf = {'BROKER': 'AIRestaurant.realtime.InMemoryBroker', 'REDIS_URL': None}
+    conf.update(getattr(settings, 'REALTIME', {}) or {})
+    return conf
+
+
+def channel_name(thread_id):
+    return f'thread.{thread_id}'
+
+
+def message_payload(message):
+    """JSON-friendly form of a message, shared with the thread JSON endpoint."""
+    return {
+        'id': message.id,
+        'message': message.message,
+        'when': message.when.isoformat(),
+        'who': message.who.username if message.who else None,
+        'who_id': message.who_id,
+    }
+
+
+class InMemoryBroker:
+    """Fan-out to sockets of this process only.
+
+    `publish` may be called from any thread (sync views run in a worker
+    thread under ASGI); payloads are handed to each subscriber's event
+    loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            with suppress(RuntimeError):  # loop already closed
+                loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+    async def subscribe(self, channel):
+        """Async iterator over payloads published to `channel`.
+
+        Yields SUBSCRIBED first, once payloads can no longer be missed.
+        """
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[channel].add(entry)
+        try:
+            yield SUBSCRIBED
+            while True:
+                yield await entry[1].get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(entry)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisBroker:
+    """Redis pub/sub broker so every worker sees every message."""
+
+    prefix = 'air.'
+
+    def __init__(self, url=None):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the redis package (pip install redis).')
+        self.url = url or realtime_settings()['REDIS_URL'] or 'redis://localhost:6379/0'
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, payload):
+        self._client.publish(self.prefix + channel, json.dumps(payload))
+
+    async def subscribe(self, channel):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.prefix + channel)
+        try:
+            async for item in pubsub.listen():
+                # SUBSCRIBE is only in effect once Redis confirms it
+                if item['type'] == 'subscribe':
+                    yield SUBSCRIBED
+                elif item['type'] == 'message':
+                    yield json.loads(item['data'])
+        finally:
+            with suppress(Exception):
+                await pubsub.unsubscribe()
+                await pubsub.aclose()
+                await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Process-wide broker, created from settings on first use."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(realtime_settings()['BROKER'])()
+        return _broker
+
+
+def publish_message(message):
+    """Push a newly saved message to the thread's subscribers.
+
+    Delivery waits for the surrounding transaction to commit so clients
+    never see a message that was rolled back.
+    """
+    payload = message_payload(message)
+    channel = channel_name(message.thread_id)
+    transaction.on_commit(lambda: get_broker().publish(channel, payload))
+
+
+@sync_to_async
+def _missed_messages(thread_id, after_id):
+    qs = Message.objects.filter(thread_id=thread_id, id__gt=after_id).select_related('who')
+    return [message_payload(m) for m in qs.order_by('when', 'id')[:100]]
+
+
+def _after_id(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        return int(query.get('after', ['0'])[0])
+    except ValueError:
+        return 0
+
+
+@sync_to_async
+def _thread_exists(thread_id):
+    return Thread.objects.filter(pk=thread_id).exists()
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _allowed_origin(scope):
+    """Browsers always send Origin; refuse pages from other sites."""
+    origin = _header(scope, b'origin')
+    if origin is None:
+        return True
+    domain, _port = split_domain_port(urlsplit(origin).netloc)
+    # The hosts HttpRequest.get_host() accepts
+    allowed = settings.ALLOWED_HOSTS or (['.localhost', '127.0.0.1', '[::1]'] if settings.DEBUG else [])
+    return bool(domain) and validate_host(domain, allowed)
+
+
+@sync_to_async
+def _session_user(scope):
+    """The active user logged in with the socket's session cookie, or None."""
+    session_key = parse_cookie(_header(scope, b'cookie') or '').get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    user = auth.get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    # Same gate as logging in: pending and suspended accounts are refused
+    if not user.is_authenticated or getattr(user, 'status', 'AC') != 'AC':
+        return None
+    return user
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI app for `/ws/thread/<id>/`; sends each new message as JSON.
+
+    An optional `after=<message id>` query parameter replays messages
+    saved since the client last saw one, e.g. after a reconnect.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    if not _allowed_origin(scope) or await _session_user(scope) is None:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    match = _THREAD_PATH.match(scope['path'])
+    if not match or not await _thread_exists(int(match.group(1))):
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    thread_id = int(match.group(1))
+    await send({'type': 'websocket.accept'})
+
+    async def forward():
+        subscription = get_broker().subscribe(channel_name(thread_id))
+        try:
+            # Replay only once the subscription is confirmed, so nothing
+            # published in between is lost
+            await subscription.__anext__()
+            seen = _after_id(scope)
+            if seen:
+                for payload in await _missed_messages(thread_id, seen):
+                    await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+                    seen = max(seen, payload['id'])
+            async for payload in subscription:
+                if payload['id'] > seen:
+                    await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+        finally:
+            await subscription.aclose()
+
+    task = asyncio.ensure_future(forward())
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            # Anything the client sends (keep-alive pings) is ignored
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await task
@@ -0,0 +1,99 @@
+"""
+Stored employee reputation counters.
+
+`Employee.score()` reads four counters kept on the employee row. The
+signal handlers in signals.py adjust them through `adjust` whenever a
+compliment or complaint changes or a customer's VIP flag flips; the
+functions here recompute them from scratch for backfills and checks.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, Q
+
+from .data.customer import Customer
+from .data.message import Complaint, Compliment
+from .data.users import Employee
+
+COUNTERS = ('compliments', 'compliments_vip', 'valid_complaints', 'valid_complaints_vip')
+
+
+def is_vip_user(user_id):
+    """True if `user_id` belongs to a VIP customer."""
+    if user_id is None:
+        return False
+    return Customer.objects.filter(login_id=user_id, vip=True).exists()
+
+
+def score_expression():
+    """SQL form of `Employee.score()`, for annotating and ordering querysets."""
+    return F('compliments') + F('compliments_vip') - F('valid_complaints') - F('valid_complaints_vip')
+
+
+def adjust(login_id, **deltas):
+    """Add `deltas` to the counters of the employee logging in as `login_id`."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if login_id is None or not deltas:
+        return
+    Employee.objects.filter(login_id=login_id).update(
+        **{name: F(name) + delta for name, delta in deltas.items()}
+    )
+
+
+def expected_counters():
+    """Recount every employee's counters with grouped queries.
+
+    Returns {login_id: {counter: value}} for users that have received at
+    least one compliment or valid complaint.
+    """
+    vip_ids = Customer.objects.filter(vip=True).values('login_id')
+    counts = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    compliments = (
+        Compliment.objects.filter(to__isnull=False)
+        .values('to')
+        .annotate(
+            total=Count('id'),
+            vip=Count('id', filter=Q(sender_id__in=vip_ids)),
+        )
+    )
+    for row in compliments:
+        counts[row['to']]['compliments'] = row['total']
+        counts[row['to']]['compliments_vip'] = row['vip']
+
+    complaints = (
+        Complaint.objects.filter(to__isnull=False, status='v')
+        .values('to')
+        .annotate(
+            total=Count('id'),
+            vip=Count('id', filter=Q(sender_id__in=vip_ids)),
+        )
+    )
+    for row in complaints:
+        counts[row['to']]['valid_complaints'] = row['total']
+        counts[row['to']]['valid_complaints_vip'] = row['vip']
+    return counts
+
+
+def find_mismatches():
+    """List (employee, stored, expected) for employees with wrong counters."""
+    expected = expected_counters()
+    zero = dict.fromkeys(COUNTERS, 0)
+    mismatches = []
+    for employee in Employee.objects.select_related('login').only('id', 'login__username', *COUNTERS):
+        stored = {name: getattr(employee, name) for name in COUNTERS}
+        wanted = expected.get(employee.login_id, zero)
+        if stored != wanted:
+            mismatches.append((employee, stored, wanted))
+    return mismatches
+
+
+def rebuild():
+    """Rewrite every employee's counters; returns how many changed."""
+    mismatches = find_mismatches()
+    employees = []
+    for employee, _stored, wanted in mismatches:
+        for name, value in wanted.items():
+            setattr(employee, name, value)
+        employees.append(employee)
+    Employee.objects.bulk_update(employees, COUNTERS, batch_size=500)
+    return len(employees)
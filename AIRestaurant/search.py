@@ -0,0 +1,208 @@
+"""
+Full-text search over discussion thread titles and message bodies.
+
+The backend is chosen by the DISCUSSION_SEARCH_BACKEND setting (a dotted
+path); by default SQLite databases use an FTS5 index and anything else
+falls back to a plain LIKE search. Receivers in signals.py call the
+index_* / remove_* helpers whenever a thread or message is saved or
+deleted (cascades and admin edits included), so the index stays current
+without periodic rebuilds. Bulk inserts and queryset updates bypass
+them; run `rebuild_search_index` after those.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .data.message import Message, Thread
+
+# Private-use markers placed around matches before HTML escaping
+_OPEN, _CLOSE = '\ue000', '\ue001'
+
+
+def _highlight(text):
+    """Escape `text` and turn match markers into <mark> tags."""
+    return mark_safe(
+        escape(text).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+    )
+
+
+def _terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+class SearchHit:
+    """One matching thread with its rank and highlighted fragments."""
+
+    def __init__(self, thread_id, rank, title_html=None, snippet_html=None):
+        self.thread_id = thread_id
+        self.rank = rank
+        self.title_html = title_html
+        self.snippet_html = snippet_html
+
+
+class BaseSearchBackend:
+    """Interface every discussion search backend implements."""
+
+    def search(self, query, limit=50):
+        """Return up to `limit` SearchHits, best match first."""
+        raise NotImplementedError()
+
+    def index_thread(self, thread):
+        pass
+
+    def index_message(self, message):
+        pass
+
+    def remove_thread(self, thread_id, message_ids=()):
+        pass
+
+    def remove_message(self, message_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Unindexed LIKE search for databases without FTS support."""
+
+    def search(self, query, limit=50):
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        hits = []
+        threads = Thread.objects.all()
+        for term in terms:
+            threads = threads.filter(Q(title__icontains=term) | Q(message__message__icontains=term))
+        threads = list(threads.distinct().order_by('-creation_date')[:limit])
+        pattern = re.compile('|'.join(re.escape(t) for t in terms), re.IGNORECASE)
+
+        # Latest matching message of every hit thread, in one query
+        latest = {}
+        for thread_id, message in (
+            Message.objects.filter(thread__in=threads, message__iregex=pattern.pattern)
+            .order_by('thread_id', '-when', '-id').values_list('thread_id', 'message')
+        ):
+            latest.setdefault(thread_id, message)
+
+        for t in threads:
+            title = pattern.sub(lambda m: _OPEN + m.group(0) + _CLOSE, t.title)
+            match = latest.get(t.id)
+            snippet = pattern.sub(lambda m: _OPEN + m.group(0) + _CLOSE, match) if match else None
+            hits.append(SearchHit(
+                t.id,
+                len(hits),
+                _highlight(title) if _OPEN in title else None,
+                _highlight(snippet) if snippet else None,
+            ))
+        return hits
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """FTS5 index with bm25 ranking.
+
+    Row ids encode what a row is: 2*id+1 for a thread title, 2*id for a
+    message body, so updates and deletes go straight to the row.
+    """
+
+    table = 'air_discussion_fts'
+
+    def _execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _upsert(self, rowid, thread_id, body):
+        self._execute(f'DELETE FROM {self.table} WHERE rowid = %s', [rowid])
+        self._execute(
+            f'INSERT INTO {self.table} (rowid, body, thread_id) VALUES (%s, %s, %s)',
+            [rowid, body, thread_id],
+        )
+
+    def index_thread(self, thread):
+        self._upsert(2 * thread.id + 1, thread.id, thread.title)
+
+    def index_message(self, message):
+        self._upsert(2 * message.id, message.thread_id, message.message)
+
+    def remove_thread(self, thread_id, message_ids=()):
+        rowids = [2 * thread_id + 1] + [2 * m for m in message_ids]
+        placeholders = ', '.join(['%s'] * len(rowids))
+        self._execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', rowids)
+
+    def remove_message(self, message_id):
+        self._execute(f'DELETE FROM {self.table} WHERE rowid = %s', [2 * message_id])
+
+    def search(self, query, limit=50):
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        # Quote every term (prefix match) so user input is never parsed
+        # as FTS5 query syntax.
+        match = ' '.join('"%s"*' % t for t in terms)
+        rows = self._execute(
+            f'SELECT rowid, thread_id, bm25({self.table}) AS rank, '
+            f"snippet({self.table}, 0, %s, %s, '…', 16) "
+            f'FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s',
+            [_OPEN, _CLOSE, match, limit * 5],
+        )
+
+        hits = {}
+        for rowid, thread_id, rank, fragment in rows:
+            hit = hits.get(thread_id)
+            if hit is None:
+                hit = hits[thread_id] = SearchHit(thread_id, rank)
+            if rowid % 2:
+                hit.title_html = hit.title_html or _highlight(fragment)
+            else:
+                hit.snippet_html = hit.snippet_html or _highlight(fragment)
+        return list(hits.values())[:limit]
+
+    def rebuild(self):
+        self._execute(f'DROP TABLE IF EXISTS {self.table}')
+        self._execute(f'CREATE VIRTUAL TABLE {self.table} USING fts5(body, thread_id UNINDEXED)')
+        self._execute(
+            f'INSERT INTO {self.table} (rowid, body, thread_id) '
+            f'SELECT 2 * id + 1, title, id FROM {Thread._meta.db_table}'
+        )
+        self._execute(
+            f'INSERT INTO {self.table} (rowid, body, thread_id) '
+            f'SELECT 2 * id, message, thread_id FROM {Message._meta.db_table}'
+        )
+
+
+def get_backend():
+    path = getattr(settings, 'DISCUSSION_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return SimpleSearchBackend()
+
+
+def search_threads(query, limit=50):
+    return get_backend().search(query, limit=limit)
+
+
+def index_thread(thread):
+    get_backend().index_thread(thread)
+
+
+def index_message(message):
+    get_backend().index_message(message)
+
+
+def remove_thread(thread_id):
+    """Drop a thread's title (its messages are removed as they are deleted)."""
+    get_backend().remove_thread(thread_id)
+
+
+def remove_message(message_id):
+    get_backend().remove_message(message_id)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,11 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "AIRestaurant.instrumentation.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "AIRestaurant.cart.CartMiddleware",
+    "AIRestaurant.profiles.ProfileMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -53,7 +57,7 @@ ROOT_URLCONF = "AIRestaurant.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "AIRestaurant.instrumentation.TimedDjangoTemplates",
         "DIRS": [ BASE_DIR / "templates" ],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -77,6 +81,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "AIRestaurant/db.sqlite3",
+        # A file rather than in-memory: the concurrent checkout test needs
+        # real SQLite locking between threads
+        "TEST": {"NAME": BASE_DIR / "AIRestaurant/test_db.sqlite3"},
     }
 }
 
@@ -137,4 +144,89 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost', 'SapphireBrick613.pythonanywhere.com']
 
-AUTH_USER_MODEL = 'air.User' 
\ No newline at end of file
+AUTH_USER_MODEL = 'air.User'
+
+# AI chat model pool (see AIRestaurant/llm.py).
+# BACKEND is one of "auto", "llama_cpp", "llama-run" or "stub"; "auto"
+# keeps the model in memory when llama-cpp-python is installed.
+AI_CHAT = {
+    "BACKEND": os.environ.get("AI_CHAT_BACKEND", "auto"),
+    "MODEL_PATH": os.environ.get("AI_MODEL_PATH"),
+    "WORKERS": 1,
+    "QUEUE_SIZE": 32,
+    "TIMEOUT": 120,  # seconds, including time spent queued
+    "MAX_TOKENS": 256,
+    # Load the model when the ASGI/WSGI server process starts instead of
+    # on the first chat (management commands never load it)
+    "PRELOAD": False,
+}
+
+# Persistent AI answer cache (see AIRestaurant/answer_cache.py)
+AI_ANSWER_CACHE = {
+    "ENABLED": True,
+    "TTL": 7 * 24 * 3600,  # seconds
+    "MAX_ENTRIES": 5000,
+}
+
+# Discussion full-text search backend (see AIRestaurant/search.py).
+# None picks SQLite FTS5 on SQLite and a LIKE search elsewhere.
+DISCUSSION_SEARCH_BACKEND = None
+
+# Live thread updates over WebSockets (see AIRestaurant/realtime.py).
+# The in-memory broker only reaches sockets of the same process; use
+# "AIRestaurant.realtime.RedisBroker" with REDIS_URL for several workers.
+REALTIME = {
+    "BROKER": os.environ.get("REALTIME_BROKER", "AIRestaurant.realtime.InMemoryBroker"),
+    "REDIS_URL": os.environ.get("REDIS_URL"),
+}
+
+# Shared by every worker process: a database table (created by migration
+# 0029) or, when REDIS_URL is set, Redis. A process-local cache would let
+# other workers keep serving data that was invalidated elsewhere.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "air_cache",
+        }
+    }
+
+# Cached menu/merch catalog (see AIRestaurant/catalog.py). It is not
+# cached in a process-local (LocMem) cache unless LOCAL is True, which
+# is only safe with a single worker process.
+MENU_CATALOG = {
+    "CACHE": "default",
+    "TIMEOUT": 300,  # seconds
+    "LOCAL": False,
+}
+
+# Number of most recent rated deliveries whose average drives deliverer
+# promotions and demotions (see Deliverer.recent_average).
+DELIVERER_RATING_WINDOW = 10
+
+# Where shopping carts live (see AIRestaurant/cart.py). The signed cookie
+# keeps cart edits off the session store; "AIRestaurant.cart.SessionCart"
+# stores them in the session instead.
+CART_BACKEND = "AIRestaurant.cart.SignedCookieCart"
+
+# Seconds to keep users' Customer/Chef/Deliverer/Manager rows in the
+# cache between requests (see AIRestaurant/profiles.py); 0 disables it.
+PROFILE_CACHE_TTL = 0
+
+# Per-view query count and latency metrics (see AIRestaurant/instrumentation.py).
+# Off unless REQUEST_METRICS=1 is set, since every query pays for the
+# wrapper. Each process keeps the last BUFFER_SIZE requests;
+# QUERY_COUNT_HEADER adds X-Query-Count and X-DB-Time-Ms response headers
+# for load-test runs.
+REQUEST_METRICS = {
+    "ENABLED": os.environ.get("REQUEST_METRICS") == "1",
+    "BUFFER_SIZE": 2000,
+    "QUERY_COUNT_HEADER": os.environ.get("QUERY_COUNT_HEADER") == "1",
+}
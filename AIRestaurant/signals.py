@@ -0,0 +1,356 @@
+"""
+Signal handlers keeping denormalized data in step with their sources.
+
+Connected from AIRestaurantConfig.ready(). Instances remember the values
+they were loaded with (post_init, or pre_save when those fields were
+deferred) so a save can take back the old contribution before adding the
+new one; deletes re-read the row so a stale instance cannot skew the
+counters. Counter updates run inside the saving transaction. Queryset
+.update()/bulk_create() bypass signals; run `rebuild_reputation` and
+`rebuild_rating_totals` after such bulk changes. Product and rating
+writes also drop the cached menu catalog once they commit, and profile
+writes drop the user's cached profile. Thread and message writes update
+the discussion search index in the same transaction.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import catalog, profiles, reputation, search
+from .data.chef import Chef, Product, ProductRating
+from .data.customer import Customer
+from .data.deliverer import Deliverer, Order
+from .data.manager import Manager
+from .data.users import Employee, User
+from .data.message import Complaint, Compliment, Message, Thread
+
+
+def _feedback_contribution(kind, to_id, sender_id, status=None):
+    """(login_id, counter deltas) one compliment/complaint contributes."""
+    if kind is Complaint and status != 'v':
+        return to_id, {}
+    vip = 1 if reputation.is_vip_user(sender_id) else 0
+    if kind is Compliment:
+        return to_id, {'compliments': 1, 'compliments_vip': vip}
+    return to_id, {'valid_complaints': 1, 'valid_complaints_vip': vip}
+
+
+def _feedback_state(instance):
+    return (instance.to_id, instance.sender_id, getattr(instance, 'status', None))
+
+
+def _loaded(instance, *fields):
+    """True if none of `fields` is deferred (reading them costs no query)."""
+    return not instance.get_deferred_fields().intersection(fields)
+
+
+def _apply(login_id, deltas, sign):
+    reputation.adjust(login_id, **{name: sign * delta for name, delta in deltas.items()})
+
+
+@receiver(post_init, sender=Compliment)
+@receiver(post_init, sender=Complaint)
+def remember_feedback(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._reputation_state = None
+    elif _loaded(instance, 'to', 'sender', 'status'):
+        instance._reputation_state = _feedback_state(instance)
+
+
+@receiver(pre_save, sender=Compliment)
+@receiver(pre_save, sender=Complaint)
+def load_feedback_state(sender, instance, raw=False, **kwargs):
+    if raw or hasattr(instance, '_reputation_state'):
+        return
+    row = sender.objects.filter(pk=instance.pk).first()
+    instance._reputation_state = _feedback_state(row) if row else None
+
+
+@receiver(post_save, sender=Compliment)
+@receiver(post_save, sender=Complaint)
+def count_feedback(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_reputation_state', None)
+    new = _feedback_state(instance)
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None:
+            _apply(*_feedback_contribution(sender, *old), -1)
+        _apply(*_feedback_contribution(sender, *new), 1)
+    instance._reputation_state = new
+
+
+@receiver(pre_delete, sender=Compliment)
+@receiver(pre_delete, sender=Complaint)
+def uncount_feedback(sender, instance, **kwargs):
+    # pre_delete runs inside the deletion's transaction, before any
+    # SET_NULL cascade clears sender_id
+    row = sender.objects.filter(pk=instance.pk).first()
+    if row is not None:
+        _apply(*_feedback_contribution(sender, *_feedback_state(row)), -1)
+
+
+def _vip_counts(login_id):
+    """Per-recipient counts of what `login_id` sent that VIP weighting covers."""
+    counts = {}
+    for to_id in Compliment.objects.filter(sender_id=login_id, to__isnull=False).values_list('to_id', flat=True):
+        counts.setdefault(to_id, {'compliments_vip': 0, 'valid_complaints_vip': 0})['compliments_vip'] += 1
+    for to_id in Complaint.objects.filter(sender_id=login_id, to__isnull=False, status='v').values_list('to_id', flat=True):
+        counts.setdefault(to_id, {'compliments_vip': 0, 'valid_complaints_vip': 0})['valid_complaints_vip'] += 1
+    return counts
+
+
+def _shift_vip(login_id, sign):
+    with transaction.atomic():
+        for to_id, deltas in _vip_counts(login_id).items():
+            _apply(to_id, deltas, sign)
+
+
+@receiver(post_init, sender=Customer)
+def remember_vip(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._was_vip = False
+    elif _loaded(instance, 'vip'):
+        instance._was_vip = bool(instance.vip)
+
+
+@receiver(pre_save, sender=Customer)
+def load_vip_state(sender, instance, raw=False, **kwargs):
+    if raw or hasattr(instance, '_was_vip'):
+        return
+    instance._was_vip = Customer.objects.filter(pk=instance.pk, vip=True).exists()
+
+
+@receiver(post_save, sender=Customer)
+def count_vip_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    was_vip, is_vip = instance._was_vip, bool(instance.vip)
+    instance._was_vip = is_vip
+    if was_vip == is_vip:
+        return
+    # Another VIP customer row for the same login keeps the VIP weighting
+    if Customer.objects.filter(login_id=instance.login_id, vip=True).exclude(pk=instance.pk).exists():
+        return
+    _shift_vip(instance.login_id, 1 if is_vip else -1)
+
+
+@receiver(pre_delete, sender=Customer)
+def uncount_vip(sender, instance, **kwargs):
+    # pre_delete: the sender's feedback still points at them at this stage
+    was_vip = getattr(instance, '_was_vip', None)
+    if was_vip is None:
+        was_vip = Customer.objects.filter(pk=instance.pk, vip=True).exists()
+    if was_vip and not (
+        Customer.objects.filter(login_id=instance.login_id, vip=True).exclude(pk=instance.pk).exists()
+    ):
+        _shift_vip(instance.login_id, -1)
+
+
+def _adjust_chef_rating(employee_id, delta_sum, delta_count):
+    if employee_id is None or not (delta_sum or delta_count):
+        return
+    Employee.objects.filter(pk=employee_id).update(
+        rating_sum=F('rating_sum') + delta_sum,
+        rating_count=F('rating_count') + delta_count,
+    )
+
+
+def _adjust_rating(product_id, delta_sum, delta_count):
+    """Apply a rating change to the product and, for food, its chef."""
+    if product_id is None or not (delta_sum or delta_count):
+        return
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=F('rating_sum') + delta_sum,
+        rating_count=F('rating_count') + delta_count,
+    )
+    row = Product.objects.filter(pk=product_id).values_list('type', 'creator_id').first()
+    if row and row[0] == 'food':
+        _adjust_chef_rating(row[1], delta_sum, delta_count)
+
+
+@receiver(post_init, sender=ProductRating)
+def remember_rating(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._rating_state = None
+    elif _loaded(instance, 'product', 'rating'):
+        instance._rating_state = (instance.product_id, instance.rating)
+
+
+@receiver(pre_save, sender=ProductRating)
+def load_rating_state(sender, instance, raw=False, **kwargs):
+    if raw or hasattr(instance, '_rating_state'):
+        return
+    row = ProductRating.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+    instance._rating_state = tuple(row) if row else None
+
+
+@receiver(post_save, sender=ProductRating)
+def count_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._rating_state
+    new = (instance.product_id, instance.rating)
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None and old[0] != new[0]:
+            _adjust_rating(old[0], -old[1], -1)
+            old = None
+        if old is None:
+            _adjust_rating(new[0], new[1], 1)
+        else:
+            _adjust_rating(new[0], new[1] - old[1], 0)
+    instance._rating_state = new
+
+
+@receiver(pre_delete, sender=ProductRating)
+def uncount_rating(sender, instance, **kwargs):
+    row = ProductRating.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+    if row is not None:
+        _adjust_rating(row[0], -row[1], -1)
+
+
+def _adjust_deliverer_rating(login_id, rating, sign):
+    if login_id is None or rating is None:
+        return
+    Employee.objects.filter(login_id=login_id).update(
+        rating_sum=F('rating_sum') + sign * rating,
+        rating_count=F('rating_count') + sign,
+    )
+
+
+def _order_state(instance):
+    return (instance.assigned_deliverer_id, instance.rating)
+
+
+@receiver(post_init, sender=Order)
+def remember_order_rating(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._rating_state = None
+    elif _loaded(instance, 'assigned_deliverer', 'rating'):
+        instance._rating_state = _order_state(instance)
+
+
+@receiver(pre_save, sender=Order)
+def load_order_rating(sender, instance, raw=False, **kwargs):
+    if raw or hasattr(instance, '_rating_state'):
+        return
+    row = Order.objects.filter(pk=instance.pk).values_list('assigned_deliverer_id', 'rating').first()
+    instance._rating_state = tuple(row) if row else None
+
+
+@receiver(post_save, sender=Order)
+def count_order_rating(sender, instance, created, raw=False, **kwargs):
+    """Keep a deliverer's totals in step with their orders' ratings."""
+    if raw:
+        return
+    old = None if created else instance._rating_state
+    new = _order_state(instance)
+    instance._rating_state = new
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None:
+            _adjust_deliverer_rating(old[0], old[1], -1)
+        _adjust_deliverer_rating(new[0], new[1], 1)
+
+
+@receiver(pre_delete, sender=Order)
+def uncount_order_rating(sender, instance, **kwargs):
+    row = Order.objects.filter(pk=instance.pk).values_list('assigned_deliverer_id', 'rating').first()
+    if row is not None:
+        _adjust_deliverer_rating(row[0], row[1], -1)
+
+
+def _chef_of(product_type, creator_id):
+    """Employee id whose rollup counts a product, or None."""
+    return creator_id if product_type == 'food' else None
+
+
+@receiver(post_init, sender=Product)
+def remember_product_chef(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._chef_state = None
+    elif _loaded(instance, 'type', 'creator'):
+        instance._chef_state = _chef_of(instance.type, instance.creator_id)
+
+
+@receiver(pre_save, sender=Product)
+def load_product_chef(sender, instance, raw=False, **kwargs):
+    if raw or hasattr(instance, '_chef_state'):
+        return
+    row = Product.objects.filter(pk=instance.pk).values_list('type', 'creator_id').first()
+    instance._chef_state = _chef_of(*row) if row else None
+
+
+@receiver(post_save, sender=Product)
+def move_chef_rating(sender, instance, created, raw=False, **kwargs):
+    """Move a product's rating totals when its chef or type changes."""
+    if raw or created:
+        instance._chef_state = _chef_of(instance.type, instance.creator_id)
+        return
+    old, new = instance._chef_state, _chef_of(instance.type, instance.creator_id)
+    instance._chef_state = new
+    if old == new:
+        return
+    totals = Product.objects.filter(pk=instance.pk).values_list('rating_sum', 'rating_count').first()
+    if not totals:
+        return
+    with transaction.atomic():
+        _adjust_chef_rating(old, -totals[0], -totals[1])
+        _adjust_chef_rating(new, totals[0], totals[1])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+def invalidate_catalog(sender, **kwargs):
+    # Products can move between types, so drop every cached catalog
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Chef)
+@receiver(post_delete, sender=Chef)
+@receiver(post_save, sender=Deliverer)
+@receiver(post_delete, sender=Deliverer)
+@receiver(post_save, sender=Manager)
+@receiver(post_delete, sender=Manager)
+def forget_profile(sender, instance, **kwargs):
+    login_id = instance.login_id
+    transaction.on_commit(lambda: profiles.forget(login_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_profile(sender, instance, **kwargs):
+    # A changed user type points at a different profile table
+    user_id = instance.pk
+    transaction.on_commit(lambda: profiles.forget(user_id))
+
+
+@receiver(post_save, sender=Thread)
+def index_thread(sender, instance, **kwargs):
+    search.index_thread(instance)
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, **kwargs):
+    search.index_message(instance)
+
+
+@receiver(post_delete, sender=Thread)
+def unindex_thread(sender, instance, **kwargs):
+    search.remove_thread(instance.pk)
+
+
+@receiver(post_delete, sender=Message)
+def unindex_message(sender, instance, **kwargs):
+    # Also runs for every message of a deleted thread (cascade)
+    search.remove_message(instance.pk)
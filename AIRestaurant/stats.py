@@ -0,0 +1,12 @@
+"""
+Small statistics helpers shared by the benchmarks and the metrics code.
+"""
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples`, or None if there are none."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
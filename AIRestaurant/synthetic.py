@@ -0,0 +1,231 @@
+"""
+Synthetic load-testing data for `populate_db --scale`.
+
+Rows are built in memory and written with bulk_create in batches, a few
+thousand customers at a time, inside one transaction. Every generated
+user shares a single password hash ("loadtest"), so seeding does no
+per-user hashing. Bulk inserts skip the signal handlers, so the caller
+must rebuild the stored counters and search indexes afterwards.
+
+Distributions are skewed the way real traffic is: a few customers order
+a lot, a few dishes sell most, most ratings are 4 or 5 and most
+discussion threads are short.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .data.chef import Chef, Product, ProductRating
+from .data.customer import Customer
+from .data.deliverer import Bid, Deliverer, Order, OrderedDish
+from .data.faq import FAQEntry
+from .data.message import Complaint, Compliment, Message, Thread
+from .data.users import User
+
+BATCH_SIZE = 5000
+CUSTOMER_CHUNK = 5000
+PASSWORD = 'loadtest'
+
+RATINGS = (1, 2, 3, 4, 5)
+RATING_WEIGHTS = (5, 7, 15, 33, 40)
+ORDER_STATUSES = ('delivered', 'on its way', 'pending')
+ORDER_STATUS_WEIGHTS = (80, 8, 12)
+
+DISH_WORDS = ('Spicy', 'Grilled', 'Roasted', 'Crispy', 'Smoked', 'Garlic', 'Lemon', 'Honey', 'Herb', 'Truffle')
+DISH_NAMES = ('Chicken', 'Salmon', 'Tofu Bowl', 'Burger', 'Risotto', 'Tacos', 'Noodles', 'Salad', 'Pizza', 'Curry')
+MERCH_NAMES = ('Mug', 'T-Shirt', 'Cap', 'Keychain', 'Apron', 'Tote Bag', 'Sticker Pack', 'Hoodie')
+TOPICS = ('delivery', 'menu', 'order', 'refund', 'vip', 'merch', 'allergy', 'deliverer', 'chef', 'app')
+SENTENCES = (
+    'My {topic} was late again this week.',
+    'Does anyone know how the {topic} works?',
+    'Great experience with the {topic} today!',
+    'I have a question about the {topic}.',
+    'The {topic} could be improved a lot.',
+    'Thanks for sorting out my {topic} problem.',
+)
+FAQ_QUESTIONS = (
+    'How do I change my {topic}?',
+    'Why was my {topic} rejected?',
+    'Can I get help with the {topic}?',
+    'Where can I see my {topic}?',
+    'What happens to my {topic} when I become VIP?',
+)
+
+
+def _users(prefix, numbers, user_type, password):
+    users = [
+        User(username=f'load-{prefix}-{i}', email=f'load-{prefix}-{i}@example.invalid',
+             password=password, type=user_type, status='AC')
+        for i in numbers
+    ]
+    return User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+
+
+def _employees(model, users):
+    # bulk_create cannot insert multi-table inherited models; there are
+    # only a few hundred employees even at large scales
+    return [model.objects.create(login=user) for user in users]
+
+
+def _products(rng, chefs):
+    products = [
+        Product(name=f'{rng.choice(DISH_WORDS)} {rng.choice(DISH_NAMES)}', price=rng.randint(299, 2499),
+                type='food', creator=chef, vip_exclusive=rng.random() < 0.05)
+        for chef in chefs for _ in range(rng.randint(3, 8))
+    ]
+    products += [
+        Product(name=f'AI Restaurant {name} #{i}', price=rng.randint(99, 3999), type='merch')
+        for i in range(2) for name in MERCH_NAMES
+    ]
+    return Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+
+
+def _popularity(items):
+    """Zipf-like weights: the first items are picked far more often."""
+    return [1 / (rank + 1) for rank in range(len(items))]
+
+
+def _customer_orders(rng, user, catalog, deliverers, out):
+    """Plan one customer's order history; returns their unsaved Customer."""
+    customer = Customer(login=user, balance=rng.randint(0, 20000))
+    for _ in range(min(int(rng.expovariate(1 / 3)), 60)):
+        order_type = 'food' if rng.random() < 0.85 else 'merch'
+        products, weights = catalog[order_type]
+        picked = {p.id: p for p in rng.choices(products, weights, k=rng.randint(1, 4))}.values()
+        lines = [
+            OrderedDish(product=p, quantity=rng.choices((1, 2, 3), (70, 20, 10))[0], unit_price_cents=p.price)
+            for p in picked
+        ]
+        subtotal = sum(line.total_cost() for line in lines)
+        discount = subtotal * 5 // 100 if customer.vip else 0
+        status = rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0]
+        order = Order(customer=customer, order_type=order_type, status=status,
+                      subtotal_cents=subtotal, discount_cents=discount, total_cents=subtotal - discount)
+        if status == 'pending':
+            for deliverer in rng.sample(deliverers, min(len(deliverers), rng.randint(0, 3))):
+                price = None if rng.random() < 0.1 else rng.randint(300, 1500)
+                out['bids'].append(Bid(order=order, deliverer=deliverer.login, price_cents=price))
+        else:
+            order.assigned_deliverer = rng.choice(deliverers).login
+            if status == 'delivered' and rng.random() < 0.5:
+                order.rating = rng.choices(RATINGS, RATING_WEIGHTS)[0]
+        for line in lines:
+            line.from_order_num = order
+        out['orders'].append(order)
+        out['lines'].extend(lines)
+
+        # Same VIP rule as Customer.order: 3 orders or $100 spent
+        customer.order_count += 1
+        customer.lifetime_spend_cents += subtotal
+        if customer.order_count >= 3 or customer.lifetime_spend_cents >= 10000:
+            customer.vip = True
+    return customer
+
+
+def _customers(rng, count, password, catalog, deliverers, counts):
+    for start in range(0, count, CUSTOMER_CHUNK):
+        users = _users('cust', range(start, min(start + CUSTOMER_CHUNK, count)), 'CU', password)
+        out = {'orders': [], 'lines': [], 'bids': []}
+        customers = [_customer_orders(rng, user, catalog, deliverers, out) for user in users]
+        Customer.objects.bulk_create(customers, batch_size=BATCH_SIZE)
+        Order.objects.bulk_create(out['orders'], batch_size=BATCH_SIZE)
+        OrderedDish.objects.bulk_create(out['lines'], batch_size=BATCH_SIZE)
+        Bid.objects.bulk_create(out['bids'], batch_size=BATCH_SIZE)
+        counts.update(customers=len(customers), orders=len(out['orders']),
+                      order_lines=len(out['lines']), bids=len(out['bids']))
+
+
+def _product_ratings(rng, employees, food):
+    ratings = [
+        ProductRating(product=product, who=employee, rating=rng.choices(RATINGS, RATING_WEIGHTS)[0])
+        for employee in employees
+        for product in rng.sample(food, min(len(food), rng.randint(0, 15)))
+    ]
+    return ProductRating.objects.bulk_create(ratings, batch_size=BATCH_SIZE)
+
+
+def _discussions(rng, count, authors, employees, counts):
+    now = timezone.now()
+    weights = _popularity(authors)
+    threads, messages = [], []
+    for _ in range(count):
+        topic = rng.choice(TOPICS)
+        when = now - timedelta(days=rng.uniform(0, 180))
+        thread = Thread(title=f'Question about the {topic}', creation_date=when)
+        threads.append(thread)
+        for _ in range(1 + min(int(rng.expovariate(1 / 6)), 200)):
+            messages.append(Message(
+                thread=thread, who=rng.choices(authors, weights)[0], when=when,
+                message=rng.choice(SENTENCES).format(topic=rng.choice(TOPICS)),
+            ))
+            when += timedelta(minutes=rng.expovariate(1 / 90))
+    Thread.objects.bulk_create(threads, batch_size=BATCH_SIZE)
+    Message.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+
+    complaints, compliments = [], []
+    for message in messages:
+        roll = rng.random()
+        if roll < 0.03:
+            complaints.append(Complaint(
+                sender=message.who, to=rng.choice(employees).login, message=message,
+                status=rng.choices(('p', 'v', 'i'), (50, 30, 20))[0],
+            ))
+        elif roll < 0.07:
+            compliments.append(Compliment(sender=message.who, to=rng.choice(employees).login, message=message))
+    Complaint.objects.bulk_create(complaints, batch_size=BATCH_SIZE)
+    Compliment.objects.bulk_create(compliments, batch_size=BATCH_SIZE)
+    counts.update(threads=len(threads), messages=len(messages),
+                  complaints=len(complaints), compliments=len(compliments))
+
+
+def _faqs(rng, count, authors):
+    entries = [
+        FAQEntry(
+            question=rng.choice(FAQ_QUESTIONS).format(topic=rng.choice(TOPICS)) + f' ({i})',
+            answer=' '.join(rng.choice(SENTENCES).format(topic=rng.choice(TOPICS)) for _ in range(3)),
+            author=rng.choice(authors),
+        )
+        for i in range(count)
+    ]
+    return FAQEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+def generate(customers, seed=322):
+    """Bulk-insert a synthetic restaurant sized by `customers`.
+
+    Staff, products, threads and FAQs grow in proportion. Returns the
+    number of rows created per kind.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    counts = Counter()
+    with transaction.atomic():
+        chefs = _employees(Chef, _users('chef', range(max(2, customers // 500)), 'CH', password))
+        deliverers = _employees(Deliverer, _users('dlvr', range(max(2, customers // 200)), 'DL', password))
+        counts.update(chefs=len(chefs), deliverers=len(deliverers))
+
+        products = _products(rng, chefs)
+        food = [p for p in products if p.type == 'food']
+        merch = [p for p in products if p.type == 'merch']
+        # VIP-exclusive dishes only show up in the orders of VIPs; keep
+        # the plan simple by leaving them out of generated carts
+        orderable = [p for p in food if not p.vip_exclusive]
+        rng.shuffle(orderable)
+        catalog = {
+            'food': (orderable, _popularity(orderable)),
+            'merch': (merch, _popularity(merch)),
+        }
+        counts.update(products=len(products))
+
+        _customers(rng, customers, password, catalog, deliverers, counts)
+        counts.update(product_ratings=len(_product_ratings(rng, chefs + deliverers, food)))
+
+        generated = list(User.objects.filter(username__startswith='load-').only('id').order_by('id'))
+        authors = rng.sample(generated, min(len(generated), max(100, customers // 10)))
+        _discussions(rng, max(1, customers // 20), authors, chefs + deliverers, counts)
+        counts.update(faq_entries=len(_faqs(rng, max(1, customers // 100), authors)))
+    return dict(counts)
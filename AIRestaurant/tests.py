@@ -0,0 +1,1075 @@
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import signing
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    answer_cache, cart, catalog, faq, instrumentation, llm, profiles, realtime, reputation, search, stats, views,
+)
+from .data.chef import Chef
+from .data.message import Thread
+from .management.commands.explain_hot_queries import explain, full_scans, hot_queries
+from .models import (
+    AnswerCacheStats, CachedAnswer, Complaint, Compliment, Customer, Deliverer, Employee, FAQTerm,
+    Message, Order, OrderedDish, Product, ProductRating, User,
+)
+
+
+class CountingBackend(llm.StubBackend):
+    """Stub backend recording how many prompts and tokens it produced."""
+
+    def __init__(self, calls, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = calls
+
+    def generate(self, prompt, timeout=None):
+        self.calls.append(prompt)
+        return super().generate(prompt, timeout)
+
+    def stream(self, prompt, timeout=None):
+        self.calls.append(prompt)
+        for token in super().stream(prompt, timeout):
+            self.calls.append(token)
+            yield token
+
+
+def stub_pool(calls=None, workers=1, queue_size=4, timeout=5.0, start=True, **backend_kwargs):
+    calls = [] if calls is None else calls
+
+    def factory():
+        return CountingBackend(calls, **backend_kwargs)
+    factory.name = 'stub'
+
+    pool = llm.ModelPool(factory, workers=workers, queue_size=queue_size, timeout=timeout)
+    return pool.start() if start else pool
+
+
+class ModelPoolTests(SimpleTestCase):
+
+    def test_ask_returns_the_answer(self):
+        pool = stub_pool(answer='Hello there')
+        self.assertEqual(pool.ask('hi'), 'Hello there')
+        self.assertEqual(pool.stats()['requests'], 1)
+
+    def test_stream_yields_tokens(self):
+        pool = stub_pool(answer='one two three')
+        self.assertEqual(list(pool.stream('hi')), ['one', ' two', ' three'])
+
+    def test_full_queue_times_out(self):
+        # No workers: the first job sits in the queue and fills it
+        pool = stub_pool(queue_size=1, start=False)
+        with self.assertRaises(TimeoutError):
+            pool.ask('first', timeout=0.05)
+        self.assertEqual(pool.jobs.qsize(), 1)
+        with self.assertRaises(TimeoutError):
+            pool.ask('second', timeout=0.05)
+        self.assertEqual(pool.jobs.qsize(), 1)
+        self.assertEqual(pool.stats()['timeouts'], 2)
+
+    def test_slow_answer_times_out(self):
+        pool = stub_pool(delay=0.5)
+        with self.assertRaises(TimeoutError):
+            pool.ask('hi', timeout=0.05)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_expired_job_is_not_run(self):
+        calls = []
+        pool = stub_pool(calls, start=False)
+        with self.assertRaises(TimeoutError):
+            pool.ask('too late', timeout=0.05)
+        pool.start()
+        self.assertEqual(pool.ask('on time'), 'You asked: on time')
+        self.assertEqual(calls, ['on time'])
+
+    def test_closing_a_stream_stops_generation(self):
+        calls = []
+        words = ' '.join(f'w{i}' for i in range(50))
+        pool = stub_pool(calls, answer=words, delay=2.5)
+        stream = pool.stream('hi')
+        self.assertEqual(next(stream), 'w0')
+        stream.close()
+        time.sleep(0.2)
+        produced = len(calls)
+        time.sleep(0.3)
+        # The worker stops after at most one more token
+        self.assertLessEqual(len(calls), produced + 1)
+        self.assertLess(len(calls), 10)
+
+
+FAKE_LLAMA_RUN = """#!/bin/sh
+# Floods stderr, prints one word and then hangs
+head -c 200000 /dev/zero >&2
+printf 'partial'
+exec sleep 30
+"""
+
+
+
+class PreloadTests(SimpleTestCase):
+
+    @override_settings(AI_CHAT={'PRELOAD': True})
+    def test_app_startup_never_loads_the_model(self):
+        # migrate, test and every other command run ready()
+        with mock.patch.object(llm, 'get_pool') as get_pool:
+            apps.get_app_config('air').ready()
+        get_pool.assert_not_called()
+
+    def test_server_entrypoints_preload_only_when_asked(self):
+        with mock.patch.object(llm, 'get_pool') as get_pool:
+            with override_settings(AI_CHAT={'PRELOAD': False}):
+                llm.preload()
+            get_pool.assert_not_called()
+            with override_settings(AI_CHAT={'PRELOAD': True}):
+                llm.preload()
+            get_pool.assert_called_once_with()
+
+
+@unittest.skipUnless(os.name == 'posix', 'needs a shell script on PATH')
+class LlamaRunBackendTests(SimpleTestCase):
+
+    def test_stream_is_killed_at_the_deadline(self):
+        with tempfile.TemporaryDirectory() as bin_dir:
+            script = os.path.join(bin_dir, 'llama-run')
+            with open(script, 'w') as f:
+                f.write(FAKE_LLAMA_RUN)
+            os.chmod(script, 0o755)
+            path = bin_dir + os.pathsep + os.environ.get('PATH', '')
+            with mock.patch.dict(os.environ, {'PATH': path}):
+                backend = llm.LlamaRunBackend('model.gguf')
+                started = time.monotonic()
+                tokens = []
+                with self.assertRaises(TimeoutError):
+                    for token in backend.stream('hi', timeout=0.5):
+                        tokens.append(token)
+        self.assertEqual(tokens, ['partial'])
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class AIChatStreamTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(llm, 'get_pool', return_value=stub_pool(answer='Fresh answer'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _collect(self, events):
+        return [event async for event in events]
+
+    def test_asgi_stream_caches_the_answer_on_the_request_thread(self):
+        threads = []
+        store = answer_cache.store
+
+        def recording_store(question, answer):
+            threads.append(threading.current_thread())
+            store(question, answer)
+
+        with mock.patch.object(answer_cache, 'store', recording_store):
+            events = async_to_sync(self._collect)(views._aiter_events('What is on the menu?'))
+        self.assertTrue(events[-1].startswith('event: done'))
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(answer_cache.lookup('what is on the menu'), 'Fresh answer')
+
+    def test_answer_cut_off_by_the_deadline_is_not_cached(self):
+        words = ' '.join(f'w{i}' for i in range(50))
+        with mock.patch.object(llm, 'get_pool', return_value=stub_pool(answer=words, delay=2.5, timeout=0.2)):
+            events = list(views._ai_chat_events('Tell me everything'))
+        self.assertTrue(events[-1].startswith('event: error'))
+        self.assertFalse(CachedAnswer.objects.exists())
+
+
+class AnswerCacheTests(TestCase):
+
+    def setUp(self):
+        answer_cache._pending.clear()
+
+    def test_lookups_do_not_write_the_stats_row(self):
+        answer_cache.store('How do I order?', 'Use the menu.')
+        with self.assertNumQueries(1):
+            self.assertIsNone(answer_cache.lookup('Where is my food?'))
+        # The hit only refreshes the entry's LRU timestamp
+        with self.assertNumQueries(2):
+            self.assertEqual(answer_cache.lookup('how do i ORDER'), 'Use the menu.')
+        self.assertFalse(AnswerCacheStats.objects.exists())
+        stats = answer_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    @override_settings(AI_ANSWER_CACHE={'ENABLED': True, 'TTL': 3600, 'MAX_ENTRIES': 2})
+    def test_store_evicts_only_past_the_size_limit(self):
+        answer_cache.store('first question', 'one')
+        answer_cache.store('second question', 'two')
+        self.assertEqual(CachedAnswer.objects.count(), 2)
+        answer_cache.store('third question', 'three')
+        self.assertEqual(CachedAnswer.objects.count(), 2)
+        self.assertEqual(answer_cache.stats()['evictions'], 1)
+
+
+class FAQIndexTests(TestCase):
+
+    def test_overlong_words_are_left_out_of_the_index(self):
+        blob = 'x' * (faq.MAX_TOKEN_LENGTH + 1)
+        entry = faq.create_entry('How do I pay?', f'Use the deposit page {blob}', None)
+        tokens = set(FAQTerm.objects.filter(entry=entry).values_list('token', flat=True))
+        self.assertIn('deposit', tokens)
+        self.assertNotIn(blob, tokens)
+        self.assertEqual(list(faq.search_entries('how do i pay')), [entry])
+
+
+
+class FAQRankingTests(TestCase):
+
+    def search(self, **params):
+        response = self.client.get(reverse('faq_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_entries_are_ranked_by_relevance(self):
+        focused = faq.create_entry('Which cards do you take?', 'Every card: debit card or credit card.')
+        passing = faq.create_entry('How do I pay?', 'Deposit funds first; a card works for that, as does cash.')
+        faq.create_entry('When do you open?', 'Every day at noon.')
+
+        entries, next_cursor = faq.rank_entries('card')
+        self.assertEqual(entries, [focused, passing])
+        self.assertGreater(entries[0].score, entries[1].score)
+        self.assertIsNone(next_cursor)
+
+    def test_cursor_is_stable_across_tied_scores(self):
+        # Identical entries score the same; ties are broken by id
+        tied = [faq.create_entry('Do you deliver?', 'Yes, every evening.') for _ in range(5)]
+        ids, after = [], None
+        while True:
+            data = self.search(q='deliver', limit=2, **({'after': after} if after else {}))
+            ids += [row['id'] for row in data['results']]
+            after = data['next']
+            if after is None:
+                break
+        self.assertEqual(ids, sorted((e.id for e in tied), reverse=True))
+
+    def test_malformed_cursor_returns_the_first_page(self):
+        for i in range(3):
+            faq.create_entry(f'Is the soup {i} vegan?', 'Ask the chef.')
+        first = self.search(q='soup vegan', limit=2)
+        self.assertEqual(self.search(q='soup vegan', limit=2, after='not-a-cursor'), first)
+        self.assertEqual(self.search(q='soup vegan', limit=2, after='1.5_x'), first)
+
+    def test_overlap_threshold_matches_the_classic_search(self):
+        query = ' '.join(f'word{i}' for i in range(10))
+        nine = faq.create_entry(' '.join(f'word{i}' for i in range(9)), 'Nine of ten.')
+        faq.create_entry(' '.join(f'word{i}' for i in range(8)), 'Eight of ten.')
+        faq.create_entry('Only in the answer', query)
+
+        entries, _ = faq.rank_entries(query, limit=100, min_overlap=faq.OVERLAP_THRESHOLD)
+        self.assertEqual(entries, [nine])
+        self.assertEqual(list(faq.search_entries(query)), [nine])
+        self.assertEqual(entries[0].overlap, 0.9)
+        # Without the cutoff every entry sharing a word is ranked
+        self.assertEqual(len(faq.rank_entries(query, limit=100)[0]), 3)
+
+
+def make_user(username, user_type='CU', status='AC'):
+    return User.objects.create(
+        username=username, email=f'{username}@example.invalid', type=user_type, status=status,
+    )
+
+
+class DiscussionListTests(TestCase):
+
+    def setUp(self):
+        self.authors = [make_user(f'author{i}') for i in range(3)]
+
+    def make_threads(self, count):
+        for i in range(count):
+            thread = Thread.objects.create(title=f'Thread {i}', creation_date=timezone.now())
+            for j in range(3):
+                Message.objects.create(thread=thread, message=f'Message {j}', who=self.authors[j], when=timezone.now())
+
+    def test_listing_query_count_does_not_grow_with_threads(self):
+        # One query for the threads with their counts and latest messages
+        self.make_threads(2)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('discussions'))
+        self.assertEqual(len(response.context['threads']), 2)
+
+        self.make_threads(6)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('discussions'))
+        self.assertEqual(len(response.context['threads']), 8)
+        self.assertEqual(response.context['threads'][0]['count'], 3)
+        self.assertEqual(response.context['threads'][0]['last'].who.username, 'author2')
+
+
+class DiscussionSearchTests(TestCase):
+
+    def setUp(self):
+        self.author = make_user('poster')
+
+    def post(self, title, *texts):
+        thread = Thread.objects.create(title=title, creation_date=timezone.now())
+        for text in texts:
+            Message.objects.create(thread=thread, message=text, who=self.author, when=timezone.now())
+        return thread
+
+    def found(self, query):
+        return {hit.thread_id for hit in search.search_threads(query)}
+
+    def test_index_follows_saves_and_deletes(self):
+        thread = self.post('Delivery times', 'My noodles arrived cold')
+        other = self.post('Menu ideas', 'More noodles please')
+        self.assertEqual(self.found('noodles'), {thread.id, other.id})
+
+        thread.title = 'Late dumplings'
+        thread.save()
+        self.assertEqual(self.found('dumplings'), {thread.id})
+        self.assertEqual(self.found('delivery'), set())
+
+        # Deleting outside the views (cascades, admin, querysets) counts too
+        Thread.objects.filter(pk=thread.pk).delete()
+        self.assertEqual(self.found('noodles'), {other.id})
+        self.assertEqual(self.found('dumplings'), set())
+        Message.objects.filter(thread=other).delete()
+        self.assertEqual(self.found('noodles'), set())
+
+    @override_settings(DISCUSSION_SEARCH_BACKEND='AIRestaurant.search.SimpleSearchBackend')
+    def test_simple_backend_loads_snippets_in_one_query(self):
+        for i in range(4):
+            self.post(f'Thread {i}', 'Ask about the soup', 'The soup was great')
+        with self.assertNumQueries(2):
+            hits = search.search_threads('soup')
+        self.assertEqual(len(hits), 4)
+        self.assertIn('<mark>soup</mark>', hits[0].snippet_html)
+
+
+class ThreadSocketTests(TestCase):
+
+    def setUp(self):
+        self.thread = Thread.objects.create(title='Live', creation_date=timezone.now())
+        self.user = make_user('listener')
+        self.old = Message.objects.create(thread=self.thread, message='Before', who=self.user, when=timezone.now())
+        self.missed = Message.objects.create(thread=self.thread, message='Missed', who=self.user, when=timezone.now())
+
+    def cookie(self, user):
+        self.client.force_login(user)
+        return f'sessionid={self.client.cookies["sessionid"].value}'
+
+    async def converse(self, cookie=None, origin='http://testserver', query=b'', publish=None):
+        """Connect, optionally publish once subscribed, and collect what is sent."""
+        inbox, sent = asyncio.Queue(), []
+        headers = [(b'origin', origin.encode())]
+        if cookie:
+            headers.append((b'cookie', cookie.encode()))
+        scope = {'type': 'websocket', 'path': f'/ws/thread/{self.thread.id}/', 'query_string': query, 'headers': headers}
+
+        async def send(event):
+            sent.append(event)
+
+        await inbox.put({'type': 'websocket.connect'})
+        app = asyncio.ensure_future(realtime.websocket_application(scope, inbox.get, send))
+        channel = realtime.channel_name(self.thread.id)
+        broker = realtime.get_broker()
+        for _ in range(200):
+            if app.done() or broker._subscribers.get(channel):
+                break
+            await asyncio.sleep(0.01)
+        if publish is not None and not app.done():
+            broker.publish(channel, publish)
+        await asyncio.sleep(0.1)
+        await inbox.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(app, 5)
+        return sent
+
+    def test_anonymous_sockets_are_refused(self):
+        sent = async_to_sync(self.converse)()
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_suspended_users_are_refused(self):
+        cookie = self.cookie(self.user)
+        User.objects.filter(pk=self.user.pk).update(status='SU')
+        sent = async_to_sync(self.converse)(cookie)
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_other_origins_are_refused(self):
+        sent = async_to_sync(self.converse)(self.cookie(self.user), origin='https://evil.example')
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_logged_in_user_gets_missed_and_new_messages(self):
+        payload = {'id': self.missed.id + 1, 'message': 'Fresh', 'when': '', 'who': None, 'who_id': None}
+        sent = async_to_sync(self.converse)(
+            self.cookie(self.user), query=f'after={self.old.id}'.encode(), publish=payload,
+        )
+        self.assertEqual(sent[0], {'type': 'websocket.accept'})
+        texts = [json.loads(event['text'])['message'] for event in sent[1:]]
+        self.assertEqual(texts, ['Missed', 'Fresh'])
+
+
+
+class ThreadMessagesTests(TestCase):
+
+    def setUp(self):
+        self.thread = Thread.objects.create(title='Paged', creation_date=timezone.now())
+        self.user = make_user('chatty')
+        self.start = timezone.now()
+
+    def post(self, count, same_time=False):
+        return [
+            Message.objects.create(
+                thread=self.thread, message=f'Message {i}', who=self.user,
+                when=self.start if same_time else self.start + timedelta(seconds=i),
+            )
+            for i in range(count)
+        ]
+
+    def page(self, **params):
+        response = self.client.get(reverse('thread_messages', args=[self.thread.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, data):
+        return [m['id'] for m in data['results']]
+
+    def test_after_pages_forward_oldest_first(self):
+        # Equal timestamps are ordered by id, so no message is skipped
+        messages = self.post(5, same_time=True)
+        first = self.page(limit=2, after=faq.encode_cursor(messages[0].when, messages[0].id))
+        self.assertEqual(self.ids(first), [messages[1].id, messages[2].id])
+        self.assertTrue(first['has_newer'])
+        self.assertEqual(first['newer'], faq.encode_cursor(messages[2].when, messages[2].id))
+
+        second = self.page(limit=2, after=first['newer'])
+        self.assertEqual(self.ids(second), [messages[3].id, messages[4].id])
+        self.assertFalse(second['has_newer'])
+
+        # Polling past the newest message returns nothing and keeps the cursor
+        done = self.page(after=second['newer'])
+        self.assertEqual(done['results'], [])
+        self.assertEqual(done['newer'], second['newer'])
+        self.assertFalse(done['has_newer'])
+
+    def test_before_pages_back_to_the_first_message(self):
+        messages = self.post(5)
+        latest = self.page(limit=2)
+        self.assertEqual(self.ids(latest), [messages[3].id, messages[4].id])
+        self.assertEqual(latest['older'], faq.encode_cursor(messages[3].when, messages[3].id))
+        self.assertEqual(latest['newer'], faq.encode_cursor(messages[4].when, messages[4].id))
+        self.assertFalse(latest['has_newer'])
+        self.assertEqual(latest['results'][0], {
+            'id': messages[3].id,
+            'message': 'Message 3',
+            'when': messages[3].when.isoformat(),
+            'who': 'chatty',
+            'who_id': self.user.id,
+        })
+
+        middle = self.page(limit=2, before=latest['older'])
+        self.assertEqual(self.ids(middle), [messages[1].id, messages[2].id])
+        first = self.page(limit=2, before=middle['older'])
+        self.assertEqual(self.ids(first), [messages[0].id])
+        self.assertIsNone(first['older'])
+
+    def test_exactly_one_page_has_no_older_cursor(self):
+        messages = self.post(3)
+        data = self.page(limit=3)
+        self.assertEqual(self.ids(data), [m.id for m in messages])
+        self.assertIsNone(data['older'])
+
+    def test_empty_thread(self):
+        self.assertEqual(self.page(), {'results': [], 'older': None, 'newer': None, 'has_newer': False})
+        response = self.client.get(reverse('thread', args=[self.thread.id]))
+        self.assertContains(response, 'No messages yet.')
+        self.assertEqual(self.client.get(reverse('thread_messages', args=[self.thread.id + 1])).status_code, 404)
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class MenuCatalogTests(TestCase):
+
+    def setUp(self):
+        self.dish = Product.objects.create(name='Soup', price=500, type='food')
+
+    def test_catalog_is_cached_in_the_shared_cache(self):
+        self.assertEqual(catalog.get_products('food')[0].price, 500)
+        # Bypasses the invalidating signals: the cached copy stays
+        Product.objects.filter(pk=self.dish.pk).update(price=700)
+        self.assertEqual(catalog.get_products('food')[0].price, 500)
+        catalog.invalidate()
+        self.assertEqual(catalog.get_products('food')[0].price, 700)
+
+    def test_cached_rows_leave_out_the_creators_account(self):
+        login = make_user('souschef', 'CH')
+        login.set_password('hunter2-secret')
+        login.save()
+        Product.objects.create(name='Stew', price=900, type='food', creator=Chef.objects.create(login=login))
+        catalog.invalidate()
+        catalog.get_products('food')
+
+        cached = pickle.dumps(caches['default'].get(catalog._key('food', False)))
+        self.assertNotIn(login.password.encode(), cached)
+        self.assertNotIn(login.email.encode(), cached)
+        # The cache read; the creator's name and id need no lazy load
+        with self.assertNumQueries(1):
+            stew = catalog.get_products('food')[1]
+            self.assertEqual((stew.creator.login.id, stew.creator.login.username), (login.id, 'souschef'))
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_process_local_cache_is_not_used(self):
+        self.assertEqual(catalog.get_products('food')[0].price, 500)
+        Product.objects.filter(pk=self.dish.pk).update(price=700)
+        self.assertEqual(catalog.get_products('food')[0].price, 700)
+
+    @override_settings(CACHES=LOCMEM_CACHE, MENU_CATALOG={'LOCAL': True})
+    def test_local_cache_can_be_allowed_for_one_process(self):
+        catalog.invalidate()
+        self.assertEqual(catalog.get_products('food')[0].price, 500)
+        Product.objects.filter(pk=self.dish.pk).update(price=700)
+        self.assertEqual(catalog.get_products('food')[0].price, 500)
+        catalog.invalidate()
+
+
+class CustomerCounterTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(login=make_user('buyer'), balance=10000)
+        self.dish = Product.objects.create(name='Stew', price=1200, type='food')
+
+    def test_saving_a_stale_copy_keeps_the_order_counters(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        self.customer.order([OrderedDish(product=self.dish, quantity=2)])
+        stale.warnings = 1
+        stale.save()
+        row = Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual((row.warnings, row.order_count, row.lifetime_spend_cents), (1, 1, 2400))
+
+    def test_deposit_keeps_a_concurrent_charge(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        self.customer.order([OrderedDish(product=self.dish, quantity=1)])
+        stale.deposit(500)
+        self.assertEqual(stale.balance, 10000 - 1200 + 500)
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).balance, stale.balance)
+
+    def test_order_keeps_the_prices_it_was_placed_at(self):
+        side = Product.objects.create(name='Rice', price=300, type='food')
+        order = self.customer.order([OrderedDish(product=self.dish, quantity=2), OrderedDish(product=side, quantity=1)])
+
+        self.dish.price = 2000
+        self.dish.save()
+        Product.objects.filter(pk=side.pk).update(price=50)
+
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((order.subtotal_cents, order.total_cents), (2700, 2700))
+        self.assertEqual(order.total_amount, 27.0)
+        items = order.items.order_by('id')
+        self.assertEqual([(i.unit_price_cents, i.total_cost()) for i in items], [(1200, 2400), (300, 300)])
+
+        self.client.force_login(self.customer.login)
+        self.assertContains(self.client.get(reverse('order_history')), '$27.00')
+
+    def test_warning_on_a_stale_copy_keeps_the_balance(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        self.customer.order([OrderedDish(product=self.dish, quantity=1)])
+        stale.add_warning()
+        row = Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual((row.warnings, row.balance, row.order_count), (1, 10000 - 1200, 1))
+
+
+
+class FeedbackCounterTests(TestCase):
+
+    def setUp(self):
+        self.chef = Chef.objects.create(login=make_user('cook', 'CH'))
+        self.diner = make_user('diner')
+        self.customer = Customer.objects.create(login=self.diner, balance=10000)
+        thread = Thread.objects.create(title='Feedback', creation_date=timezone.now())
+        self.message = Message.objects.create(thread=thread, message='About dinner', who=self.diner, when=timezone.now())
+
+    def counters(self):
+        return Employee.objects.values_list(*reputation.COUNTERS).get(pk=self.chef.pk)
+
+    def assertConsistent(self):
+        # Raises CommandError if any stored counter differs from a recount
+        out = StringIO()
+        call_command('rebuild_reputation', check=True, stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+    def send(self, sender, status=None):
+        Compliment.objects.create(sender=sender, to=self.chef.login, message=self.message)
+        if status:
+            Complaint.objects.create(sender=sender, to=self.chef.login, message=self.message, status=status)
+
+    def test_complaint_moving_between_statuses(self):
+        complaint = Complaint.objects.create(sender=self.diner, to=self.chef.login, message=self.message)
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+
+        complaint = Complaint.objects.get(pk=complaint.pk)
+        complaint.status = 'v'
+        complaint.save()
+        self.assertEqual(self.counters(), (0, 0, 1, 0))
+        self.assertConsistent()
+
+        # Deferred fields: the old status is read back before the save
+        complaint = Complaint.objects.only('id').get(pk=complaint.pk)
+        complaint.status = 'i'
+        complaint.save()
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+        self.assertConsistent()
+
+    def test_deleting_a_vip_sender(self):
+        self.customer.vip = True
+        self.customer.save()
+        self.send(self.diner, status='v')
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+
+        # The feedback stays, without a sender and so without VIP weight
+        self.diner.delete()
+        self.assertEqual(self.counters(), (1, 0, 1, 0))
+        self.assertConsistent()
+
+    def test_customer_crossing_the_vip_threshold(self):
+        self.send(self.diner, status='v')
+        self.assertEqual(self.counters(), (1, 0, 1, 0))
+
+        dish = Product.objects.create(name='Pie', price=100, type='food')
+        for _ in range(3):
+            self.customer.order([OrderedDish(product=dish, quantity=1)])
+        self.assertTrue(Customer.objects.get(pk=self.customer.pk).vip)
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+        self.assertConsistent()
+
+    def test_vip_gained_and_lost(self):
+        self.send(self.diner, status='v')
+        self.send(self.diner)
+        self.assertEqual(self.counters(), (2, 0, 1, 0))
+
+        self.customer.vip = True
+        self.customer.save()
+        self.assertEqual(self.counters(), (2, 2, 1, 1))
+        self.assertConsistent()
+
+        # Two warnings cost a VIP their status
+        customer = Customer.objects.get(pk=self.customer.pk)
+        customer.add_warning()
+        self.assertEqual(self.counters(), (2, 2, 1, 1))
+        customer.add_warning()
+        self.assertFalse(Customer.objects.get(pk=self.customer.pk).vip)
+        self.assertEqual(self.counters(), (2, 0, 1, 0))
+        self.assertConsistent()
+
+    def test_second_vip_row_keeps_the_weighting(self):
+        self.customer.vip = True
+        self.customer.save()
+        Customer.objects.create(login=self.diner, vip=True)
+        self.send(self.diner, status='v')
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+
+        self.customer.vip = False
+        self.customer.save()
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+        self.assertConsistent()
+
+
+
+class RatingTotalTests(TestCase):
+
+    def setUp(self):
+        self.chef = Chef.objects.create(login=make_user('first', 'CH'))
+        self.other_chef = Chef.objects.create(login=make_user('second', 'CH'))
+        self.raters = [Employee.objects.create(login=make_user(f'rater{i}', 'DL')) for i in range(2)]
+        self.dish = Product.objects.create(name='Curry', price=900, type='food', creator=self.chef)
+
+    def totals(self, model, pk):
+        return model.objects.values_list('rating_sum', 'rating_count').get(pk=pk)
+
+    def assertConsistent(self):
+        # Raises CommandError if any stored total differs from a recount
+        out = StringIO()
+        call_command('rebuild_rating_totals', check=True, stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+    def test_totals_follow_rating_updates_and_deletes(self):
+        first = ProductRating.objects.create(product=self.dish, who=self.raters[0], rating=4)
+        ProductRating.objects.create(product=self.dish, who=self.raters[1], rating=2)
+        self.assertEqual(self.totals(Product, self.dish.pk), (6, 2))
+        self.assertEqual(self.totals(Employee, self.chef.pk), (6, 2))
+
+        first = ProductRating.objects.get(pk=first.pk)
+        first.rating = 5
+        first.save()
+        self.assertEqual(self.totals(Product, self.dish.pk), (7, 2))
+        self.assertEqual(self.totals(Employee, self.chef.pk), (7, 2))
+        self.assertConsistent()
+
+        first.delete()
+        self.assertEqual(self.totals(Product, self.dish.pk), (2, 1))
+        # Queryset deletes send the signals too
+        ProductRating.objects.filter(product=self.dish).delete()
+        self.assertEqual(self.totals(Product, self.dish.pk), (0, 0))
+        self.assertEqual(self.totals(Employee, self.chef.pk), (0, 0))
+        self.assertConsistent()
+
+    def test_chef_totals_follow_the_products_creator_and_type(self):
+        ProductRating.objects.create(product=self.dish, who=self.raters[0], rating=5)
+        dish = Product.objects.get(pk=self.dish.pk)
+        dish.creator = self.other_chef
+        dish.save()
+        self.assertEqual(self.totals(Employee, self.chef.pk), (0, 0))
+        self.assertEqual(self.totals(Employee, self.other_chef.pk), (5, 1))
+        self.assertConsistent()
+
+        # Only food counts towards a chef
+        dish.type = 'merch'
+        dish.save()
+        self.assertEqual(self.totals(Employee, self.other_chef.pk), (0, 0))
+        self.assertEqual(self.totals(Product, dish.pk), (5, 1))
+        self.assertConsistent()
+
+        dish = Product.objects.only('id').get(pk=dish.pk)
+        dish.type = 'food'
+        dish.save()
+        self.assertEqual(self.totals(Employee, self.other_chef.pk), (5, 1))
+        self.assertConsistent()
+
+
+
+class DelivererRatingTests(TestCase):
+
+    def setUp(self):
+        self.deliverer = Deliverer.objects.create(login=make_user('rider', 'DL'))
+        self.other = Deliverer.objects.create(login=make_user('cyclist', 'DL'))
+        self.customer = Customer.objects.create(login=make_user('hungry'))
+
+    def deliver(self, *ratings, deliverer=None):
+        """Orders assigned to `deliverer`, oldest first, rated `ratings`."""
+        login = (deliverer or self.deliverer).login
+        start = timezone.now() - timedelta(days=1)
+        orders = []
+        for i, rating in enumerate(ratings):
+            order = Order.objects.create(customer=self.customer, assigned_deliverer=login, rating=rating)
+            Order.objects.filter(pk=order.pk).update(date=start + timedelta(minutes=i))
+            orders.append(order)
+        return orders
+
+    def totals(self, deliverer):
+        return Employee.objects.values_list('rating_sum', 'rating_count').get(pk=deliverer.pk)
+
+    def assertConsistent(self):
+        out = StringIO()
+        call_command('rebuild_rating_totals', check=True, stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+    def test_totals_follow_order_ratings(self):
+        order, _ = self.deliver(None, 3)
+        self.assertEqual(self.totals(self.deliverer), (3, 1))
+
+        self.client.force_login(self.customer.login)
+        self.client.post(reverse('rate_chef', args=[order.pk]), {'rating': '5'})
+        self.assertEqual(self.totals(self.deliverer), (8, 2))
+        self.client.post(reverse('rate_chef', args=[order.pk]), {'rating': '4'})
+        self.assertEqual(self.totals(self.deliverer), (7, 2))
+        self.assertConsistent()
+
+        order = Order.objects.get(pk=order.pk)
+        order.assigned_deliverer = self.other.login
+        order.save()
+        self.assertEqual(self.totals(self.deliverer), (3, 1))
+        self.assertEqual(self.totals(self.other), (4, 1))
+        self.assertConsistent()
+
+        order.delete()
+        self.assertEqual(self.totals(self.other), (0, 0))
+        self.assertConsistent()
+
+    def test_recent_average_covers_the_latest_rated_window(self):
+        self.assertIsNone(self.deliverer.recent_average())
+        self.deliver(1, 1, None, 5, 4, None)
+        self.deliver(1, deliverer=self.other)
+        self.assertEqual(self.deliverer.recent_average(window=2), 4.5)
+        self.assertEqual(self.deliverer.recent_average(window=3), 10 / 3)
+        self.assertEqual(self.deliverer.recent_average(window=50), 11 / 4)
+        with override_settings(DELIVERER_RATING_WINDOW=1):
+            self.assertEqual(self.deliverer.recent_average(), 4)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+
+    PRICE = 1000
+    AFFORDABLE = 5
+    ATTEMPTS = 16
+
+    def test_parallel_orders_never_overdraw(self):
+        start_balance = self.PRICE * self.AFFORDABLE + self.PRICE // 2
+        customer = Customer.objects.create(login=make_user('rush'), balance=start_balance)
+        dish = Product.objects.create(name='Rush dish', price=self.PRICE, type='food')
+
+        def checkout(i):
+            try:
+                # Every worker starts from the same stale balance
+                buyer = Customer.objects.get(pk=customer.pk)
+                buyer.balance = start_balance
+                buyer.order([OrderedDish(product=dish, quantity=1)])
+                return 'ok'
+            except ValueError:
+                return 'rejected'
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            outcomes = list(executor.map(checkout, range(self.ATTEMPTS)))
+
+        customer.refresh_from_db()
+        orders = Order.objects.filter(customer=customer)
+        self.assertEqual(outcomes.count('ok'), self.AFFORDABLE)
+        self.assertEqual(outcomes.count('rejected'), self.ATTEMPTS - self.AFFORDABLE)
+        self.assertEqual(orders.count(), self.AFFORDABLE)
+        self.assertEqual(customer.balance, start_balance - self.AFFORDABLE * self.PRICE)
+        self.assertEqual(customer.order_count, self.AFFORDABLE)
+        self.assertEqual(customer.lifetime_spend_cents, orders.aggregate(total=Sum('subtotal_cents'))['total'])
+
+
+
+class ManageUsersPageTests(TestCase):
+
+    def setUp(self):
+        # 3 active and 2 suspended deliverers, 2 customers and 1 chef
+        kinds = ['DL', 'CU', 'DL', 'CH', 'DL', 'CU', 'DL', 'DL']
+        statuses = ['AC', 'AC', 'SU', 'AC', 'AC', 'SU', 'SU', 'AC']
+        self.users = [make_user(f'user{i}', kind, status) for i, (kind, status) in enumerate(zip(kinds, statuses))]
+
+    def ids(self, users):
+        return [u.id for u in users]
+
+    def walk(self, role=None, status=None, limit=3):
+        """Every page in order, following the next cursors."""
+        pages, after = [], None
+        while True:
+            users, prev_cursor, next_cursor = views._manage_users_page(role, status, after=after, limit=limit)
+            pages.append((self.ids(users), prev_cursor, next_cursor))
+            if next_cursor is None:
+                return pages
+            after = next_cursor
+
+    def test_pages_cover_every_user_once_in_id_order(self):
+        pages = self.walk()
+        self.assertEqual([len(ids) for ids, _, _ in pages], [3, 3, 2])
+        self.assertEqual(sum((ids for ids, _, _ in pages), []), self.ids(self.users))
+        self.assertIsNone(pages[0][1])
+        self.assertEqual(pages[1][1], pages[1][0][0])
+
+        # Going back from the last page returns the same full page
+        users, prev_cursor, next_cursor = views._manage_users_page(None, None, before=pages[2][1], limit=3)
+        self.assertEqual(self.ids(users), pages[1][0])
+        self.assertEqual(next_cursor, pages[1][0][-1])
+
+    def test_full_last_page_has_no_next_cursor(self):
+        users, _, next_cursor = views._manage_users_page(None, None, limit=len(self.users))
+        self.assertEqual(len(users), len(self.users))
+        self.assertIsNone(next_cursor)
+
+    def test_role_and_status_filters(self):
+        by_role = sum((ids for ids, _, _ in self.walk(role='DL', limit=2)), [])
+        self.assertEqual(by_role, [u.id for u in self.users if u.type == 'DL'])
+        both = sum((ids for ids, _, _ in self.walk(role='DL', status='SU', limit=1)), [])
+        self.assertEqual(both, [u.id for u in self.users if u.type == 'DL' and u.status == 'SU'])
+
+        # Malformed cursors fall back to the first page
+        users, prev_cursor, _ = views._manage_users_page('CU', None, after='abc')
+        self.assertEqual(self.ids(users), [u.id for u in self.users if u.type == 'CU'])
+        self.assertIsNone(prev_cursor)
+
+
+
+class CartTests(TestCase):
+
+    def setUp(self):
+        self.buyer = make_user('shopper')
+        Customer.objects.create(login=self.buyer, balance=5000)
+        self.dish = Product.objects.create(name='Ramen', price=800, type='food')
+
+    def cart_cookie(self, owner, items):
+        value = json.dumps({'user': owner.pk, 'items': items}, separators=(',', ':'))
+        signer = signing.get_cookie_signer(salt=cart.SignedCookieCart.cookie_name + cart.SignedCookieCart.salt)
+        return signer.sign(value)
+
+    def test_keys_that_are_not_dish_ids_are_dropped(self):
+        self.assertEqual(
+            cart.normalize({'3': 2, 'abc': 1, '0': 1, '-4': 1, '5': 0, '7': 'x', None: 1}),
+            {'3': 2},
+        )
+        self.client.force_login(self.buyer)
+        self.client.cookies['cart'] = self.cart_cookie(self.buyer, {str(self.dish.id): 2, 'abc': 1})
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total'], 1600)
+
+    def test_signed_cookie_of_another_user_is_ignored(self):
+        self.client.force_login(self.buyer)
+        self.client.cookies['cart'] = self.cart_cookie(make_user('someone'), {str(self.dish.id): 2})
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['cart'], {})
+
+    def test_logout_clears_the_cart(self):
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('update_cart'), {'cart': json.dumps({str(self.dish.id): 1})})
+        self.assertTrue(self.client.cookies['cart'].value)
+        self.client.get(reverse('logout'))
+        self.assertEqual(self.client.cookies['cart'].value, '')
+
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(reverse('cart')).context['cart'], {})
+
+    def test_session_cart_skips_unchanged_writes(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        session_cart = cart.SessionCart(request)
+        session_cart.set({'4': 2})
+        self.assertTrue(request.session.modified)
+
+        request.session.modified = False
+        session_cart.set({'4': '2', 'junk': 1})
+        self.assertFalse(request.session.modified)
+        session_cart.set({'4': 3})
+        self.assertTrue(request.session.modified)
+        self.assertEqual(session_cart.get(), {'4': 3})
+
+
+
+class ProfileTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('regular')
+        self.customer = Customer.objects.create(login=self.user, warnings=1)
+
+    def test_one_profile_query_per_request(self):
+        def view(request):
+            # The view, its helpers and the templates all ask again
+            seen = [request.profile.warnings, request.user.is_vip, request.profile.pk, request.user.is_vip]
+            return HttpResponse(str(seen))
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            response = profiles.ProfileMiddleware(view)(request)
+        self.assertEqual(response.content, f"[1, False, {self.customer.pk}, False]".encode())
+
+        # Same through the full stack: the cart page reads the profile
+        # in the view and `user.is_vip` in its templates
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('cart'))
+        self.assertEqual(sum('"air_customer"' in q['sql'] for q in queries.captured_queries), 1)
+
+    @override_settings(CACHES=LOCMEM_CACHE, PROFILE_CACHE_TTL=60)
+    def test_saving_a_profile_drops_its_cached_copy(self):
+        self.assertEqual(profiles.get_profile(User.objects.get(pk=self.user.pk)).warnings, 1)
+        # A later request (a new user object) is served from the cache
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(profiles.get_profile(user).warnings, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.warnings = 2
+            self.customer.save()
+        self.assertEqual(profiles.get_profile(User.objects.get(pk=self.user.pk)).warnings, 2)
+
+
+class ManagerProfileTests(TestCase):
+
+    def setUp(self):
+        self.manager = make_user('boss', 'MN')
+
+    def test_dashboard_data_is_only_loaded_for_managers(self):
+        self.client.force_login(make_user('nosy', 'CU'))
+        response = self.client.get(reverse('profile', args=[self.manager.id]))
+        self.assertNotIn('ai_cache_stats', response.context)
+        self.assertNotIn('queue_counts', response.context)
+
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('profile', args=[self.manager.id]))
+        self.assertIn('hits', response.context['ai_cache_stats'])
+        self.assertIn('pending_orders', response.context['queue_counts'])
+
+
+@unittest.skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'query plans are checked on SQLite and PostgreSQL')
+class HotQueryPlanTests(TestCase):
+
+    def setUp(self):
+        make_user('diner', 'CU')
+        make_user('rider', 'DL')
+        Thread.objects.create(title='Plans', creation_date=timezone.now())
+
+    def test_hot_queries_use_their_indexes(self):
+        for label, qs, index in hot_queries():
+            with self.subTest(label):
+                plan = explain(qs)
+                self.assertEqual(full_scans(plan, connection.vendor), [], plan)
+                if index and connection.vendor == 'sqlite':
+                    # PostgreSQL may prefer another index on empty tables
+                    self.assertIn(index, plan)
+
+
+class PercentileTests(SimpleTestCase):
+
+    def test_nearest_rank(self):
+        samples = [5, 1, 4, 2, 3]
+        self.assertEqual(stats.percentile(samples, 50), 3)
+        self.assertEqual(stats.percentile(samples, 99), 5)
+        self.assertEqual(stats.percentile(samples, 0), 1)
+        self.assertIsNone(stats.percentile([], 50))
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        instrumentation.clear()
+
+    @override_settings(REQUEST_METRICS={})
+    def test_off_unless_enabled(self):
+        self.assertFalse(instrumentation.metrics_settings()['ENABLED'])
+        response = self.client.get(reverse('faq'))
+        self.assertEqual(instrumentation.samples(), [])
+        self.assertNotIn('X-Query-Count', response)
+
+    def test_records_queries_per_view(self):
+        conf = {'ENABLED': True, 'QUERY_COUNT_HEADER': True}
+        with override_settings(REQUEST_METRICS=conf):
+            response = self.client.get(reverse('faq'))
+        [sample] = instrumentation.samples()
+        self.assertEqual(sample['view'], 'AIRestaurant.views.faq')
+        self.assertEqual(response['X-Query-Count'], str(sample['queries']))
+        [row] = instrumentation.report()
+        self.assertEqual(row['requests'], 1)
+        self.assertEqual(row['wall_ms_p50'], sample['wall_ms'])
+
+    def test_prometheus_export_has_no_counters(self):
+        # Buffer sums shrink as samples are evicted, which a counter must never do
+        sampled = [
+            {'view': 'app.views.menu', 'status': status, 'queries': 3,
+             'db_ms': 2.0, 'template_ms': 4.0, 'wall_ms': 10.0}
+            for status in (200, 500)
+        ]
+        text = instrumentation.to_prometheus(instrumentation.report(sampled))
+        types = [line.split()[3] for line in text.splitlines() if line.startswith('# TYPE')]
+        self.assertEqual(set(types), {'gauge'})
+        self.assertNotIn('_total', text)
+        self.assertIn('air_view_buffered_requests{view="app.views.menu"} 2', text)
+        self.assertIn('air_view_buffered_errors{view="app.views.menu"} 1', text)
+        self.assertIn('air_view_buffered_wall_seconds{view="app.views.menu"} 0.02', text)
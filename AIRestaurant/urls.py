@@ -8,6 +8,7 @@ urlpatterns = [
     path('menu/', views.menu, name='menu'),
     path('merch/', views.merch, name='merch'),
     path('faq/', views.faq, name='faq'),
+    path('faq/search/', views.faq_search, name='faq_search'),
     path('report_faq/', views.report_faq, name='report_faq'),
     path('keep_faq/<int:report_id>/', views.keep_faq, name='keep_faq'),
     path('delete_faq/<int:report_id>/', views.delete_faq, name='delete_faq'),
@@ -18,6 +19,7 @@ urlpatterns = [
     path('discussions/', views.discussions, name='discussions'),
     path('create_thread/', views.create_thread, name='create_thread'),
     path('thread/<int:thread_id>/', views.thread_view, name='thread'),
+    path('thread/<int:thread_id>/messages/', views.thread_messages, name='thread_messages'),
     path('delete_message/', views.delete_message, name='delete_message'),
     path('delete_thread/', views.delete_thread, name='delete_thread'),
     path('edit_thread/', views.edit_thread, name='edit_thread'),
@@ -63,6 +65,8 @@ urlpatterns = [
     path('manager/', views.manager, name='manager'),
     # Generic profile view by user id (used by thread/profile links)
     path('profile/<int:user_id>/', views.profile_view, name='profile'),
+    path('manager/queue/<slug:queue>/', views.manager_queue, name='manager_queue'),
+    path('manager/metrics/', views.request_metrics, name='request_metrics'),
     path('cart/', views.cart, name='cart'),
     path('update_cart/', views.update_cart, name='update_cart'),
     
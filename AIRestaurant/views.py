@@ -1,11 +1,14 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 import json
-from subprocess import run as shell
-from urllib.parse import unquote
+import time
+from datetime import datetime
+from urllib.parse import unquote, urlencode
 from django.shortcuts import get_object_or_404
 from types import SimpleNamespace
-import socket
 from .models import (
     User as DataUser,
     Customer,
@@ -25,7 +28,8 @@ from .models import (
     ReportedFAQ,
     Bid,
 )
-from django.db.models import Avg, Count
+from django.db.models import Avg, Count, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.shortcuts import redirect
 from django.contrib import messages
@@ -35,7 +39,11 @@ from django.views.decorators.csrf import csrf_exempt
 from .data.message import Thread
 from django.contrib.auth import authenticate, login, logout as auth_logout
 from django.urls import reverse
-from .faq import search_entries, create_entry, tokenize
+from .faq import (
+    search_entries, create_entry, tokenize, rank_entries, list_entries, OVERLAP_THRESHOLD,
+    encode_cursor, decode_cursor,
+)
+from . import llm, answer_cache, catalog, instrumentation, profiles, realtime, reputation, search
 
 def home(request):
     return render(request, 'index.html', {'user': request.user})
@@ -44,6 +52,7 @@ def menu(request):
 
     Provides per-dish average rating and rating count, and exposes a
     simple `can_rate` flag used by the template for logged-in customers.
+    Dishes and their rating stats come from the cached catalog.
     """
     # Only VIP customers should see VIP-exclusive items.
     is_vip_customer = (
@@ -52,29 +61,21 @@ def menu(request):
         and getattr(request.user, 'is_vip', False)
     )
 
-    base_qs = Product.objects.filter(type='food')
-    if not is_vip_customer:
-        base_qs = base_qs.filter(vip_exclusive=False)
-
-    dishes_qs = base_qs.annotate(
-        avg_rating=Avg('productrating__rating'),
-        rating_count=Count('productrating')
-    )
+    dishes_qs = catalog.get_products('food', vip=is_vip_customer)
 
     is_customer = (
         request.user.is_authenticated and
         getattr(request.user, 'type', None) == 'CU'
     )
 
-    # Look at any in-progress cart stored in the session so the
-    # quantities shown on the menu reflect what is already in the cart.
-    session_cart = request.session.get('cart', {}) or {}
+    # Look at any in-progress cart so the quantities shown on the menu
+    # reflect what is already in the cart.
+    session_cart = request.cart.get()
 
     # Attach convenient attributes used by the template
     dishes = []
     for d in dishes_qs:
         d.average_rating = (d.avg_rating or 0)
-        d.rating_count = d.rating_count
         d.can_rate = is_customer
         # Initial quantity for this dish based on the cart
         try:
@@ -89,7 +90,8 @@ def menu(request):
 def merch(request):
     """Show restaurant merchandise using the shared product list layout.
 
-    Merch items are stored as `Product` rows tagged with type='merch'.
+    Merch items are stored as `Product` rows tagged with type='merch'
+    and served from the cached catalog.
     """
     # Only VIP customers should see VIP-exclusive merch.
     is_vip_customer = (
@@ -98,22 +100,14 @@ def merch(request):
         and getattr(request.user, 'is_vip', False)
     )
 
-    base_qs = Product.objects.filter(type='merch')
-    if not is_vip_customer:
-        base_qs = base_qs.filter(vip_exclusive=False)
-
-    products_qs = base_qs.annotate(
-        avg_rating=Avg('productrating__rating'),
-        rating_count=Count('productrating'),
-    )
+    products_qs = catalog.get_products('merch', vip=is_vip_customer)
 
-    # Reuse the same session-based cart; quantities reflect in-progress merch
-    session_cart = request.session.get('cart', {}) or {}
+    # Reuse the same cart; quantities reflect in-progress merch
+    session_cart = request.cart.get()
 
     merch_items = []
     for p in products_qs:
         p.average_rating = p.avg_rating or 0
-        p.rating_count = p.rating_count
         p.can_rate = False
         try:
             p.initial_qty = int(session_cart.get(str(p.id), 0))
@@ -160,9 +154,9 @@ def rate_dish(request, dish_id):
         dr.rating = rating_val
         dr.save()
 
-        # Recompute aggregate rating info to return to the client if needed
-        agg = ProductRating.objects.filter(product=dish).aggregate(avg=Avg('rating'), count=Count('id'))
-        avg_rating = agg['avg'] or 0
+        # Running totals were updated with the rating save (see signals.py)
+        dish.refresh_from_db(fields=['rating_sum', 'rating_count'])
+        avg_rating = dish.avg_rating or 0
 
         # If this dish belongs to a chef, adjust their employment
         # status based on the aggregate rating, using the same
@@ -201,7 +195,7 @@ def rate_dish(request, dish_id):
             'status': 'ok',
             'dish_id': dish.id,
             'average_rating': avg_rating,
-            'rating_count': agg['count'] or 0,
+            'rating_count': dish.rating_count,
         })
     except Exception as e:
         # Surface the underlying error so the frontend can display it
@@ -213,9 +207,9 @@ def deposit(request):
         messages.error(request, 'Please log in to access the deposit page.')
         return redirect('login')
     
-    try:
-        customer = Customer.objects.get(login=request.user)
-    except Customer.DoesNotExist:
+    # Fresh copy: this view changes the customer's balance
+    customer = profiles.get_profile(request.user, fresh=True)
+    if not isinstance(customer, Customer):
         messages.error(request, 'Customer profile not found.')
         return redirect('index')
     
@@ -231,8 +225,7 @@ def deposit(request):
             return render(request, 'deposit.html', {'customer': customer, 'form': {'amount': amount_str}})
 
         # Update user balance
-        customer.balance += amount_cents
-        customer.save()
+        customer.deposit(amount_cents)
 
         messages.success(request, f'Successfully deposited ${amount_cents / 100:.2f} to your account.')
         return redirect('deposit')
@@ -240,15 +233,28 @@ def deposit(request):
     return render(request, 'deposit.html', {'customer': customer, 'form': {}})
 
 def remove_from_cart(request, menu_id):
-    """Remove a dish from the session-based cart and redirect back."""
+    """Remove a dish from the cart and redirect back."""
     if request.method == 'POST':
-        cart = request.session.get('cart', {}) or {}
+        cart = request.cart.get()
         cart.pop(str(menu_id), None)
-        request.session['cart'] = cart
-        request.session.modified = True
+        request.cart.set(cart)
     return redirect('cart')
 
 
+def _order_items():
+    """Prefetch of order lines for display: one query, names and quantities.
+
+    Order totals are stored on the order itself, so listings never need
+    the full product rows.
+    """
+    return Prefetch(
+        'items',
+        queryset=OrderedDish.objects.select_related('product').only(
+            'from_order_num', 'quantity', 'unit_price_cents', 'product__name',
+        ),
+    )
+
+
 def place_order(request):
     """Finalize an order: persist Order/OrderedDish and charge balance."""
     if request.method != 'POST':
@@ -259,13 +265,13 @@ def place_order(request):
         messages.error(request, 'Only logged-in customers can place orders.')
         return redirect('login')
 
-    try:
-        customer = Customer.objects.get(login=request.user)
-    except Customer.DoesNotExist:
+    # Fresh copy: this view changes the customer's balance
+    customer = profiles.get_profile(request.user, fresh=True)
+    if not isinstance(customer, Customer):
         messages.error(request, 'Customer profile not found.')
         return redirect('index')
 
-    cart = request.session.get('cart', {}) or {}
+    cart = request.cart.get()
     if not cart:
         messages.error(request, 'Your cart is empty.')
         return redirect('menu')
@@ -331,18 +337,17 @@ def place_order(request):
         messages.error(request, 'Insufficient balance. Your warning count has increased by one.')
         return redirect('cart')
 
-    # Use the domain method to create an Order and charge balance
+    # Use the domain method to create an Order and charge balance in one
+    # transaction; it re-checks the balance atomically, so a concurrent
+    # checkout that spent it first makes this one fail cleanly.
     try:
-        order = customer.order(ordered_rows, order_type=order_type or "food")
-        order.customer = customer
-        order.save()
+        customer.order(ordered_rows, order_type=order_type or "food")
     except ValueError as e:
         messages.error(request, str(e))
         return redirect('cart')
 
     # Clear cart after successful charge
-    request.session['cart'] = {}
-    request.session.modified = True
+    request.cart.clear()
 
     messages.success(request, f'Order placed successfully for ${effective_total_cents / 100:.2f}.')
     return redirect('order_history')
@@ -364,8 +369,8 @@ def rate_chef(request, order_id):
     order = get_object_or_404(Order, pk=order_id)
 
     # Ensure this order belongs to the logged-in customer
-    customer = Customer.objects.filter(login=request.user).first()
-    if customer is None or order.customer_id != customer.id:
+    customer = request.profile
+    if not customer or order.customer_id != customer.id:
         messages.error(request, 'You can only rate your own orders.')
         return redirect('order_history')
 
@@ -384,22 +389,18 @@ def rate_chef(request, order_id):
     order.save(update_fields=['rating'])
 
     # If this order has an assigned deliverer, update their
-    # employment status based on the average rating across all
-    # their delivered orders, mirroring the chef rating logic.
-    if order.assigned_deliverer is not None:
-        try:
-            deliverer = Deliverer.objects.get(login=order.assigned_deliverer)
-        except Deliverer.DoesNotExist:
-            deliverer = None
+    # employment status based on the average rating of their most
+    # recent deliveries (DELIVERER_RATING_WINDOW), mirroring the chef
+    # rating logic.
+    if order.assigned_deliverer_id is not None:
+        deliverer = (
+            Deliverer.objects.select_related('login')
+            .filter(login_id=order.assigned_deliverer_id)
+            .first()
+        )
 
         if deliverer is not None and getattr(deliverer.login, 'type', None) == 'DL':
-            from django.db.models import Avg as _Avg
-
-            agg = Order.objects.filter(
-                assigned_deliverer=order.assigned_deliverer,
-                rating__isnull=False,
-            ).aggregate(avg=_Avg('rating'))
-            avg_rating = agg['avg'] or 0
+            avg_rating = deliverer.recent_average() or 0
 
             # Low average rating (<= 2): demotion, then firing on repeat
             # following OK -> Demoted -> Warned -> Fired.
@@ -586,7 +587,7 @@ def plea_forgive(request, plea_id):
     if customer:
         if customer.warnings > 0:
             customer.warnings -= 1
-        customer.save()
+            customer.save(update_fields=['warnings'])
 
     # Reactivate account
     user.status = 'AC'
@@ -613,20 +614,10 @@ def assign_order(request, order_id):
         return redirect('index')
 
     order = get_object_or_404(
-        Order.objects.select_related('customer__login').prefetch_related('items__product', 'bids__deliverer'),
+        Order.objects.select_related('customer__login').prefetch_related(_order_items(), 'bids__deliverer'),
         pk=order_id,
     )
 
-    # Compute total in dollars for display
-    total_cents = 0
-    for item in order.items.all():
-        try:
-            total_cents += item.total_cost()
-        except Exception:
-            if getattr(item, 'product', None) is not None and item.quantity:
-                total_cents += item.product.price * item.quantity
-    order.total_amount = total_cents / 100.0
-
     # All bids for this order, with a convenient dollars field
     bids = list(order.bids.all().select_related('deliverer'))
     for b in bids:
@@ -696,18 +687,15 @@ def order_history(request):
         messages.error(request, 'Please log in as a customer to view your order history.')
         return redirect('login')
 
-    try:
-        customer = Customer.objects.get(login=request.user)
-    except Customer.DoesNotExist:
+    customer = request.profile
+    if not isinstance(customer, Customer):
         messages.error(request, 'Customer profile not found.')
         return redirect('index')
 
-    orders = Order.objects.filter(customer=customer).prefetch_related('items__product').order_by('-date')
+    orders = Order.objects.filter(customer=customer).prefetch_related(_order_items()).order_by('-date')
 
-    # For compatibility with the existing template, annotate simple totals
+    # For compatibility with the existing template, alias `date`
     for o in orders:
-        total_cents = sum(od.total_cost() for od in o.items.all())
-        o.total_amount = total_cents / 100.0
         # Template expects `timestamp`; alias our `date` field
         o.timestamp = o.date
 
@@ -728,11 +716,7 @@ def login(request):
                     fired = False
                     user_type = getattr(user, 'type', None)
                     if user_type in ('CH', 'DL'):
-                        employee = None
-                        if user_type == 'CH':
-                            employee = Chef.objects.filter(login=user).first()
-                        elif user_type == 'DL':
-                            employee = Deliverer.objects.filter(login=user).first()
+                        employee = profiles.get_profile(user)
                         if employee is not None and getattr(employee, 'status', None) == 'FD':
                             fired = True
 
@@ -763,6 +747,9 @@ def login(request):
 
 def logout(request):
     """Log the user out and clear session-based user id, then show logout page."""
+    # Drop the cart while we still know whose it is (cookie carts are per user)
+    request.cart.clear()
+
     # log out Django auth session (if any)
     try:
         auth_logout(request)
@@ -778,7 +765,7 @@ def logout(request):
     return render(request, 'logout.html')
 
 def update_cart(request):
-    """Store the current cart (dish id -> quantity) in the session.
+    """Store the current cart (dish id -> quantity) with the cart backend.
 
     Expects a POST with a JSON-encoded `cart` payload from menu.js.
     """
@@ -794,34 +781,26 @@ def update_cart(request):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid cart payload.'}, status=400)
 
-    # Normalize quantities to integers >= 0
-    normalized = {}
-    for dish_id, qty in cart_data.items():
-        try:
-            qty_int = int(qty)
-        except (TypeError, ValueError):
-            continue
-        if qty_int > 0:
-            normalized[str(dish_id)] = qty_int
+    if not isinstance(cart_data, dict):
+        return JsonResponse({'error': 'Invalid cart payload.'}, status=400)
 
-    request.session['cart'] = normalized
-    request.session.modified = True
+    # Quantities are normalized to positive integers by the backend
+    request.cart.set(cart_data)
     return JsonResponse({'status': 'ok'})
 
 
 def cart(request):
-    """Render the cart page based on the session cart contents."""
+    """Render the cart page based on the cart contents."""
     if not request.user.is_authenticated or getattr(request.user, 'type', None) != 'CU':
         messages.error(request, 'Please log in as a customer to view your cart.')
         return redirect('login')
 
-    try:
-        customer = Customer.objects.get(login=request.user)
-    except Customer.DoesNotExist:
+    customer = request.profile
+    if not isinstance(customer, Customer):
         messages.error(request, 'Customer profile not found.')
         return redirect('index')
 
-    session_cart = request.session.get('cart', {}) or {}
+    session_cart = request.cart.get()
     if not session_cart:
         return render(request, 'cart.html', {
             'cart': {},
@@ -909,21 +888,10 @@ def available_orders(request):
         Order.objects
         .filter(status='pending', assigned_deliverer__isnull=True)
         .select_related('customer__login')
-        .prefetch_related('items__product')
+        .prefetch_related(_order_items())
         .order_by('-date')
     )
-
-    orders = []
-    for order in orders_qs:
-        total_cents = 0
-        for item in order.items.all():
-            try:
-                total_cents += item.total_cost()
-            except Exception:
-                if getattr(item, 'product', None) is not None and item.quantity:
-                    total_cents += item.product.price * item.quantity
-        order.total_amount = total_cents / 100.0
-        orders.append(order)
+    orders = list(orders_qs)
 
     return render(request, 'available_orders.html', {'orders': orders})
 
@@ -943,20 +911,10 @@ def delivery_bid(request, order_id):
         return redirect('index')
 
     order = get_object_or_404(
-        Order.objects.select_related('customer__login').prefetch_related('items__product', 'bids__deliverer'),
+        Order.objects.select_related('customer__login').prefetch_related(_order_items(), 'bids__deliverer'),
         pk=order_id,
     )
 
-    # Compute a display total in dollars from line items
-    total_cents = 0
-    for item in order.items.all():
-        try:
-            total_cents += item.total_cost()
-        except Exception:
-            if getattr(item, 'product', None) is not None and item.quantity:
-                total_cents += item.product.price * item.quantity
-    order.total_amount = total_cents / 100.0
-
     # Existing bid (if any) from this deliverer for this order
     existing_bid = Bid.objects.filter(order=order, deliverer=request.user).first()
 
@@ -1031,20 +989,12 @@ def my_deliveries(request):
         Order.objects
         .filter(assigned_deliverer=request.user)
         .select_related('customer__login')
-        .prefetch_related('items__product')
+        .prefetch_related(_order_items())
         .order_by('-date')
     )
 
     orders = []
     for order in orders_qs:
-        total_cents = 0
-        for item in order.items.all():
-            try:
-                total_cents += item.total_cost()
-            except Exception:
-                if getattr(item, 'product', None) is not None and item.quantity:
-                    total_cents += item.product.price * item.quantity
-        order.total_amount = total_cents / 100.0
         order.timestamp = order.date
         orders.append(order)
 
@@ -1089,41 +1039,101 @@ def customer(request, profile: str = None):
 
     return profile_view(request, user.id)
 
-def ai_chat(request):
+def _ai_chat_events(question, on_answer=None):
+    """Server-sent events for a streamed AI answer.
 
-    # API-style endpoint used by FAQ page; POST only.
-    if request.method != 'POST':
-        return JsonResponse({"error": "Method not allowed"}, status=405)
+    Emits one `data:` event per token, then a final `done` event (or an
+    `error` event) carrying the answer source and time-to-first-token.
+    A complete answer is passed to `on_answer(question, answer)`, which
+    defaults to caching it.
+    """
+    started = time.perf_counter()
+    ttft = None
+    tokens = []
+    try:
+        for token in llm.get_pool().stream(question):
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            tokens.append(token)
+            yield f"data: {json.dumps({'token': token})}\n\n"
+    except TimeoutError:
+        yield f"event: error\ndata: {json.dumps({'error': '<AI timed out>'})}\n\n"
+        return
+    except Exception:
+        yield f"event: error\ndata: {json.dumps({'error': '<AI failed>'})}\n\n"
+        return
+    (on_answer or answer_cache.store)(question, ''.join(tokens))
+    yield f"event: done\ndata: {json.dumps({'source': 'AI', 'rating_id': 0, 'ttft': ttft})}\n\n"
 
-    question = unquote(request.POST.get('query'))
 
-    # Compute model path dynamically instead of hard-coding absolute paths.
-    # This preserves the existing locations:
-    #  - Local dev:   <parent-of-project>/tinyllama-....gguf
-    #  - PythonAnywhere:  ~/AI/tinyllama-....gguf
-    from pathlib import Path
-    import os
+async def _aiter_events(question):
+    """`_ai_chat_events` under ASGI, reading tokens on worker threads.
 
-    hostname = socket.gethostname()
-    base_dir = Path(__file__).resolve().parent.parent
+    Each step may run on a different executor thread, so the generator
+    must not touch the database; the answer is cached afterwards from
+    the request's own sync thread.
+    """
+    answers = []
+    events = _ai_chat_events(question, on_answer=lambda q, answer: answers.append(answer))
+    next_event = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            event = await next_event(events, None)
+            if event is None:
+                break
+            yield event
+    finally:
+        await sync_to_async(events.close, thread_sensitive=False)()
+    for answer in answers:
+        await sync_to_async(answer_cache.store)(question, answer)
 
-    if hostname.endswith('.local'):
-        # Local machine: model lives one directory above the project root
-        default_model = base_dir.parent / 'tinyllama-1.1b-chat-v1.0.Q4_0.gguf'
-    else:
-        # Server (e.g. PythonAnywhere): model lives under ~/AI
-        default_model = Path.home() / 'AI' / 'tinyllama-1.1b-chat-v1.0.Q4_0.gguf'
 
-    model_path = Path(os.environ.get('AI_MODEL_PATH', default_model))
+def ai_chat(request):
 
-    cmd = ['llama-run', str(model_path)]
+    # API-style endpoint used by FAQ page; POST only.
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
 
-    result = shell(
-        cmd,
-        capture_output=True,
-        input=question,
-        encoding='utf-8')
-    response = result.stdout.replace("\x1b[0m", "") if result.returncode == 0 else "<AI failed>"
+    question = unquote(request.POST.get('query'))
+    stream = request.POST.get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+
+    # Repeated questions are answered from the cache without the model.
+    cached = answer_cache.lookup(question)
+    if cached is not None:
+        if stream:
+            events = [
+                f"data: {json.dumps({'token': cached})}\n\n",
+                f"event: done\ndata: {json.dumps({'source': 'cache', 'rating_id': 0, 'ttft': 0})}\n\n",
+            ]
+            return StreamingHttpResponse(events, content_type='text/event-stream')
+        return JsonResponse({
+            "answer": cached,
+            "rating_id": 0,
+            "source": "cache",
+        })
+
+    # Streaming mode: send tokens as server-sent events while the model
+    # is still generating.
+    if stream:
+        if isinstance(request, ASGIRequest):
+            # Under ASGI a synchronous iterator would be buffered whole.
+            events = _aiter_events(question)
+        else:
+            events = _ai_chat_events(question)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    # The model lives in a long-lived worker pool (see llm.py), so this
+    # view only waits for its own answer instead of loading the model.
+    try:
+        response = llm.get_pool().ask(question)
+        answer_cache.store(question, response)
+    except TimeoutError:
+        response = "<AI timed out>"
+    except Exception:
+        response = "<AI failed>"
 
     return JsonResponse({
         "answer": response,
@@ -1202,10 +1212,7 @@ def profile_view(request, user_id):
         # Chef-specific average dish rating
         if target.type == 'CH':
             try:
-                avg = ProductRating.objects.filter(
-                    product__type='food',
-                    product__creator__login=target,
-                ).aggregate(avg=Avg('rating'))['avg']
+                avg = employee.average_rating() if employee is not None else None
                 if avg is not None:
                     context['avg_dish_rating'] = round(avg, 2)
             except Exception:
@@ -1238,34 +1245,16 @@ def profile_view(request, user_id):
     # private_visible: private fields shown to owner and managers
     context['private_visible'] = is_owner or is_manager_viewer
 
-    # For managers, include pending registration requests, pleas, complaints,
-    # and any customer orders that are still pending.
-    if target.type == 'MN':
-        context['pending_users'] = list(DataUser.objects.filter(status='PN').order_by('date_joined'))
-        context['pleas'] = list(Plea.objects.select_related('sender').order_by('-created_at'))
-        # Show all complaints that are in a pending state. Some older
-        # rows may have string 'pending', newer ones use the short code 'p'.
-        context['pending_complaints'] = list(
-            Complaint.objects.filter(status__in=['p', 'pending'])
-            .select_related('sender', 'to', 'message')
-            .order_by('-id')
-        )
-
-        # Pending orders: all orders with status='pending'. At the moment
-        # there is no explicit deliverer assignment on the Order model, so
-        # "unassigned" and "pending" are equivalent.
-        context['pending_orders'] = list(
-            Order.objects.filter(status='pending')
-            .select_related('customer')
-            .order_by('-date')
-        )
+    # For managers, count pending registration requests, pleas, complaints,
+    # pending orders and reported FAQs. The rows themselves are loaded page
+    # by page from `manager_queue` so large backlogs stay cheap.
+    if target.type == 'MN' and is_manager_viewer:
+        context['queue_counts'] = {
+            name: queue.queryset.count() for name, queue in _manager_queues().items()
+        }
 
-        # Reported FAQ entries
-        context['reported_faqs'] = list(
-            ReportedFAQ.objects.filter(status='pending')
-            .select_related('faq_entry', 'reported_by')
-            .order_by('-reported_at')
-        )
+        # AI answer cache effectiveness
+        context['ai_cache_stats'] = answer_cache.stats()
 
     # pick template by target type
     tpl_map = {'CU': 'customer.html', 'CH': 'chef.html', 'DL': 'deliverer.html', 'MN': 'manager.html'}
@@ -1274,28 +1263,166 @@ def profile_view(request, user_id):
     return render(request, tpl, context)
 
 
+MANAGER_QUEUE_PAGE_SIZE = 25
+
+
+def _manager_queues():
+    """Manager dashboard queues: name -> rows, keyset order and row template.
+
+    `sort` is the timestamp each queue is ordered by (None orders by id
+    alone); ties and the cursor fall back to the id.
+    """
+    return {
+        'pending_users': SimpleNamespace(
+            queryset=DataUser.objects.filter(status='PN'),
+            sort='date_joined', newest_first=False, template='_pending_users_rows.html',
+        ),
+        'pending_orders': SimpleNamespace(
+            queryset=Order.objects.filter(status='pending').select_related('customer__login'),
+            sort='date', newest_first=True, template='_pending_orders_rows.html',
+        ),
+        'pleas': SimpleNamespace(
+            queryset=Plea.objects.select_related('sender'),
+            sort='created_at', newest_first=True, template='_pleas_rows.html',
+        ),
+        # Some older rows use the string 'pending' instead of the short code 'p'
+        'pending_complaints': SimpleNamespace(
+            queryset=Complaint.objects.filter(status__in=['p', 'pending']).select_related('sender', 'to', 'message'),
+            sort=None, newest_first=True, template='_pending_complaints_rows.html',
+        ),
+        'reported_faqs': SimpleNamespace(
+            queryset=ReportedFAQ.objects.filter(status='pending').select_related('faq_entry', 'reported_by'),
+            sort='reported_at', newest_first=True, template='_reported_faqs_rows.html',
+        ),
+    }
+
+
+def _queue_page(queue, cursor=None, limit=MANAGER_QUEUE_PAGE_SIZE):
+    """One keyset page of a manager queue as (rows, next_cursor)."""
+    qs = queue.queryset
+    op = 'lt' if queue.newest_first else 'gt'
+    if queue.sort:
+        position = decode_cursor(cursor, datetime) if cursor else None
+        if position is not None:
+            value, last_id = position
+            qs = qs.filter(
+                Q(**{f'{queue.sort}__{op}': value}) | Q(**{queue.sort: value, f'id__{op}': last_id})
+            )
+        order = [queue.sort, 'id']
+    else:
+        if cursor and cursor.isdigit():
+            qs = qs.filter(**{f'id__{op}': int(cursor)})
+        order = ['id']
+    if queue.newest_first:
+        order = ['-' + field for field in order]
+
+    rows = list(qs.order_by(*order)[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if queue.sort:
+        return rows, encode_cursor(getattr(last, queue.sort), last.id)
+    return rows, str(last.id)
+
+
+def manager_queue(request, queue):
+    """One page of a manager dashboard queue as rendered table rows.
+
+    Returns JSON with the rows' `html` and the `next` cursor (null on the
+    last page); the first page also carries the queue's `count`.
+    """
+    viewer = request.user
+    viewer_type = getattr(viewer, 'type', None)
+    is_manager = getattr(viewer, 'is_staff', False) or getattr(viewer, 'is_superuser', False) or (viewer_type == 'MN')
+    if not is_manager:
+        return JsonResponse({'error': 'Only managers can view the dashboard queues.'}, status=403)
+
+    spec = _manager_queues().get(queue)
+    if spec is None:
+        return JsonResponse({'error': 'Unknown queue.'}, status=404)
+
+    cursor = request.GET.get('cursor')
+    rows, next_cursor = _queue_page(spec, cursor)
+    data = {
+        'html': render_to_string(spec.template, {'rows': rows}, request=request),
+        'next': next_cursor,
+    }
+    if not cursor:
+        data['count'] = spec.queryset.count()
+    return JsonResponse(data)
+
+
+def request_metrics(request):
+    """Per-view query and latency report of this process, for managers.
+
+    `?format=prometheus` returns the Prometheus text format instead of
+    JSON.
+    """
+    viewer = request.user
+    viewer_type = getattr(viewer, 'type', None)
+    is_manager = getattr(viewer, 'is_staff', False) or getattr(viewer, 'is_superuser', False) or (viewer_type == 'MN')
+    if not is_manager:
+        return JsonResponse({'error': 'Only managers can view request metrics.'}, status=403)
+
+    rows = instrumentation.report()
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(instrumentation.to_prometheus(rows), content_type='text/plain; version=0.0.4')
+    return JsonResponse({'views': rows})
+
+
 def discussions(request):
-    """List recent threads and support searching by title via GET param `q`.
+    """List recent threads and support full-text search via GET param `q`.
 
-    For improved UX we pass along per-thread metadata so the template can
-    display a message count and a short preview of the latest message.
+    Searches cover thread titles and message bodies, ranked by relevance
+    with the matching fragments highlighted. For improved UX we pass along
+    per-thread metadata so the template can display a message count and a
+    short preview of the latest message.
     """
     q = request.GET.get('q', '').strip()
+    hits = {}
     if q:
-        threads_qs = Thread.objects.filter(title__icontains=q).order_by('-creation_date')[:50]
+        hits = {h.thread_id: h for h in search.search_threads(q, limit=50)}
+        threads_qs = Thread.objects.filter(id__in=list(hits))
     else:
-        threads_qs = Thread.objects.all().order_by('-creation_date')[:10]
+        threads_qs = Thread.objects.all()
+
+    # Message count and latest message come from correlated subqueries so
+    # the whole listing is a single query.
+    thread_messages = Message.objects.filter(thread=OuterRef('pk'))
+    latest = thread_messages.order_by('-when', '-id')
+    threads_qs = threads_qs.annotate(
+        message_count=Coalesce(
+            Subquery(thread_messages.order_by().values('thread').annotate(n=Count('id')).values('n')),
+            0,
+        ),
+        last_message=Subquery(latest.values('message')[:1]),
+        last_who=Subquery(latest.values('who__username')[:1]),
+    ).order_by('-creation_date')
+    if not q:
+        threads_qs = threads_qs[:10]
 
     # Build a lightweight list of dicts with thread + activity metadata
     threads = []
     for t in threads_qs:
-        last_msg = Message.objects.filter(thread=t).select_related('who').order_by('-when').first()
-        count = Message.objects.filter(thread=t).count()
+        last_msg = None
+        if t.last_message is not None:
+            last_msg = SimpleNamespace(
+                message=t.last_message,
+                who=SimpleNamespace(username=t.last_who) if t.last_who is not None else None,
+            )
+        hit = hits.get(t.id)
         threads.append({
             'thread': t,
-            'count': count,
+            'count': t.message_count,
             'last': last_msg,
+            'title_html': hit.title_html if hit else None,
+            'snippet_html': hit.snippet_html if hit else None,
+            'rank': hit.rank if hit else None,
         })
+    if q:
+        # Best match first (lower bm25 rank is better)
+        threads.sort(key=lambda item: item['rank'])
 
     return render(request, 'discussions.html', {
         'threads': threads,
@@ -1415,10 +1542,11 @@ def manage_menu(request):
 
 
 def manage_users(request):
-    """Manager-only view listing all users and their key details.
+    """Manager-only view listing users and their key details.
 
     Shows account status, role, and any associated profile/employee metrics
-    to help managers make informed decisions.
+    to help managers make informed decisions. Users are listed a page at a
+    time and can be filtered by role (`type`) and account `status`.
     """
     viewer = request.user
     viewer_type = getattr(viewer, 'type', None)
@@ -1486,17 +1614,39 @@ def manage_users(request):
                         pass
 
         messages.success(request, f'User {target.username} updated.')
-        return redirect('manage_users')
-
-    users = list(
-        DataUser.objects.all()
-        .order_by('id')
+        # Back to the same filtered page
+        url = reverse('manage_users')
+        if request.GET:
+            url += '?' + request.GET.urlencode()
+        return redirect(url)
+
+    role = request.GET.get('type', '')
+    if role not in USER_TYPES:
+        role = ''
+    status = request.GET.get('status', '')
+    if status not in USER_STATUSES:
+        status = ''
+    users, prev_cursor, next_cursor = _manage_users_page(
+        role, status, request.GET.get('after'), request.GET.get('before'),
     )
 
-    customer_map = {c.login_id: c for c in CustomerProfile.objects.all()}
-    chef_map = {c.login_id: c for c in ChefProfile.objects.all()}
-    deliverer_map = {d.login_id: d for d in DelivererProfile.objects.all()}
-    manager_map = {m.login_id: m for m in ManagerProfile.objects.all()}
+    # Profiles of this page only, one query per role present on it
+    ids_by_type = {}
+    for u in users:
+        ids_by_type.setdefault(u.type, []).append(u.id)
+
+    def profile_map(user_type, queryset):
+        ids = ids_by_type.get(user_type)
+        if not ids:
+            return {}
+        return {p.login_id: p for p in queryset.filter(login_id__in=ids)}
+
+    # Scores come from the stored reputation counters, computed in SQL
+    scored = reputation.score_expression()
+    customer_map = profile_map('CU', CustomerProfile.objects.all())
+    chef_map = profile_map('CH', ChefProfile.objects.annotate(reputation=scored))
+    deliverer_map = profile_map('DL', DelivererProfile.objects.annotate(reputation=scored))
+    manager_map = profile_map('MN', ManagerProfile.objects.all())
 
     # Attach lightweight profile info per user for the template
     user_rows = []
@@ -1504,7 +1654,6 @@ def manage_users(request):
         profile = None
         employee = None
         extra = {}
-
         if u.type == 'CU':
             profile = customer_map.get(u.id)
             if profile is not None:
@@ -1523,14 +1672,10 @@ def manage_users(request):
             profile = manager_map.get(u.id)
 
         if employee is not None:
-            try:
-                score_val = employee.score()
-            except Exception:
-                score_val = None
             extra.update({
                 'employee_status': employee.get_status_display(),
                 'employee_salary_dollars': (employee.salary or 0) / 100.0,
-                'employee_score': score_val,
+                'employee_score': employee.reputation,
             })
 
         user_rows.append({
@@ -1539,12 +1684,59 @@ def manage_users(request):
             'extra': extra,
         })
 
+    filters = {k: v for k, v in (('type', role), ('status', status)) if v}
     return render(request, 'manage_users.html', {
         'viewer': viewer,
         'user_rows': user_rows,
+        'user_types': USER_TYPES,
+        'user_statuses': USER_STATUSES,
+        'selected_type': role,
+        'selected_status': status,
+        'prev_query': urlencode({**filters, 'before': prev_cursor}) if prev_cursor else None,
+        'next_query': urlencode({**filters, 'after': next_cursor}) if next_cursor else None,
     })
 
 
+MANAGE_USERS_PAGE_SIZE = 50
+USER_TYPES = dict(DataUser._meta.get_field('type').choices)
+USER_STATUSES = dict(DataUser._meta.get_field('status').choices)
+
+
+def _manage_users_page(role, status, after=None, before=None, limit=MANAGE_USERS_PAGE_SIZE):
+    """One page of users in id order, as (users, prev_cursor, next_cursor).
+
+    Keyset pagination: `after`/`before` are user ids from the previous
+    page, so every page costs the same however far the manager scrolls.
+    """
+    qs = DataUser.objects.all()
+    if role:
+        qs = qs.filter(type=role)
+    if status:
+        qs = qs.filter(status=status)
+
+    try:
+        before = int(before) if before else None
+        after = int(after) if after else None
+    except ValueError:
+        before = after = None
+
+    if before is not None:
+        users = list(qs.filter(id__lt=before).order_by('-id')[:limit + 1])
+        has_prev = len(users) > limit
+        users = users[:limit][::-1]
+        has_next = True
+    else:
+        page = qs.filter(id__gt=after) if after is not None else qs
+        users = list(page.order_by('id')[:limit + 1])
+        has_next = len(users) > limit
+        users = users[:limit]
+        has_prev = after is not None and qs.filter(id__lte=after).exists()
+
+    if not users:
+        return users, None, None
+    return users, users[0].id if has_prev else None, users[-1].id if has_next else None
+
+
 @require_POST
 def create_thread(request):
     """Create a new thread with the given `title` POST parameter and redirect to it.
@@ -1559,27 +1751,104 @@ def create_thread(request):
 
     t = Thread.objects.create(title=title, creation_date=timezone.now())
     # create an initial message indicating the thread was created
-    Message.objects.create(thread=t, message='Thread created', who=request.user, when=timezone.now())
+    msg = Message.objects.create(thread=t, message='Thread created', who=request.user, when=timezone.now())
+    realtime.publish_message(msg)
     return redirect('thread', thread_id=t.id)
 
 
+THREAD_PAGE_SIZE = 30
+
+
+def _thread_page(thread_id, before=None, after=None, limit=THREAD_PAGE_SIZE):
+    """One page of a thread's messages in chronological order.
+
+    Pages are keyed on (when, id): `before` returns the page just older
+    than that cursor, `after` the page just newer, and neither the latest
+    page. Returns (messages, older_cursor, newer_cursor, has_newer);
+    older_cursor is None once the first message is reached and
+    newer_cursor is the last shown message so clients can poll for more.
+    """
+    qs = Message.objects.filter(thread_id=thread_id).select_related('who')
+    older = newer = None
+    has_newer = False
+    if after:
+        position = decode_cursor(after, datetime)
+        if position is not None:
+            when, message_id = position
+            qs = qs.filter(Q(when__gt=when) | Q(when=when, id__gt=message_id))
+        page = list(qs.order_by('when', 'id')[:limit + 1])
+        has_newer = len(page) > limit
+        page = page[:limit]
+    else:
+        position = decode_cursor(before, datetime) if before else None
+        if position is not None:
+            when, message_id = position
+            qs = qs.filter(Q(when__lt=when) | Q(when=when, id__lt=message_id))
+        page = list(qs.order_by('-when', '-id')[:limit + 1])
+        has_older = len(page) > limit
+        page = page[:limit][::-1]
+        if has_older:
+            older = encode_cursor(page[0].when, page[0].id)
+
+    if page:
+        newer = encode_cursor(page[-1].when, page[-1].id)
+    else:
+        newer = after
+    return page, older, newer, has_newer
+
+
 def thread_view(request, thread_id):
-    t = get_object_or_404(Thread, pk=thread_id)
-    messages_qs = Message.objects.filter(thread=t).select_related('who').order_by('when')
+    """Show the latest page of a thread; older pages load on demand."""
+    first = Message.objects.filter(thread=OuterRef('pk')).order_by('when', 'id')
+    t = get_object_or_404(
+        Thread.objects.annotate(
+            starter_id=Subquery(first.values('who_id')[:1]),
+            starter_username=Subquery(first.values('who__username')[:1]),
+            starter_date=Subquery(first.values('when')[:1]),
+        ),
+        pk=thread_id,
+    )
 
-    # determine starter (earliest message author)
+    # starter (earliest message author) comes from the annotations above
     starter = None
-    starter_date = None
-    first_msg = messages_qs.first()
-    if first_msg:
-        starter = first_msg.who
-        starter_date = first_msg.when
+    if t.starter_id is not None:
+        starter = SimpleNamespace(id=t.starter_id, username=t.starter_username)
 
+    page, older_cursor, newer_cursor, _ = _thread_page(t.id, before=request.GET.get('before'))
     return render(request, 'thread.html', {
         'thread': t,
         'starter': starter,
-        'starter_date': starter_date,
-        'thread_messages': messages_qs,
+        'starter_date': t.starter_date,
+        'thread_messages': page,
+        'older_cursor': older_cursor,
+        'newer_cursor': newer_cursor,
+    })
+
+
+def thread_messages(request, thread_id):
+    """JSON page of a thread's messages for "load older/newer" requests.
+
+    GET params: `before` or `after` (cursors from a previous response) and
+    `limit` (max 100). Messages are always returned oldest first.
+    """
+    if not Thread.objects.filter(pk=thread_id).exists():
+        return JsonResponse({'error': 'Thread not found.'}, status=404)
+    try:
+        limit = max(1, min(100, int(request.GET.get('limit', THREAD_PAGE_SIZE))))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit.'}, status=400)
+
+    page, older, newer, more_newer = _thread_page(
+        thread_id,
+        before=request.GET.get('before') or None,
+        after=request.GET.get('after') or None,
+        limit=limit,
+    )
+    return JsonResponse({
+        'results': [realtime.message_payload(m) for m in page],
+        'older': older,
+        'newer': newer,
+        'has_newer': more_newer,
     })
 
 @require_POST
@@ -1785,12 +2054,13 @@ def reject_user(request, user_id):
 def faq(request):
     """FAQ page with search and inform functionality."""
     search_query = request.GET.get('q', '').strip()
+    after = request.GET.get('after') or None
     
-    # Always show all entries, or filter by search
+    # Show a page of the newest entries, or ranked search results
     if search_query:
-        all_entries = search_entries(search_query)
+        all_entries, next_cursor = rank_entries(search_query, after=after, min_overlap=OVERLAP_THRESHOLD)
     else:
-        all_entries = FAQEntry.objects.all()
+        all_entries, next_cursor = list_entries(after=after)
     
     duplicate_warning = None
     
@@ -1826,11 +2096,49 @@ def faq(request):
     return render(request, 'faq.html', {
         'search_query': search_query,
         'all_entries': all_entries,
+        'next_cursor': next_cursor,
+        'overlap_threshold': OVERLAP_THRESHOLD,
         'duplicate_warning': duplicate_warning,
         # Always pass the current query so AI can answer alongside results
         'initial_query': search_query,
     })
 
+def faq_search(request):
+    """JSON FAQ search used by the FAQ page's "load more" button.
+
+    GET params: `q` (optional), `after` (cursor from a previous page),
+    `limit` (max 100) and `min_overlap` (0-1). Without `q` the newest
+    entries are listed; with it entries are ranked by BM25 relevance.
+    """
+    query = request.GET.get('q', '').strip()
+    after = request.GET.get('after') or None
+    try:
+        limit = max(1, min(100, int(request.GET.get('limit', 20))))
+        min_overlap = max(0.0, min(1.0, float(request.GET.get('min_overlap', 0))))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit or min_overlap.'}, status=400)
+
+    if query:
+        entries, next_cursor = rank_entries(query, after=after, limit=limit, min_overlap=min_overlap)
+    else:
+        entries, next_cursor = list_entries(after=after, limit=limit)
+
+    return JsonResponse({
+        'results': [
+            {
+                'id': e.id,
+                'question': e.question,
+                'answer': e.answer,
+                'created_at': e.created_at.isoformat(),
+                'author': e.author.username if e.author else None,
+                'score': getattr(e, 'score', None),
+                'overlap': getattr(e, 'overlap', None),
+            }
+            for e in entries
+        ],
+        'next': next_cursor,
+    })
+
 @require_POST
 def report_faq(request):
     """Allow users to report an FAQ entry to managers."""
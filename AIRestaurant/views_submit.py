@@ -3,6 +3,7 @@ from django.contrib import messages
 from django.utils import timezone
 from .data.users import User as DataUser
 from .data.message import Message, Complaint, Compliment, Thread
+from . import realtime
 
 
 def _require_post(request, fallback='index'):
@@ -54,6 +55,7 @@ def submit_complaint(request):
     t = Thread.objects.create(title=thread_title[:100], creation_date=timezone.now())
 
     msg = Message.objects.create(thread=t, message=description, who=sender, when=timezone.now())
+    realtime.publish_message(msg)
     # Ensure new complaints start in 'pending' state using code 'p'
     Complaint.objects.create(sender=sender, to=target, message=msg, status='p')
     messages.success(request, 'Complaint submitted.')
@@ -89,6 +91,7 @@ def submit_compliment(request):
     t = Thread.objects.create(title=thread_title[:100], creation_date=timezone.now())
 
     msg = Message.objects.create(thread=t, message=description, who=sender, when=timezone.now())
+    realtime.publish_message(msg)
     Compliment.objects.create(sender=sender, to=target, message=msg)
     messages.success(request, 'Compliment submitted.')
 
@@ -122,5 +125,6 @@ def submit_message(request):
         messages.error(request, 'Thread not found.')
         return redirect('discussions')
 
-    Message.objects.create(thread=t, message=text, who=request.user, when=timezone.now())
+    msg = Message.objects.create(thread=t, message=text, who=request.user, when=timezone.now())
+    realtime.publish_message(msg)
     return redirect('thread', thread_id=t.id)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "AIRestaurant.settings")
 
 application = get_wsgi_application()
+
+# Imported after Django is set up
+from AIRestaurant import llm  # noqa: E402
+
+llm.preload()